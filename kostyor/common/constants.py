@@ -21,6 +21,7 @@ STATUSES = [READY_FOR_UPGRADE,
             UPGRADE_ERROR,
             UPGRADE_CANCELLED,
             UPGRADE_ROLLBACK,
+            UPGRADE_SUCCEED,
             NOT_READY_FOR_UPGRADE]
 
 UPGRADE_STATUSES = [UPGRADE_IN_PROGRESS,
@@ -29,3 +30,15 @@ UPGRADE_STATUSES = [UPGRADE_IN_PROGRESS,
                     UPGRADE_CANCELLED,
                     UPGRADE_ROLLBACK,
                     UPGRADE_SUCCEED]
+
+STEP_PENDING = 'PENDING'
+STEP_IN_PROGRESS = 'IN PROGRESS'
+STEP_SUCCEED = 'SUCCEED'
+STEP_FAILED = 'FAILED'
+STEP_CANCELLED = 'CANCELLED'
+
+STEP_STATUSES = [STEP_PENDING,
+                 STEP_IN_PROGRESS,
+                 STEP_SUCCEED,
+                 STEP_FAILED,
+                 STEP_CANCELLED]
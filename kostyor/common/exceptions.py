@@ -14,6 +14,14 @@ class ClusterNotFound(NotFound):
     """Cluster Not Found"""
 
 
+class HostNotFound(NotFound):
+    """Host Not Found"""
+
+
+class ServiceNotFound(NotFound):
+    """Service Not Found"""
+
+
 class ClusterVersionIsUnknown(BadRequest):
     """Operations is not allowed since cluster version is unknown."""
 
@@ -26,5 +34,33 @@ class UpgradeIsInProgress(BadRequest):
     """Upgrade operation is in progress."""
 
 
-class UpgradeNotFound(Exception):
+class UpgradeIsNotPaused(BadRequest):
+    """Only a paused upgrade can be continued."""
+
+
+class InvalidUpgradeParameter(BadRequest):
+    """Upgrade parameter has an invalid value."""
+
+
+class CyclicDependency(KostyorException):
+    """Upgrade steps cannot be ordered due to cyclic dependencies."""
+
+
+class InvalidScenario(KostyorException):
+    """Upgrade scenario is inconsistent."""
+
+
+class IncompleteDiscovery(KostyorException):
+    """Deployment has not been discovered completely."""
+
+
+class UpgradeNotFound(NotFound):
     """Upgrade not found in database"""
+
+
+class UpgradeStepNotFound(NotFound):
+    """Upgrade step not found in database"""
+
+
+class MarkerNotFound(BadRequest):
+    """Pagination marker not found."""
@@ -13,8 +13,101 @@ upgrade_group = cfg.OptGroup(name='upgrades',
 upgrade_driver = cfg.StrOpt('driver', default="noop")
 
 
+database_opts = [
+    cfg.IntOpt('max_pool_size',
+               min=1,
+               help=('A maximum number of connections to be kept open in '
+                     'the pool. Not used by SQLite.')),
+    cfg.IntOpt('max_overflow',
+               min=0,
+               help=('A number of connections to be opened beyond '
+                     'max_pool_size under load. Not used by SQLite.')),
+    cfg.IntOpt('pool_timeout',
+               min=1,
+               help=('Seconds to wait for a connection from the pool to be '
+                     'available. Not used by SQLite.')),
+    cfg.IntOpt('connection_recycle_time',
+               default=3600,
+               help=('Seconds after which a connection is reopened on '
+                     'checkout from the pool, so connections closed by the '
+                     'database server on idle are not used. Disabled if -1.')),
+    cfg.BoolOpt('pool_pre_ping',
+                default=True,
+                help=('Test a connection for liveness on checkout from the '
+                      'pool and reopen it transparently if it is dead.')),
+    cfg.IntOpt('statement_timeout',
+               min=0,
+               help=('Milliseconds a statement is allowed to run before it '
+                     'is aborted by the database server. Supported by '
+                     'PostgreSQL and MySQL only. No limit if not set.')),
+    cfg.IntOpt('connection_debug',
+               default=0,
+               min=0,
+               max=100,
+               help=('Verbosity of SQL debugging information: 0 is none, '
+                     '50 logs statements, 100 logs statements along with '
+                     'returned rows.')),
+    cfg.BoolOpt('sqlite_wal',
+                default=True,
+                help=('Use write-ahead logging for file-based SQLite '
+                      'databases, so readers do not block the writer and '
+                      'vice versa.')),
+    cfg.IntOpt('sqlite_busy_timeout',
+               default=30000,
+               min=0,
+               help=('Milliseconds a connection to SQLite database waits '
+                     'for a lock held by another connection to be released '
+                     'before "database is locked" error is raised.')),
+]
+
 CONF.register_group(database_group)
 CONF.register_opt(connection_opt, group=database_group)
+CONF.register_opts(database_opts, group=database_group)
+
+
+upgrade_opts = [
+    cfg.IntOpt('dispatch_window',
+               default=16,
+               min=1,
+               help=('A maximum number of upgrade steps to be sent to '
+                     'execution at once. Next steps are sent as the ones '
+                     'in flight complete, so the rest of the plan is kept '
+                     'in the database rather than in broker messages.')),
+    cfg.BoolOpt('pass_references',
+                default=False,
+                help=('Pass IDs of hosts and services to upgrade tasks '
+                      'instead of their attributes. Workers resolve IDs '
+                      'through a local cache, so broker messages and '
+                      'results stay small on large plans.')),
+    cfg.IntOpt('topology_cache_size',
+               default=10000,
+               min=0,
+               help=('A maximum number of hosts and services each worker '
+                     'process keeps cached in order to resolve references '
+                     'passed to tasks. Zero disables caching.')),
+]
+CONF.register_group(upgrade_group)
+CONF.register_opts(upgrade_opts, group=upgrade_group)
+
+
+api_group = cfg.OptGroup(name='api', title='REST API settings')
+api_opts = [
+    cfg.IntOpt('default_page_size',
+               default=100,
+               min=1,
+               help=('A number of items listed by API calls that return '
+                     'lists (e.g. clusters or upgrades) if no limit is '
+                     'passed.')),
+    cfg.IntOpt('max_page_size',
+               default=1000,
+               min=1,
+               help=('A maximum number of items an API call that returns a '
+                     'list is allowed to be asked for, so neither latency '
+                     'nor memory of the call depends on the number of rows '
+                     'in the database.')),
+]
+CONF.register_group(api_group)
+CONF.register_opts(api_opts, group=api_group)
 
 
 rpc_group = cfg.OptGroup(name='rpc', title='RPC settings')
@@ -28,19 +121,47 @@ rpc_opts = [
                help=('The backend to be used to store task results.')),
     cfg.StrOpt('celery_task_serializer',
                default='json',
-               help=('A default serialization method to be used.')),
+               help=('A default serialization method to be used. Either '
+                     '"json" or "msgpack"; the latter produces smaller '
+                     'messages and requires msgpack to be installed.')),
     cfg.StrOpt('celery_result_serializer',
                default='json',
-               help=('Result serialization format to be used.')),
+               help=('Result serialization format to be used. Either '
+                     '"json" or "msgpack".')),
     cfg.ListOpt('celery_accept_content',
                 default=['json'],
                 help=('A whitelist of serializers to be allowed. If a message '
                       'is received that is not in this list then the message '
-                      'will be discarded with an error.')),
+                      'will be discarded with an error. Keep "json" along '
+                      'with "msgpack" while switching serializers, so '
+                      'messages already sent are still accepted.')),
 ]
 CONF.register_group(rpc_group)
 CONF.register_opts(rpc_opts, group=rpc_group)
 
 
+execute_group = cfg.OptGroup(name='execute',
+                             title='Settings of processes executed by tasks')
+execute_opts = [
+    cfg.StrOpt('log_dir',
+               default='/tmp/kostyor/logs',
+               help=('A directory to spool the whole output of executed '
+                     'processes to, a file per task. No output is spooled '
+                     'if empty.')),
+    cfg.IntOpt('output_tail_lines',
+               default=100,
+               min=0,
+               help=('A number of last lines of output of an executed process '
+                     'to be kept in memory and returned as the task result.')),
+    cfg.IntOpt('concurrency',
+               default=16,
+               min=1,
+               help=('A number of processes to be executed at once by a task '
+                     'that runs a command across many hosts.')),
+]
+CONF.register_group(execute_group)
+CONF.register_opts(execute_opts, group=execute_group)
+
+
 def parse_args(args=[]):
     CONF(args)
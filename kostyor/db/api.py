@@ -1,9 +1,13 @@
+import collections
 import datetime
 import six
 
 from kostyor.common import constants, exceptions
+from kostyor.conf import CONF
 from kostyor.db import models
 
+from oslo_utils import uuidutils
+import sqlalchemy as sa
 from sqlalchemy import create_engine
 from sqlalchemy.orm import scoped_session, sessionmaker
 
@@ -13,7 +17,8 @@ db_session = scoped_session(sessionmaker(autocommit=False, autoflush=False))
 
 def _get_most_recent_upgrade_task(cluster_id):
     q = db_session.query(models.UpgradeTask).filter_by(
-        cluster_id=cluster_id).order_by(models.UpgradeTask.upgrade_start_time)
+        cluster_id=cluster_id).order_by(
+            models.UpgradeTask.upgrade_start_time.desc())
     return q.first()
 
 
@@ -28,8 +33,66 @@ def _get_cluster(cluster_id):
     return cluster
 
 
+def _set_sqlite_pragmas(conn, record):
+    cursor = conn.cursor()
+    cursor.execute('PRAGMA busy_timeout = %d'
+                   % CONF.database.sqlite_busy_timeout)
+    if CONF.database.sqlite_wal:
+        # In-memory databases silently stay in 'memory' journal mode.
+        cursor.execute('PRAGMA journal_mode = WAL')
+    cursor.close()
+
+
+def _set_statement_timeout(statement):
+    def _listener(conn, record):
+        cursor = conn.cursor()
+        cursor.execute(statement % CONF.database.statement_timeout)
+        cursor.close()
+    return _listener
+
+
+_STATEMENT_TIMEOUTS = {
+    'postgresql': 'SET statement_timeout = %d',
+    'mysql': 'SET SESSION max_execution_time = %d',
+}
+
+
 def configure_session(database):
-    engine = create_engine(database, convert_unicode=True)
+    url = sa.engine.url.make_url(database)
+    backend = url.get_backend_name()
+
+    kwargs = {
+        'convert_unicode': True,
+        'pool_recycle': CONF.database.connection_recycle_time,
+        'pool_pre_ping': CONF.database.pool_pre_ping,
+    }
+
+    if CONF.database.connection_debug >= 100:
+        kwargs['echo'] = 'debug'
+    elif CONF.database.connection_debug >= 50:
+        kwargs['echo'] = True
+
+    # SQLite doesn't use a queue pool of connections, so neither of these
+    # can be passed to it.
+    if backend != 'sqlite':
+        for option, kwarg in [('max_pool_size', 'pool_size'),
+                              ('max_overflow', 'max_overflow'),
+                              ('pool_timeout', 'pool_timeout')]:
+            if getattr(CONF.database, option) is not None:
+                kwargs[kwarg] = getattr(CONF.database, option)
+
+    engine = create_engine(url, **kwargs)
+
+    # Both API and workers share the same database, so with default settings
+    # SQLite fails with "database is locked" on concurrent writes right away.
+    if backend == 'sqlite':
+        sa.event.listen(engine, 'connect', _set_sqlite_pragmas)
+
+    if all([CONF.database.statement_timeout is not None,
+            backend in _STATEMENT_TIMEOUTS]):
+        sa.event.listen(engine, 'connect',
+                        _set_statement_timeout(_STATEMENT_TIMEOUTS[backend]))
+
     db_session.configure(bind=engine)
 
 
@@ -60,7 +123,8 @@ def get_upgrade_versions(cluster_id):
     return {'versions': constants.OPENSTACK_VERSIONS}
 
 
-def create_cluster_upgrade(cluster_id, to_version):
+def create_cluster_upgrade(cluster_id, to_version, driver=None,
+                           parameters=None):
     cluster = _get_cluster(cluster_id)
 
     if cluster.version == constants.UNKNOWN:
@@ -84,6 +148,9 @@ def create_cluster_upgrade(cluster_id, to_version):
     u_task.from_version = cluster.version
     u_task.to_version = to_version
     u_task.upgrade_start_time = datetime.datetime.now()
+    u_task.status = constants.UPGRADE_IN_PROGRESS
+    u_task.driver = driver
+    u_task.parameters = parameters
     db_session.add(u_task)
     db_session.commit()
     # TODO(sc68cal) RPC or calls to task broker to start upgrade
@@ -95,6 +162,14 @@ def cancel_cluster_upgrade(cluster_id):
     u_task = _get_most_recent_upgrade_task(cluster_id)
     u_task.upgrade_end_time = datetime.datetime.now()
     u_task.status = cluster.status = constants.UPGRADE_CANCELLED
+    db_session.query(models.UpgradeStep) \
+        .filter(models.UpgradeStep.upgrade_task_id == u_task.id) \
+        .filter(models.UpgradeStep.status.in_([
+            constants.STEP_PENDING,
+            constants.STEP_IN_PROGRESS,
+        ])) \
+        .update({'status': constants.STEP_CANCELLED},
+                synchronize_session=False)
     db_session.commit()
     # TODO(sc68cal) RPC or calls to task broker to cancel
     return {'id': cluster_id, 'status': constants.UPGRADE_CANCELLED}
@@ -127,18 +202,448 @@ def rollback_cluster_upgrade(cluster_id):
     return {'id': cluster_id, 'status': constants.UPGRADE_ROLLBACK}
 
 
-def get_clusters():
-    # TODO(ikalnitsky): implement pagination in params
-    return [cluster.to_dict() for cluster in db_session.query(models.Cluster)]
+def create_upgrade_steps(upgrade_id, plan):
+    """Persist a plan of a given upgrade as a set of steps.
+
+    :param upgrade_id: an upgrade the plan belongs to
+    :type upgrade_id: str
+
+    :param plan: a list of stages executed one by one; each stage is a list
+                 of lanes executed in parallel; each lane is a list of
+                 (service, hosts) steps executed one by one
+    :type plan: list
+
+    :returns: a list of created steps, each with its service and hosts
+    """
+    steps, records = [], []
+
+    for stage, lanes in enumerate(plan):
+        for lane, lanesteps in enumerate(lanes):
+            for position, (service, hosts) in enumerate(lanesteps):
+                step = {
+                    'id': uuidutils.generate_uuid(),
+                    'upgrade_task_id': upgrade_id,
+                    'service_id': service['id'] if service else None,
+                    'stage': stage,
+                    'lane': lane,
+                    'position': position,
+                    'status': constants.STEP_PENDING,
+                    'task_ids': None,
+                }
+                steps.append(step)
+                records.extend(
+                    {'step_id': step['id'], 'host_id': host['id']}
+                    for host in hosts)
+
+    # Plans of large clusters consist of thousands of steps, so they are
+    # inserted in bulk rather than through unit of work.
+    db_session.bulk_insert_mappings(models.UpgradeStep, steps)
+    if records:
+        db_session.execute(models.upgrade_steps_hosts.insert(), records)
+    db_session.commit()
+
+    # Return steps in the same shape as get_upgrade_steps() does, keeping
+    # services and hosts that have been passed.
+    steps = iter(steps)
+    return [
+        dict(next(steps), service=service, hosts=hosts)
+        for lanes in plan
+        for lanesteps in lanes
+        for service, hosts in lanesteps
+    ]
+
+
+def get_upgrade_steps(upgrade_id, statuses=None, step_ids=None):
+    """Get steps of a given upgrade along with their services and hosts.
+
+    :param upgrade_id: an upgrade to get steps of
+    :type upgrade_id: str
+
+    :param statuses: if passed, only steps with these statuses are returned
+    :type statuses: list
+
+    :param step_ids: if passed, only steps with these IDs are returned
+    :type step_ids: list
+
+    :returns: a list of steps ordered by stage, lane and position
+    """
+    query = db_session.query(models.UpgradeStep, models.Service) \
+        .outerjoin(models.Service) \
+        .filter(models.UpgradeStep.upgrade_task_id == upgrade_id) \
+        .order_by(models.UpgradeStep.stage,
+                  models.UpgradeStep.lane,
+                  models.UpgradeStep.position)
+
+    if statuses is not None:
+        query = query.filter(models.UpgradeStep.status.in_(statuses))
+
+    if step_ids is not None:
+        query = query.filter(models.UpgradeStep.id.in_(step_ids))
+
+    steps = collections.OrderedDict(
+        (step.id, dict(step.to_dict(),
+                       service=service.to_dict() if service else None,
+                       hosts=[]))
+        for step, service in query
+    )
+
+    query = db_session.query(models.upgrade_steps_hosts.c.step_id,
+                             models.Host) \
+        .join(models.Host) \
+        .join(models.UpgradeStep) \
+        .filter(models.UpgradeStep.upgrade_task_id == upgrade_id) \
+        .order_by(models.Host.hostname)
+
+    # Hosts of a few steps are fetched way more often than hosts of the
+    # whole plan, e.g. each time next steps are sent to execution.
+    if step_ids is not None:
+        query = query.filter(
+            models.upgrade_steps_hosts.c.step_id.in_(step_ids))
+
+    for step_id, host in query:
+        if step_id in steps:
+            steps[step_id]['hosts'].append(host.to_dict())
+
+    return list(steps.values())
+
+
+def claim_upgrade_steps(upgrade_id, window, coalesce=False):
+    """Mark next steps of a given upgrade ready to be executed as in progress.
+
+    Steps are executed stage by stage, and within a stage steps of each
+    lane are executed one by one. So only the first unfinished step of each
+    lane of the first unfinished stage is ready to be executed, provided
+    there are less than ``window`` steps in progress already.
+
+    Steps are claimed by workers as other steps complete, so the upgrade is
+    locked in order to avoid sending the same step to execution twice. Some
+    backends (e.g. SQLite) ignore the lock, so a step is claimed only if
+    it's still pending, and only steps actually claimed are returned.
+
+    Once there are no unfinished steps left, the upgrade and its cluster
+    are marked as succeed, and the cluster is considered running the
+    version it has been upgraded to.
+
+    :param upgrade_id: an upgrade to claim steps of
+    :type upgrade_id: str
+
+    :param window: a maximum number of lanes in progress at once
+    :type window: int
+
+    :param coalesce: if True, pending steps that follow a ready one in its
+                     lane and run on the same hosts are claimed along, so
+                     they can be executed at one go
+    :type coalesce: bool
+
+    :returns: a list of claimed steps, each with its service and hosts,
+              ordered by stage, lane and position
+    """
+    status, = db_session.query(models.UpgradeTask.status) \
+        .filter_by(id=upgrade_id) \
+        .with_for_update() \
+        .one()
+
+    # The upgrade may have been paused or cancelled since its steps were
+    # completed, and then no more steps are to be sent.
+    if status != constants.UPGRADE_IN_PROGRESS:
+        db_session.commit()
+        return []
+
+    # Failed steps are unfinished ones that block their lanes, so the upgrade
+    # halts once other lanes of the stage complete.
+    query = db_session.query(models.UpgradeStep.id,
+                             models.UpgradeStep.stage,
+                             models.UpgradeStep.lane,
+                             models.UpgradeStep.status) \
+        .filter(models.UpgradeStep.upgrade_task_id == upgrade_id) \
+        .filter(models.UpgradeStep.status.in_([
+            constants.STEP_PENDING,
+            constants.STEP_IN_PROGRESS,
+            constants.STEP_FAILED,
+        ])) \
+        .order_by(models.UpgradeStep.stage,
+                  models.UpgradeStep.lane,
+                  models.UpgradeStep.position)
+
+    ready, inprogress, lanes, closed, stage = [], 0, {}, set(), None
+    for step_id, step_stage, lane, status in query:
+        if stage is None:
+            stage = step_stage
+        if step_stage != stage:
+            break
+
+        if lane not in lanes:
+            lanes[lane] = []
+            if status == constants.STEP_PENDING:
+                ready.append(lane)
+            elif status == constants.STEP_IN_PROGRESS:
+                inprogress += 1
+
+        # Only consecutive pending steps may be coalesced with the first
+        # one of the lane.
+        if status != constants.STEP_PENDING:
+            closed.add(lane)
+        if lane not in closed:
+            lanes[lane].append(step_id)
+
+    # Nothing is left to be executed, so the upgrade is done.
+    if stage is None:
+        _complete_upgrade(upgrade_id)
+        return []
+
+    runs = [lanes[lane] for lane in ready[:max(window - inprogress, 0)]]
+    if coalesce:
+        runs = _coalesce_steps(runs)
+    else:
+        runs = [run[:1] for run in runs]
+
+    ready = []
+    for run in runs:
+        for step_id in run:
+            claimed = db_session.query(models.UpgradeStep) \
+                .filter_by(id=step_id, status=constants.STEP_PENDING) \
+                .update({'status': constants.STEP_IN_PROGRESS},
+                        synchronize_session=False)
+
+            # The rest of the run is left to whoever has claimed the step.
+            if not claimed:
+                break
+            ready.append(step_id)
+    db_session.commit()
+
+    if not ready:
+        return []
+    return get_upgrade_steps(upgrade_id, step_ids=ready)
+
+
+def _complete_upgrade(upgrade_id):
+    u_task = db_session.query(models.UpgradeTask).get(upgrade_id)
+    cluster = _get_cluster(u_task.cluster_id)
+
+    u_task.upgrade_end_time = datetime.datetime.now()
+    u_task.status = cluster.status = constants.UPGRADE_SUCCEED
+    cluster.version = u_task.to_version
+    db_session.commit()
+
+
+def _coalesce_steps(runs):
+    # Steps are coalesced with the first one of their run as long as they
+    # are executed on the same hosts.
+    query = db_session.query(models.upgrade_steps_hosts).filter(
+        models.upgrade_steps_hosts.c.step_id.in_([
+            step_id for run in runs for step_id in run[1:]
+        ] + [run[0] for run in runs if len(run) > 1]))
+
+    hosts = collections.defaultdict(set)
+    for record in query:
+        hosts[record.step_id].add(record.host_id)
+
+    coalesced = []
+    for run in runs:
+        count = 1
+        while count < len(run) and hosts[run[count]] == hosts[run[0]]:
+            count += 1
+        coalesced.append(run[:count])
+    return coalesced
+
+
+def reset_upgrade_steps(upgrade_id, active=None):
+    """Mark unfinished steps of a given upgrade as pending once again.
+
+    :param upgrade_id: an upgrade to reset steps of
+    :type upgrade_id: str
+
+    :param active: steps in progress whose tasks are still being executed,
+                   so they are left in progress rather than executed again
+    :type active: list
+    """
+    query = db_session.query(models.UpgradeStep) \
+        .filter(models.UpgradeStep.upgrade_task_id == upgrade_id) \
+        .filter(models.UpgradeStep.status.in_([
+            constants.STEP_IN_PROGRESS,
+            constants.STEP_FAILED,
+        ]))
+    if active:
+        query = query.filter(~models.UpgradeStep.id.in_(active))
+    query.update({'status': constants.STEP_PENDING, 'task_ids': None},
+                 synchronize_session=False)
+    db_session.commit()
+
+
+def set_upgrade_task_ids(steps):
+    """Record IDs of Celery tasks given upgrade steps are executed by.
+
+    :param steps: a mapping of step IDs to IDs of their tasks
+    :type steps: dict
+    """
+    db_session.bulk_update_mappings(models.UpgradeStep, [
+        {'id': step_id, 'task_ids': task_ids}
+        for step_id, task_ids in steps.items()
+    ])
+    db_session.commit()
+
+
+def complete_upgrade_steps(step_ids):
+    """Mark given steps of the same upgrade as succeed.
+
+    :param step_ids: steps to be marked
+    :type step_ids: list
+
+    :returns: an upgrade the steps belong to
+    :raises UpgradeStepNotFound: if none of the steps exist
+    """
+    steps = db_session.query(models.UpgradeStep) \
+        .filter(models.UpgradeStep.id.in_(step_ids)) \
+        .all()
+
+    if not steps:
+        raise exceptions.UpgradeStepNotFound(
+            'Upgrade steps (ID=%s) not found.' % ', '.join(step_ids))
+
+    for step in steps:
+        step.status = constants.STEP_SUCCEED
+    upgrade = db_session.query(models.UpgradeTask).get(
+        steps[0].upgrade_task_id)
+    db_session.commit()
+    return upgrade.to_dict()
+
+
+def fail_upgrade_steps(step_ids):
+    """Mark given steps of the same upgrade as failed.
+
+    Only steps in progress are marked, so steps that have been cancelled
+    meanwhile are kept as is.
+
+    :param step_ids: steps to be marked
+    :type step_ids: list
+
+    :returns: an upgrade the steps belong to
+    :raises UpgradeStepNotFound: if none of the steps exist
+    """
+    steps = db_session.query(models.UpgradeStep) \
+        .filter(models.UpgradeStep.id.in_(step_ids)) \
+        .all()
+
+    if not steps:
+        raise exceptions.UpgradeStepNotFound(
+            'Upgrade steps (ID=%s) not found.' % ', '.join(step_ids))
+
+    for step in steps:
+        if step.status == constants.STEP_IN_PROGRESS:
+            step.status = constants.STEP_FAILED
+    upgrade = db_session.query(models.UpgradeTask).get(
+        steps[0].upgrade_task_id)
+    db_session.commit()
+    return upgrade.to_dict()
+
+
+def _paginate(query, model, sort_keys, limit=None, marker=None):
+    """Apply keyset pagination to a given query.
+
+    Rows are sorted by given keys in ascending order, and the page starts
+    right after the marker row. Unlike offset, it doesn't require to scan
+    all preceding rows, so any page is fetched in constant time.
+
+    :param query: a query to paginate
+    :param model: a model the query is made against
+    :param sort_keys: attributes to sort by; the last one must be unique
+    :param limit: a maximum number of rows on the page
+    :param marker: an ID of the last row of the previous page
+    :returns: a paginated query
+    """
+    columns = [getattr(model, key) for key in sort_keys]
+
+    if marker is not None:
+        values = db_session.query(*columns).filter(model.id == marker).first()
+
+        if values is None:
+            raise exceptions.MarkerNotFound(
+                'Marker (ID="%s") not found.' % marker)
+
+        # Rows after the marker are ones with greater sort keys, i.e.
+        # (a, b) > (x, y) is a > x OR (a = x AND b > y) and so on.
+        query = query.filter(sa.or_(*[
+            sa.and_(*[
+                column == value
+                for column, value in zip(columns[:i], values[:i])
+            ] + [columns[i] > values[i]])
+            for i in range(len(columns))
+        ]))
+
+    query = query.order_by(*columns)
+
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+def _getrows(model, *criteria):
+    # Querying columns instead of a model doesn't involve ORM machinery,
+    # such as identity map, which is significantly faster for long lists.
+    return db_session.query(*model.__table__.columns).filter(*criteria)
+
 
+def get_clusters(limit=None, marker=None, status=None, version=None):
+    """Get clusters ordered by ID.
 
-def get_upgrades(cluster_id=None):
-    query = db_session.query(models.UpgradeTask)
+    :param limit: a maximum number of clusters to return
+    :param marker: an ID of the cluster to start after
+    :param status: return clusters in the given status only
+    :param version: return clusters of the given version only
+    :returns: a list of clusters
+    """
+    criteria = []
+
+    if status is not None:
+        criteria.append(models.Cluster.status == status)
+
+    if version is not None:
+        criteria.append(models.Cluster.version == version)
+
+    query = _paginate(_getrows(models.Cluster, *criteria),
+                      models.Cluster, ['id'], limit, marker)
+    return [row._asdict() for row in query]
+
+
+def get_upgrades(cluster_id=None, limit=None, marker=None, status=None,
+                 from_version=None, to_version=None, started_after=None,
+                 started_before=None):
+    """Get upgrades ordered by start time.
+
+    :param cluster_id: return upgrades of the given cluster only
+    :param limit: a maximum number of upgrades to return
+    :param marker: an ID of the upgrade to start after
+    :param status: return upgrades in the given status only
+    :param from_version: return upgrades from the given version only
+    :param to_version: return upgrades to the given version only
+    :param started_after: return upgrades started after the given time only
+    :param started_before: return upgrades started before the given time only
+    :returns: a list of upgrades
+    """
+    criteria = []
 
     if cluster_id is not None:
-        query = query.filter_by(cluster_id=cluster_id)
+        criteria.append(models.UpgradeTask.cluster_id == cluster_id)
+
+    if status is not None:
+        criteria.append(models.UpgradeTask.status == status)
+
+    if from_version is not None:
+        criteria.append(models.UpgradeTask.from_version == from_version)
+
+    if to_version is not None:
+        criteria.append(models.UpgradeTask.to_version == to_version)
 
-    return [upgrade.to_dict() for upgrade in query]
+    if started_after is not None:
+        criteria.append(models.UpgradeTask.upgrade_start_time > started_after)
+
+    if started_before is not None:
+        criteria.append(models.UpgradeTask.upgrade_start_time < started_before)
+
+    query = _paginate(_getrows(models.UpgradeTask, *criteria),
+                      models.UpgradeTask, ['upgrade_start_time', 'id'],
+                      limit, marker)
+    return [row._asdict() for row in query]
 
 
 def create_host(name, cluster_id):
@@ -171,6 +676,23 @@ def get_host(host_id):
     return db_session.query(models.Host).get(host_id).to_dict()
 
 
+def get_hosts(host_ids):
+    """Get hosts with given IDs at one go.
+
+    :param host_ids: hosts to get
+    :type host_ids: list
+
+    :returns: a list of hosts in no particular order; unknown IDs are
+              skipped
+    """
+    if not host_ids:
+        return []
+
+    query = db_session.query(models.Host) \
+        .filter(models.Host.id.in_(set(host_ids)))
+    return [host.to_dict() for host in query]
+
+
 def create_service(name, host_id, version):
     # TODO: get rid of `host_id` parameter as it's not always present
     host = db_session.query(models.Host).get(host_id)
@@ -184,6 +706,23 @@ def create_service(name, host_id, version):
     return new_service.to_dict()
 
 
+def get_services(service_ids):
+    """Get services with given IDs at one go.
+
+    :param service_ids: services to get
+    :type service_ids: list
+
+    :returns: a list of services in no particular order; unknown IDs are
+              skipped
+    """
+    if not service_ids:
+        return []
+
+    query = db_session.query(models.Service) \
+        .filter(models.Service.id.in_(set(service_ids)))
+    return [service.to_dict() for service in query]
+
+
 def get_service_with_hosts(name, cluster_id):
     service = db_session.query(models.Service) \
         .join(models.hosts_services) \
@@ -198,10 +737,84 @@ def get_service_with_hosts(name, cluster_id):
     return service.to_dict(), [host.to_dict() for host in service.hosts]
 
 
+def get_services_with_hosts(cluster_id):
+    """Get all services of a given cluster along with their hosts.
+
+    Services are fetched in one query regardless of their number. Please
+    note, the same service may be represented by separate rows on various
+    hosts, that's why each name maps to a list of services.
+
+    :param cluster_id: a cluster to get services of
+    :type cluster_id: str
+
+    :returns: a mapping of service names to lists of (service, hosts) pairs
+    """
+    query = db_session.query(models.Service, models.Host) \
+        .join(models.Service.hosts) \
+        .filter(models.Host.cluster_id == cluster_id) \
+        .order_by(models.Service.id, models.Host.hostname)
+
+    services = collections.OrderedDict()
+    for service, host in query:
+        if service.id not in services:
+            services[service.id] = (service.to_dict(), [])
+        services[service.id][1].append(host.to_dict())
+
+    grouped = collections.defaultdict(list)
+    for service, hosts in services.values():
+        grouped[service['name']].append((service, hosts))
+    return dict(grouped)
+
+
+def get_services_by_cluster(cluster_id):
+    """Get distinct services of a given cluster along with their hosts.
+
+    Services are fetched in a fixed number of queries regardless of the
+    number of hosts, unlike calling :func:`get_services_by_host` per host.
+
+    :param cluster_id: a cluster to get services of
+    :type cluster_id: str
+
+    :returns: a list of services ordered by name, each one has a list of
+              its host IDs
+    :raises ClusterNotFound: if there's no cluster with a given ID
+    """
+    cluster = _get_cluster(cluster_id)
+
+    # A row per service per host is returned, so the service columns are
+    # repeated. Still, it's way cheaper than a query per host.
+    query = db_session.query(models.Service.id,
+                             models.Service.name,
+                             models.Service.version,
+                             models.Host.id) \
+        .select_from(models.Service) \
+        .join(models.hosts_services) \
+        .join(models.Host) \
+        .filter(models.Host.cluster_id == cluster.id) \
+        .order_by(models.Service.name,
+                  models.Service.id,
+                  models.Host.hostname)
+
+    services = collections.OrderedDict()
+    for service_id, name, version, host_id in query:
+        if service_id not in services:
+            services[service_id] = {
+                'id': service_id,
+                'name': name,
+                'version': version,
+                'hosts': [],
+            }
+        services[service_id]['hosts'].append(host_id)
+
+    return list(services.values())
+
+
 def get_services_by_host(host_id):
-    query = db_session.query(models.Service).filter(
-        models.Service.hosts.any(id=host_id)
-    )
+    # Unlike 'Service.hosts.any()', the join doesn't require to check each
+    # service whether it's on the host, so the lookup is done by index.
+    query = db_session.query(models.Service) \
+        .join(models.hosts_services) \
+        .filter(models.hosts_services.c.host_id == host_id)
     services = {service.id: service.to_dict() for service in query}
 
     query = db_session.query(models.hosts_services).filter(
@@ -214,6 +827,47 @@ def get_services_by_host(host_id):
     return list(services.values())
 
 
+def get_cluster_topology(cluster_id):
+    """Get hosts and services of a given cluster at one go.
+
+    Unlike combination of :func:`get_hosts_by_cluster` and
+    :func:`get_services_by_host`, this one fetches the whole topology in
+    a fixed number of queries regardless of cluster size, so it's the
+    right choice to plan upgrades of large clusters.
+
+    :param cluster_id: a cluster to get topology of
+    :type cluster_id: str
+
+    :returns: a tuple of (hosts, services), where each host has a list of
+              its service IDs and each service has a list of its host IDs
+    :raises ClusterNotFound: if there's no cluster with a given ID
+    """
+    cluster = _get_cluster(cluster_id)
+
+    query = db_session.query(models.Host).filter_by(cluster_id=cluster.id)
+    hosts = collections.OrderedDict(
+        (host.id, dict(host.to_dict(), services=[])) for host in query
+    )
+
+    query = db_session.query(models.Service) \
+        .join(models.hosts_services) \
+        .join(models.Host) \
+        .filter(models.Host.cluster_id == cluster.id) \
+        .distinct()
+    services = collections.OrderedDict(
+        (service.id, dict(service.to_dict(), hosts=[])) for service in query
+    )
+
+    query = db_session.query(models.hosts_services) \
+        .join(models.Host) \
+        .filter(models.Host.cluster_id == cluster.id)
+    for record in query:
+        hosts[record.host_id]['services'].append(record.service_id)
+        services[record.service_id]['hosts'].append(record.host_id)
+
+    return list(hosts.values()), list(services.values())
+
+
 def create_cluster(name, version, status):
     kwargs = {"name": name, "version": version, "status": status}
     cluster = models.Cluster(**kwargs)
@@ -229,33 +883,210 @@ def update_cluster(cluster_id, **kwargs):
     db_session.commit()
 
 
+def _check_discovery_errors(info, message):
+    # Discovery results that have 'errors' key are partial, so they would
+    # be stored as a cluster some services are missing in.
+    errors = info.get('errors')
+    if errors:
+        raise exceptions.IncompleteDiscovery(
+            '%s since some services have not been discovered: %s' % (
+                message, ', '.join(
+                    '%s (%s)' % error for error in sorted(errors.items()))))
+
+
 def discover_cluster(name, info):
     """Create a cluster instance based on discovered information.
 
+    Discovered deployments may consist of thousands of hosts, so rows are
+    computed up front and inserted in bulk, a statement per table, within
+    one transaction.
+
+    Discovery results that have 'errors' key are partial, so they are
+    refused rather than stored as a complete cluster.
+
     :param name: a cluster name to be used
     :type name: str
 
     :param info: discovered information about the deployment
     :type info: dict
+
+    :raises IncompleteDiscovery: if the deployment has been discovered
+                                 partially
     """
-    cluster = create_cluster(
-        name,
-        info.get('version', constants.UNKNOWN),
-        info.get('status', constants.NOT_READY_FOR_UPGRADE)
-    )
+    _check_discovery_errors(info, 'Cluster "%s" cannot be discovered' % name)
+
+    cluster = {
+        'id': uuidutils.generate_uuid(),
+        'name': name,
+        'version': info.get('version', constants.UNKNOWN),
+        'status': info.get('status', constants.NOT_READY_FOR_UPGRADE),
+    }
+
+    hosts = []
+    services = collections.OrderedDict()
+    hosts_services = []
+
+    for hostname, host_services in info.get('hosts', {}).items():
+        host = {
+            'id': uuidutils.generate_uuid(),
+            'hostname': hostname,
+            'cluster_id': cluster['id'],
+        }
+        hosts.append(host)
+
+        for service in host_services:
+            if service['name'] not in services:
+                services[service['name']] = {
+                    'id': uuidutils.generate_uuid(),
+                    'name': service['name'],
+                    'version': service.get('version'),
+                }
+            hosts_services.append({
+                'host_id': host['id'],
+                'service_id': services[service['name']]['id'],
+            })
+
+    _execute_in_bulk([
+        (models.Cluster.__table__.insert(), [cluster]),
+        (models.Host.__table__.insert(), hosts),
+        (models.Service.__table__.insert(), list(services.values())),
+        (models.hosts_services.insert(), hosts_services),
+    ])
 
-    objects = []
-    cache = {}
+    return cluster
 
-    for hostname, services in info.get('hosts', {}).items():
-        host = models.Host(hostname=hostname, cluster_id=cluster['id'])
 
-        for service in services:
-            if service['name'] not in cache:
-                cache[service['name']] = models.Service(name=service['name'])
-            host.services.append(cache[service['name']])
-        objects.append(host)
+def rediscover_cluster(cluster_id, info):
+    """Update a cluster instance based on rediscovered information.
 
-    db_session.add_all(objects)
-    db_session.commit()
-    return cluster
+    Stored topology is compared against discovered one, and only the
+    difference is applied: hosts that have appeared or gone, services that
+    have been moved between hosts and versions that have been changed. So
+    the cost of refreshing depends on churn rather than on cluster size.
+
+    Hosts that have gone are detached from the cluster rather than deleted,
+    since steps of past upgrades may refer to them.
+
+    Discovery results that have 'errors' key are partial, and services of
+    failed probes would look gone, so they are refused rather than applied.
+
+    :param cluster_id: a cluster to be updated
+    :type cluster_id: str
+
+    :param info: discovered information about the deployment
+    :type info: dict
+
+    :raises ClusterNotFound: if there's no cluster with a given ID
+    :raises UpgradeIsInProgress: if the cluster is being upgraded
+    :raises IncompleteDiscovery: if the deployment has been discovered
+                                 partially
+    """
+    cluster = _get_cluster(cluster_id)
+
+    upgrade = _get_most_recent_upgrade_task(cluster_id)
+    if upgrade and upgrade.status == constants.UPGRADE_IN_PROGRESS:
+        raise exceptions.UpgradeIsInProgress(
+            'Cluster %s cannot be rediscovered while it is being upgraded.'
+            % cluster_id)
+
+    _check_discovery_errors(info, 'Cluster %s cannot be rediscovered'
+                                  % cluster_id)
+
+    hosts = dict(
+        db_session.query(models.Host.hostname, models.Host.id)
+        .filter(models.Host.cluster_id == cluster_id))
+
+    services, links = {}, {}
+    query = db_session.query(models.hosts_services.c.host_id,
+                             models.hosts_services.c.service_id,
+                             models.Service.name,
+                             models.Service.version) \
+        .join(models.Service) \
+        .join(models.Host) \
+        .filter(models.Host.cluster_id == cluster_id)
+    for host_id, service_id, name, version in query:
+        services.setdefault(name, {'id': service_id, 'version': version})
+        links[(host_id, name)] = service_id
+
+    new_hosts, new_services, new_links, versions = [], {}, set(), {}
+
+    for hostname, host_services in info.get('hosts', {}).items():
+        if hostname not in hosts:
+            hosts[hostname] = uuidutils.generate_uuid()
+            new_hosts.append({
+                'id': hosts[hostname],
+                'hostname': hostname,
+                'cluster_id': cluster_id,
+            })
+
+        for service in host_services:
+            name = service['name']
+            if name not in services:
+                services[name] = {'id': uuidutils.generate_uuid(),
+                                  'version': service.get('version')}
+                new_services[name] = {'id': services[name]['id'],
+                                      'name': name,
+                                      'version': services[name]['version']}
+            elif service.get('version') not in (None,
+                                                services[name]['version']):
+                versions[services[name]['id']] = service['version']
+            new_links.add((hosts[hostname], name))
+
+    gone_hosts = set(hosts) - set(info.get('hosts', {}))
+
+    clusters = []
+    version = info.get('version', cluster.version)
+    status = info.get('status', cluster.status)
+    if (version, status) != (cluster.version, cluster.status):
+        clusters.append({'b_version': version, 'b_status': status})
+
+    hosts_services = models.hosts_services
+    host_id = sa.bindparam('b_host_id')
+    service_id = sa.bindparam('b_service_id')
+
+    _execute_in_bulk([
+        (models.Host.__table__.insert(), new_hosts),
+        (models.Service.__table__.insert(), list(new_services.values())),
+        (hosts_services.insert(), [
+            {'host_id': link[0], 'service_id': services[link[1]]['id']}
+            for link in new_links - set(links)
+        ]),
+        (hosts_services.delete().where(sa.and_(
+            hosts_services.c.host_id == host_id,
+            hosts_services.c.service_id == service_id,
+        )), [
+            {'b_host_id': link[0], 'b_service_id': links[link]}
+            for link in set(links) - new_links
+        ]),
+        (models.Host.__table__.update()
+         .where(models.Host.id == host_id)
+         .values(cluster_id=None), [
+            {'b_host_id': hosts[hostname]} for hostname in gone_hosts
+        ]),
+        (models.Service.__table__.update()
+         .where(models.Service.id == service_id)
+         .values(version=sa.bindparam('b_version')), [
+            {'b_service_id': id_, 'b_version': version}
+            for id_, version in versions.items()
+        ]),
+        (models.Cluster.__table__.update()
+         .where(models.Cluster.id == cluster_id)
+         .values(version=sa.bindparam('b_version'),
+                 status=sa.bindparam('b_status')), clusters),
+    ])
+
+    return get_cluster(cluster_id)
+
+
+def _execute_in_bulk(statements):
+    # Each statement is executed once for all rows, and all of them within
+    # one transaction, so there's nothing partially applied on failure.
+    try:
+        for statement, rows in statements:
+            # Executing a statement with no rows fails on some backends.
+            if rows:
+                db_session.execute(statement, rows)
+        db_session.commit()
+    except Exception:
+        db_session.rollback()
+        raise
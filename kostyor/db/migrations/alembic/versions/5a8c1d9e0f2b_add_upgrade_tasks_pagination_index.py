@@ -0,0 +1,26 @@
+"""Add upgrade tasks pagination index
+
+Revision ID: 5a8c1d9e0f2b
+Revises: c2f1e0a7d3b4
+Create Date: 2026-10-18 17:02:44.107331
+
+"""
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '5a8c1d9e0f2b'
+down_revision = 'c2f1e0a7d3b4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_upgrade_tasks_upgrade_start_time_id',
+                    'upgrade_tasks', ['upgrade_start_time', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_upgrade_tasks_upgrade_start_time_id',
+                  table_name='upgrade_tasks')
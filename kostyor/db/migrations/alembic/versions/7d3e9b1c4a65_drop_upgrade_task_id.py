@@ -0,0 +1,29 @@
+"""Drop upgrade task id
+
+Revision ID: 7d3e9b1c4a65
+Revises: e4b7a2c96d18
+Create Date: 2026-10-18 19:05:42.318207
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d3e9b1c4a65'
+down_revision = 'e4b7a2c96d18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Steps are sent to execution a few at a time, so there's no single
+    # task of the whole upgrade anymore.
+    with op.batch_alter_table('upgrade_tasks') as batch_op:
+        batch_op.drop_column('task_id')
+
+
+def downgrade():
+    with op.batch_alter_table('upgrade_tasks') as batch_op:
+        batch_op.add_column(sa.Column('task_id', sa.String(36)))
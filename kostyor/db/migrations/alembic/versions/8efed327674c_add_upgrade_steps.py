@@ -0,0 +1,54 @@
+"""Add upgrade steps
+
+Revision ID: 8efed327674c
+Revises: 232c38fec944
+Create Date: 2026-10-18 10:12:41.310128
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+from kostyor.common import constants
+
+
+# revision identifiers, used by Alembic.
+revision = '8efed327674c'
+down_revision = '232c38fec944'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('upgrade_tasks') as batch_op:
+        batch_op.add_column(sa.Column('driver', sa.String(255)))
+        batch_op.add_column(sa.Column('parameters', sa.JSON))
+
+    op.create_table(
+        'upgrade_steps',
+        sa.Column('id', sa.String(36), nullable=False),
+        sa.Column('upgrade_task_id', sa.String(36),
+                  sa.ForeignKey('upgrade_tasks.id')),
+        sa.Column('service_id', sa.String(36),
+                  sa.ForeignKey('services.id'), nullable=True),
+        sa.Column('stage', sa.Integer),
+        sa.Column('lane', sa.Integer),
+        sa.Column('position', sa.Integer),
+        sa.Column('status', sa.Enum(*constants.STEP_STATUSES)),
+        sa.PrimaryKeyConstraint('id'))
+
+    op.create_table(
+        'upgrade_steps_hosts',
+        sa.Column('step_id', sa.String(36),
+                  sa.ForeignKey('upgrade_steps.id')),
+        sa.Column('host_id', sa.String(36), sa.ForeignKey('hosts.id')),
+        sa.UniqueConstraint('step_id', 'host_id'))
+
+
+def downgrade():
+    op.drop_table('upgrade_steps_hosts')
+    op.drop_table('upgrade_steps')
+
+    with op.batch_alter_table('upgrade_tasks') as batch_op:
+        batch_op.drop_column('parameters')
+        batch_op.drop_column('driver')
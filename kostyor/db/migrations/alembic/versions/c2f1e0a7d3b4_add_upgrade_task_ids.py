@@ -0,0 +1,33 @@
+"""Add upgrade task ids
+
+Revision ID: c2f1e0a7d3b4
+Revises: 8efed327674c
+Create Date: 2026-10-18 15:21:07.524918
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2f1e0a7d3b4'
+down_revision = '8efed327674c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('upgrade_tasks') as batch_op:
+        batch_op.add_column(sa.Column('task_id', sa.String(36)))
+
+    with op.batch_alter_table('upgrade_steps') as batch_op:
+        batch_op.add_column(sa.Column('task_ids', sa.JSON))
+
+
+def downgrade():
+    with op.batch_alter_table('upgrade_steps') as batch_op:
+        batch_op.drop_column('task_ids')
+
+    with op.batch_alter_table('upgrade_tasks') as batch_op:
+        batch_op.drop_column('task_id')
@@ -0,0 +1,40 @@
+"""Add lookup indexes
+
+Revision ID: e4b7a2c96d18
+Revises: 5a8c1d9e0f2b
+Create Date: 2026-10-18 17:48:19.662040
+
+"""
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4b7a2c96d18'
+down_revision = '5a8c1d9e0f2b'
+branch_labels = None
+depends_on = None
+
+
+_INDEXES = [
+    ('ix_hosts_cluster_id_hostname',
+     'hosts', ['cluster_id', 'hostname']),
+    ('ix_services_name',
+     'services', ['name']),
+    ('ix_hosts_services_service_id_host_id',
+     'hosts_services', ['service_id', 'host_id']),
+    ('ix_upgrade_tasks_cluster_id_upgrade_start_time',
+     'upgrade_tasks', ['cluster_id', 'upgrade_start_time']),
+    ('ix_upgrade_steps_upgrade_task_id_stage',
+     'upgrade_steps', ['upgrade_task_id', 'stage', 'lane', 'position']),
+]
+
+
+def upgrade():
+    for name, table, columns in _INDEXES:
+        op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, _ in reversed(_INDEXES):
+        op.drop_index(name, table_name=table)
@@ -65,12 +65,20 @@ class Cluster(Base, KostyorModelMixin):
 hosts_services = sa.Table('hosts_services', Base.metadata, *(
     sa.Column('host_id', sa.String(36), sa.ForeignKey('hosts.id')),
     sa.Column('service_id', sa.String(36), sa.ForeignKey('services.id')),
-    sa.UniqueConstraint('host_id', 'service_id')
+    sa.UniqueConstraint('host_id', 'service_id'),
+
+    # The unique constraint covers lookups by host only, while hosts of
+    # a service are looked up as often.
+    sa.Index('ix_hosts_services_service_id_host_id',
+             'service_id', 'host_id'),
 ))
 
 
 class Host(Base, KostyorModelMixin):
     __tablename__ = 'hosts'
+    __table_args__ = (
+        sa.Index('ix_hosts_cluster_id_hostname', 'cluster_id', 'hostname'),
+    )
 
     hostname = sa.Column(sa.String(255))
     cluster_id = sa.Column(sa.ForeignKey('clusters.id'))
@@ -78,6 +86,9 @@ class Host(Base, KostyorModelMixin):
 
 class Service(Base, KostyorModelMixin):
     __tablename__ = 'services'
+    __table_args__ = (
+        sa.Index('ix_services_name', 'name'),
+    )
 
     name = sa.Column(sa.String(255))
     version = sa.Column(sa.Enum(*constants.OPENSTACK_VERSIONS))
@@ -89,6 +100,15 @@ class Service(Base, KostyorModelMixin):
 
 class UpgradeTask(Base, KostyorModelMixin):
     __tablename__ = 'upgrade_tasks'
+    __table_args__ = (
+        # Upgrades are listed page by page in the order of start time.
+        sa.Index('ix_upgrade_tasks_upgrade_start_time_id',
+                 'upgrade_start_time', 'id'),
+
+        # The most recent upgrade of a cluster is looked up on each action.
+        sa.Index('ix_upgrade_tasks_cluster_id_upgrade_start_time',
+                 'cluster_id', 'upgrade_start_time'),
+    )
 
     cluster_id = sa.Column(sa.ForeignKey('clusters.id'))
     from_version = sa.Column(sa.Enum(*constants.OPENSTACK_VERSIONS))
@@ -97,6 +117,11 @@ class UpgradeTask(Base, KostyorModelMixin):
     upgrade_end_time = sa.Column(sa.DateTime)
     status = sa.Column(sa.Enum(*constants.UPGRADE_STATUSES))
 
+    # An upgrade driver and its parameters are required to resume paused
+    # upgrade, since a plan consists of driver-independent steps.
+    driver = sa.Column(sa.String(255))
+    parameters = sa.Column(sa.JSON)
+
 
 class ServiceUpgradeRecord(Base, KostyorModelMixin):
     __tablename__ = 'service_upgrade_records'
@@ -112,3 +137,39 @@ class ServiceUpgradeRecord(Base, KostyorModelMixin):
                                                    cascade='delete'))
 
     status = sa.Column(sa.Enum(*constants.STATUSES))
+
+
+upgrade_steps_hosts = sa.Table('upgrade_steps_hosts', Base.metadata, *(
+    sa.Column('step_id', sa.String(36), sa.ForeignKey('upgrade_steps.id')),
+    sa.Column('host_id', sa.String(36), sa.ForeignKey('hosts.id')),
+    sa.UniqueConstraint('step_id', 'host_id')
+))
+
+
+class UpgradeStep(Base, KostyorModelMixin):
+    """A step of an upgrade plan.
+
+    Steps are executed stage by stage. Within a stage, steps of different
+    lanes are executed in parallel while steps of the same lane - one by
+    one in the order of their positions. A step without a service is one
+    that's executed before the main upgrade procedure.
+    """
+
+    __tablename__ = 'upgrade_steps'
+    __table_args__ = (
+        sa.Index('ix_upgrade_steps_upgrade_task_id_stage',
+                 'upgrade_task_id', 'stage', 'lane', 'position'),
+    )
+
+    upgrade_task_id = sa.Column(sa.ForeignKey('upgrade_tasks.id'))
+    service_id = sa.Column(sa.ForeignKey('services.id'), nullable=True)
+    stage = sa.Column(sa.Integer)
+    lane = sa.Column(sa.Integer)
+    position = sa.Column(sa.Integer)
+    status = sa.Column(sa.Enum(*constants.STEP_STATUSES))
+
+    # IDs of Celery tasks the step is executed by. They are required to
+    # revoke or abort the tasks once the upgrade is paused or cancelled.
+    task_ids = sa.Column(sa.JSON)
+
+    hosts = sa.orm.relationship('Host', secondary=upgrade_steps_hosts)
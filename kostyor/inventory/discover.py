@@ -1,6 +1,8 @@
 import abc
 import collections
 import re
+import threading
+import time
 
 import six
 from six.moves import map
@@ -33,58 +35,154 @@ class ServiceDiscovery(object):
                     'devstack-2.coreitpro.com': [
                         {'name': 'nova-compute', 'version': 'newton'},
                     ]
+                },
+                'errors': {
+                    'neutron': 'Timed out after 30 seconds',
                 }
             }
 
+        Facts are returned even if some of them couldn't be discovered, in
+        which case details are reported under optional 'errors' key.
+
         """
         pass
 
 
+# A host of an URL, either IPv6 literal in brackets (e.g. 'http://[::1]/')
+# or a name or IPv4 address, with optional credentials and port skipped.
+_URL_HOST = re.compile(r'[a-z][a-z0-9+.-]*://(?:[^@/]*@)?'
+                       r'(?:\[([0-9a-f:.]+)\]|([^:/?#\[\]]+))',
+                       re.IGNORECASE)
+
+
+def _fan_out(calls, timeout=None):
+    """Call given functions concurrently and wait for them to return.
+
+    Functions that fail or do not return in time are reported as errors
+    rather than failing the whole thing, so results of others can be used.
+    There's no way to interrupt a thread, so a function that's late keeps
+    running in background and its result is discarded.
+
+    :param calls: a list of (name, function) pairs
+    :param timeout: seconds to wait for all functions; no limit if None
+    :return: a tuple of ordered dict of names to results, and dict of names
+             to error details
+    """
+    results, errors, running = collections.OrderedDict(), {}, []
+
+    def _call(outcome, function):
+        try:
+            outcome['result'] = function()
+        except Exception as exc:
+            outcome['error'] = '%s: %s' % (type(exc).__name__, exc)
+
+    for name, function in calls:
+        outcome = {}
+        thread = threading.Thread(target=_call, args=(outcome, function))
+        thread.daemon = True
+        thread.start()
+        running.append((name, thread, outcome))
+
+    deadline = None if timeout is None else time.time() + timeout
+
+    for name, thread, outcome in running:
+        if deadline is None:
+            thread.join()
+        else:
+            thread.join(max(deadline - time.time(), 0))
+
+        if thread.is_alive():
+            errors[name] = 'Timed out after %s seconds' % timeout
+        elif 'error' in outcome:
+            errors[name] = outcome['error']
+        else:
+            results[name] = outcome['result']
+
+    return results, errors
+
+
 class OpenStackServiceDiscovery(ServiceDiscovery):
     OS_COMPUTE_API_VERSION = 2
 
+    # Services are discovered by a few independent probes, each one asks
+    # a particular API. New probes are to be implemented as 'discover_<name>'
+    # methods and added here.
+    PROBES = ['keystone', 'nova', 'neutron']
+
     def __init__(self, username=None, password=None, tenant_name=None,
-                 auth_url=None):
+                 auth_url=None, timeout=30, region_name=None,
+                 interface='internal'):
         auth = keystoneauth_v2.Password(
             username=username,
             password=password,
             tenant_name=tenant_name,
             auth_url=auth_url)
-        self.session = keystoneauth_session.Session(auth=auth)
+        self.session = keystoneauth_session.Session(auth=auth,
+                                                    timeout=timeout)
+        self.timeout = timeout
+
+        # Endpoints of the given region only, or of all regions if None,
+        # and the given interface are used to locate API services.
+        self.region_name = region_name
+        self.interface = interface
 
     def discover(self):
-        services = []
-        services.extend(self.discover_keystone())
-        services.extend(self.discover_nova())
-        services.extend(self.discover_neutron())
+        """Discover services by running all probes concurrently.
+
+        Probes are independent round trips to different APIs, so they are
+        run at once, and the whole discovery takes as long as the slowest
+        probe does, but no longer than the timeout. If some probes have
+        failed or timed out, services found by others are returned along
+        with error details under 'errors' key.
+        """
+        results, errors = _fan_out(
+            [(probe, getattr(self, 'discover_' + probe))
+             for probe in self.PROBES],
+            self.timeout)
 
         info = {'hosts': collections.defaultdict(list)}
-        for host, service in services:
-            info['hosts'][host].append({'name': service})
+        for services in results.values():
+            for host, service in services:
+                info['hosts'][host].append({'name': service})
+
+        if errors:
+            info['errors'] = errors
         return info
 
     def discover_keystone(self):
         """ Uses the Keystone REST API to discover services """
-        # TODO(sc68cal) God help us if someone is using a IPv6 literal in
-        # their service catalog
-        service_map = []
-        host_regex = re.compile("https?://([^/^:]*)")
-
         client = k_client.Client(session=self.session)
-        # TODO(sc68cal) Handle multiple regions and cells
+        # TODO(sc68cal) Handle cells
 
         # Call the REST API once and store the results
         endpoints = client.endpoints.list()
-        services = client.services.list()
+        services = {service.id: service for service in client.services.list()}
 
-        # Loop through the endpoints and services, merge into a single map
+        # Services are looked up by ID, so merging endpoints and services
+        # into a single map takes linear time no matter how big the catalog
+        # is. Endpoints of the same service on the same host (e.g. in
+        # different regions) are reported once.
+        service_map = collections.OrderedDict()
         for endpoint in endpoints:
-            for service in services:
-                if service.id == endpoint.service_id:
-                    entry = (host_regex.match(endpoint.internalurl).group(1),
-                             service.name + "-api")
-                    service_map.append(entry)
-        return service_map
+            service = services.get(endpoint.service_id)
+            if service is None:
+                continue
+
+            if self.region_name and endpoint.region != self.region_name:
+                continue
+
+            # Not every endpoint has URLs of all interfaces.
+            url = getattr(endpoint, self.interface + 'url', None)
+            match = _URL_HOST.match(url or '')
+            if match:
+                # Only IPv6 literals are case-insensitive for sure, while
+                # other hosts are reported as is, just like other probes do.
+                if match.group(1):
+                    host = match.group(1).lower()
+                else:
+                    host = match.group(2)
+                service_map[(host, service.name + "-api")] = True
+        return list(service_map)
 
     def discover_nova(self):
         """ Uses the Nova REST API to discover agents and their location """
@@ -0,0 +1,87 @@
+import collections
+import io
+import json
+import os
+
+import yaml
+
+from kostyor.inventory.discover import ServiceDiscovery
+
+
+class StaticInventoryDiscovery(ServiceDiscovery):
+    """Discover a deployment described by an inventory file.
+
+    Inventory is a stream of host records, one per line in case of
+    JSON-lines, or one per document in case of YAML::
+
+        {"hostname": "compute-1", "services": [{"name": "nova-compute",
+                                                "version": "newton"}]}
+
+    Records are parsed one by one, so even inventories of thousands of hosts
+    (e.g. CMDB exports) are never loaded into memory as a whole. Records of
+    the same host, if any, are merged, and services repeated on a host are
+    reported once.
+
+    :param path: a path to the inventory file
+    :param format: either 'jsonl' or 'yaml'; guessed by file extension
+                   if not passed
+    :param version: an OpenStack version the deployment runs
+    :param status: a status of the deployment
+
+    Version and status are reported only if passed, so rediscovering a
+    cluster from an inventory keeps the ones the cluster already has.
+    """
+
+    _FORMATS = {
+        '.jsonl': 'jsonl',
+        '.ndjson': 'jsonl',
+        '.yaml': 'yaml',
+        '.yml': 'yaml',
+    }
+
+    def __init__(self, path, format=None, version=None, status=None):
+        if format is None:
+            extension = os.path.splitext(path)[1].lower()
+            format = self._FORMATS.get(extension, 'jsonl')
+
+        if format not in ('jsonl', 'yaml'):
+            raise ValueError('Unsupported inventory format: %s' % format)
+
+        self.path = path
+        self.format = format
+        self.version = version
+        self.status = status
+
+    def _iterrecords(self, stream):
+        if self.format == 'yaml':
+            # C-accelerated loader is used, if available, since inventories
+            # of large deployments are quite big.
+            loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+            for record in yaml.load_all(stream, Loader=loader):
+                if record is not None:
+                    yield record
+        else:
+            for line in stream:
+                if line.strip():
+                    yield json.loads(line)
+
+    def discover(self):
+        info = {'hosts': collections.OrderedDict()}
+
+        if self.version is not None:
+            info['version'] = self.version
+        if self.status is not None:
+            info['status'] = self.status
+
+        with io.open(self.path, encoding='utf-8') as stream:
+            for record in self._iterrecords(stream):
+                services = info['hosts'].setdefault(record['hostname'], [])
+                names = set(service['name'] for service in services)
+
+                for service in record.get('services', []):
+                    if service['name'] not in names:
+                        names.add(service['name'])
+                        services.append({'name': service['name'],
+                                         'version': service.get('version')})
+
+        return info
@@ -1,6 +1,7 @@
 from kostyor.resources.clusters import Clusters, Cluster
-from kostyor.resources.discover import Discover
+from kostyor.resources.discover import Discover, DiscoverJob, Rediscover
 from kostyor.resources.hosts import Hosts
+from kostyor.resources.plan import Plan
 from kostyor.resources.services import Services
 from kostyor.resources.upgrades import Upgrades, Upgrade
 
@@ -9,7 +10,10 @@ __all__ = [
     'Clusters',
     'Cluster',
     'Discover',
+    'DiscoverJob',
     'Hosts',
+    'Plan',
+    'Rediscover',
     'Services',
     'Upgrades',
     'Upgrade',
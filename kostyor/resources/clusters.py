@@ -1,10 +1,12 @@
 import cerberus
+import six
 
 from flask import request
 from flask_restful import Resource, fields, marshal_with, abort
 
-from kostyor.common import constants
+from kostyor.common import constants, exceptions
 from kostyor.db import api as db_api
+from kostyor.resources import pagination
 
 
 # Output Schema is a Flask-RESTful marshaling schema that's used to
@@ -19,9 +21,27 @@ _PUBLIC_ATTRIBUTES = {
 
 class Clusters(Resource):
 
+    _filters_schema = {
+        'limit': {'type': 'integer', 'coerce': int, 'min': 1},
+        'marker': {'type': 'string'},
+        'status': {'type': 'string', 'allowed': constants.STATUSES},
+        'version': {'type': 'string', 'allowed': constants.OPENSTACK_VERSIONS},
+    }
+
     @marshal_with(_PUBLIC_ATTRIBUTES)
     def get(self):
-        return db_api.get_clusters()
+        validator = cerberus.Validator(
+            pagination.getschema(self._filters_schema))
+        if not validator.validate(request.args.to_dict()):
+            abort(400,
+                  message='Cannot list clusters, passed filters are '
+                          'incorrect. See "errors" attribute for details.',
+                  errors=validator.errors)
+
+        try:
+            return db_api.get_clusters(**validator.document)
+        except exceptions.BadRequest as exc:
+            abort(400, message=six.text_type(exc))
 
 
 class Cluster(Resource):
@@ -1,11 +1,16 @@
 import cerberus
+import six
 import stevedore
 
+from celery.result import AsyncResult
 from flask import request
-from flask_restful import Resource, abort, marshal_with
+from flask_restful import Resource, abort, fields, marshal_with
 
+from kostyor.common import exceptions
 from kostyor.db import api as dbapi
 from kostyor.resources.clusters import _PUBLIC_ATTRIBUTES
+from kostyor.rpc.app import app
+from kostyor.rpc import tasks
 
 
 _SUPPORTED_DRIVERS = stevedore.extension.ExtensionManager(
@@ -14,6 +19,28 @@ _SUPPORTED_DRIVERS = stevedore.extension.ExtensionManager(
 )
 
 
+_JOB_ATTRIBUTES = {
+    'id': fields.String,
+    'status': fields.String,
+    'cluster': fields.Nested(_PUBLIC_ATTRIBUTES, allow_null=True),
+    'error': fields.String,
+}
+
+
+def _dispatch(payload, **kwargs):
+    # Discovering may be a long-running operation, so it's done by a worker
+    # while clients poll for the result using returned job ID.
+    job = tasks.discover_cluster.apply_async(
+        args=(payload['method'], payload.get('parameters', {})),
+        kwargs=kwargs,
+    )
+    return (
+        {'id': job.id, 'status': job.state},
+        202,
+        {'Location': '/clusters/discover/%s' % job.id},
+    )
+
+
 class Discover(Resource):
 
     _schema = {
@@ -34,7 +61,7 @@ class Discover(Resource):
     def get(self):
         return _SUPPORTED_DRIVERS.names()
 
-    @marshal_with(_PUBLIC_ATTRIBUTES)
+    @marshal_with(_JOB_ATTRIBUTES)
     def post(self):
         payload = request.get_json()
 
@@ -45,11 +72,46 @@ class Discover(Resource):
                           'incorrect. See "errors" attribute for details.',
                   errors=validator.errors)
 
-        DriverCls = _SUPPORTED_DRIVERS[payload['method']].plugin
-        driver = DriverCls(**payload.get('parameters', {}))
-        cluster = dbapi.discover_cluster(payload['name'], driver.discover())
+        return _dispatch(payload, name=payload['name'])
+
+
+class Rediscover(Resource):
+
+    _schema = {
+        'method': Discover._schema['method'],
+        'parameters': Discover._schema['parameters'],
+    }
+
+    @marshal_with(_JOB_ATTRIBUTES)
+    def post(self, cluster_id):
+        payload = request.get_json()
+
+        validator = cerberus.Validator(self._schema)
+        if not validator.validate(payload):
+            abort(400,
+                  message='Cannot rediscover a cluster, passed data are '
+                          'incorrect. See "errors" attribute for details.',
+                  errors=validator.errors)
+
+        try:
+            dbapi.get_cluster(cluster_id)
+        except exceptions.NotFound as exc:
+            abort(404, message=six.text_type(exc))
+
+        return _dispatch(payload, cluster_id=cluster_id)
+
+
+class DiscoverJob(Resource):
+
+    @marshal_with(_JOB_ATTRIBUTES)
+    def get(self, job_id):
+        # Celery can't tell unknown jobs from ones that are not started yet,
+        # so both are reported as pending.
+        job = AsyncResult(job_id, app=app)
 
-        # NOTE: Discovering may be a long-running operation, so we need to
-        #       consider implementing task mechanism with result polling
-        #       on client side.
-        return cluster, 201
+        return {
+            'id': job_id,
+            'status': job.state,
+            'cluster': job.result if job.successful() else None,
+            'error': six.text_type(job.result) if job.failed() else None,
+        }
@@ -0,0 +1,19 @@
+from kostyor.conf import CONF
+
+
+def getschema(schema):
+    """Get a schema of list filters with page size limits applied.
+
+    Limits are configurable, so they are taken once the request is made
+    rather than once the resource is defined.
+
+    :param schema: a cerberus schema with 'limit' filter
+    :returns: a schema where 'limit' has a default value and a maximum,
+              see ``[api] default_page_size`` and ``[api] max_page_size``
+    """
+    maximum = CONF.api.max_page_size
+    return dict(schema, limit=dict(
+        schema['limit'],
+        default=min(CONF.api.default_page_size, maximum),
+        max=maximum,
+    ))
@@ -0,0 +1,55 @@
+import six
+
+from flask_restful import Resource, fields, marshal_with, abort
+
+from kostyor.common import exceptions
+from kostyor.db import api as db_api
+from kostyor.upgrades.engines import dependencygraph
+
+
+_PUBLIC_ATTRIBUTES = {
+    'stages': fields.List(fields.List(fields.Nested({
+        'service': fields.String,
+        'service_id': fields.String,
+        'host': fields.String,
+        'host_id': fields.String,
+    }))),
+    'steps': fields.Integer,
+    'critical_path_length': fields.Integer,
+}
+
+
+class Plan(Resource):
+    """Dry-run of dependency graph engine.
+
+    Returns stages the upgrade of a given cluster would be executed in,
+    without actually starting it. Steps of the same stage are executed
+    in parallel, while stages are executed one-by-one.
+    """
+
+    @marshal_with(_PUBLIC_ATTRIBUTES)
+    def get(self, cluster_id):
+        try:
+            hosts, services = db_api.get_cluster_topology(cluster_id)
+        except exceptions.NotFound as exc:
+            abort(404, message=six.text_type(exc))
+
+        services = {service['id']: service for service in services}
+        stages = [
+            [
+                {
+                    'service': service['name'],
+                    'service_id': service['id'],
+                    'host': host['hostname'],
+                    'host_id': host['id'],
+                }
+                for service, host in stage
+            ]
+            for stage in dependencygraph.getstages(hosts, services)
+        ]
+
+        return {
+            'stages': stages,
+            'steps': sum(len(stage) for stage in stages),
+            'critical_path_length': len(stages),
+        }
@@ -4,9 +4,13 @@ import stevedore
 
 from flask import request
 from flask_restful import Resource, fields, marshal_with, abort
+from oslo_utils import timeutils
 
 from kostyor.common import constants, exceptions
 from kostyor.db import api as db_api
+from kostyor.resources import pagination
+from kostyor.upgrades import engines
+from kostyor.upgrades.engines import nodebynode
 
 
 _PUBLIC_ATTRIBUTES = {
@@ -32,8 +36,30 @@ _SUPPORTED_DRIVERS = stevedore.extension.ExtensionManager(
 )
 
 
+def _totimestamp(value):
+    # Timestamps are stored in UTC without timezone.
+    return timeutils.normalize_time(timeutils.parse_isotime(value))
+
+
 class Upgrades(Resource):
 
+    _filters_schema = {
+        'cluster_id': {'type': 'string'},
+        'limit': {'type': 'integer', 'coerce': int, 'min': 1},
+        'marker': {'type': 'string'},
+        'status': {'type': 'string', 'allowed': constants.UPGRADE_STATUSES},
+        'from_version': {
+            'type': 'string',
+            'allowed': constants.OPENSTACK_VERSIONS,
+        },
+        'to_version': {
+            'type': 'string',
+            'allowed': constants.OPENSTACK_VERSIONS,
+        },
+        'started_after': {'type': 'datetime', 'coerce': _totimestamp},
+        'started_before': {'type': 'datetime', 'coerce': _totimestamp},
+    }
+
     _schema = {
         'cluster_id': {
             'type': 'string',
@@ -59,7 +85,18 @@ class Upgrades(Resource):
 
     @marshal_with(_PUBLIC_ATTRIBUTES)
     def get(self):
-        return db_api.get_upgrades()
+        validator = cerberus.Validator(
+            pagination.getschema(self._filters_schema))
+        if not validator.validate(request.args.to_dict()):
+            abort(400,
+                  message='Cannot list upgrade tasks, passed filters are '
+                          'incorrect. See "errors" attribute for details.',
+                  errors=validator.errors)
+
+        try:
+            return db_api.get_upgrades(**validator.document)
+        except exceptions.BadRequest as exc:
+            abort(400, message=six.text_type(exc))
 
     @marshal_with(_PUBLIC_ATTRIBUTES)
     def post(self):
@@ -73,14 +110,23 @@ class Upgrades(Resource):
                   errors=validator.errors)
 
         try:
+            driver_name = payload.get('driver', 'noop')
+            parameters = payload.get('parameters', {})
+
+            # Parameters are validated before the upgrade is created, since
+            # once it's created the cluster is considered being upgraded.
+            if 'batch_size' in parameters:
+                nodebynode.getbatchsize(parameters['batch_size'], 1)
+
             upgrade = db_api.create_cluster_upgrade(
                 payload['cluster_id'],
-                payload['to_version']
+                payload['to_version'],
+                driver=driver_name,
+                parameters=parameters,
             )
 
-            driver_name = payload.get('driver', 'noop')
             driver = _SUPPORTED_DRIVERS[driver_name].plugin(
-                parameters=payload.get('parameters', {}),
+                parameters=parameters,
             )
 
             engine_name = payload.get('engine', 'node-by-node')
@@ -95,12 +141,62 @@ class Upgrades(Resource):
         return upgrade, 201
 
 
+def pause_cluster_upgrade(cluster_id):
+    upgrade = db_api.get_upgrade_by_cluster(cluster_id)
+    result = db_api.pause_cluster_upgrade(cluster_id)
+
+    # Steps that are being executed are let finish, so the upgrade can be
+    # continued from a consistent state.
+    engines.stop(upgrade)
+
+    return result
+
+
+def cancel_cluster_upgrade(cluster_id):
+    upgrade = db_api.get_upgrade_by_cluster(cluster_id)
+
+    # The upgrade is cancelled before its tasks are stopped, so steps that
+    # complete meanwhile don't send next ones to execution.
+    result = db_api.cancel_cluster_upgrade(cluster_id)
+    engines.stop(upgrade, abort=True)
+
+    return result
+
+
+def continue_cluster_upgrade(cluster_id):
+    upgrade = db_api.get_upgrade_by_cluster(cluster_id)
+
+    if upgrade['status'] == constants.UPGRADE_IN_PROGRESS:
+        raise exceptions.UpgradeIsInProgress(
+            'Cluster %s already has an upgrade in progress.' % cluster_id)
+
+    # Steps of cancelled upgrades are cancelled too, and finished upgrades
+    # have nothing left to do, so continuing them would leave the cluster
+    # in progress forever.
+    if upgrade['status'] != constants.UPGRADE_PAUSED:
+        raise exceptions.UpgradeIsNotPaused(
+            'Upgrade of cluster %s cannot be continued since it is not '
+            'paused (status: %s).' % (cluster_id, upgrade['status']))
+
+    result = db_api.continue_cluster_upgrade(cluster_id)
+
+    # The plan of the upgrade has been persisted on start, so there's no
+    # need to plan it again. Only steps that haven't been executed yet are
+    # dispatched using the same driver the upgrade has been started with.
+    driver = _SUPPORTED_DRIVERS[upgrade['driver'] or 'noop'].plugin(
+        parameters=upgrade['parameters'] or {},
+    )
+    engines.resume(upgrade, driver)
+
+    return result
+
+
 class Upgrade(Resource):
 
     _actions = {
-        'pause': db_api.pause_cluster_upgrade,
-        'continue': db_api.continue_cluster_upgrade,
-        'cancel': db_api.cancel_cluster_upgrade,
+        'pause': pause_cluster_upgrade,
+        'continue': continue_cluster_upgrade,
+        'cancel': cancel_cluster_upgrade,
         'rollback': db_api.rollback_cluster_upgrade,
     }
 
@@ -137,6 +233,8 @@ class Upgrade(Resource):
         try:
             # Would it better to pass upgrade_id instead?
             upgrade = fn(payload['cluster_id'])
+        except exceptions.BadRequest as exc:
+            abort(400, message=six.text_type(exc))
         except exceptions.NotFound as exc:
             abort(404, message=six.text_type(exc))
 
@@ -24,10 +24,13 @@ app.config['ERROR_404_HELP'] = False
 # Once old ones are reimplemented - we can get rid of them and even provide
 # some factory function to return Flask application.
 api.add_resource(resources.Discover, '/clusters/discover')
+api.add_resource(resources.DiscoverJob, '/clusters/discover/<job_id>')
 api.add_resource(resources.Clusters, '/clusters')
 api.add_resource(resources.Cluster, '/clusters/<cluster_id>')
 api.add_resource(resources.Hosts, '/clusters/<cluster_id>/hosts')
 api.add_resource(resources.Services, '/clusters/<cluster_id>/services')
+api.add_resource(resources.Plan, '/clusters/<cluster_id>/plan')
+api.add_resource(resources.Rediscover, '/clusters/<cluster_id>/discover')
 
 api.add_resource(resources.Upgrades, '/upgrades')
 api.add_resource(resources.Upgrade, '/upgrades/<upgrade_id>')
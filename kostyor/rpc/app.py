@@ -1,10 +1,18 @@
 import celery
 import pkg_resources
 
+from celery import signals
+
 from kostyor.conf import CONF
+from kostyor.db import api as dbapi
+from kostyor.rpc import serialization
 
 
 def create_app(conf):
+    # Serializers are looked up by name once messages are sent, so custom
+    # ones have to be registered before.
+    serialization.register()
+
     app = celery.Celery()
 
     for option, value in conf.rpc.items():
@@ -31,3 +39,12 @@ def create_app(conf):
 
 
 app = create_app(CONF)
+
+
+@signals.worker_init.connect
+def configure_database(**kwargs):
+    # Some tasks (e.g. ones that track upgrade steps) need database access.
+    # The session is configured in the main worker process, and since the
+    # engine doesn't connect until the first query, it's safe to be used in
+    # forked pool processes as well.
+    dbapi.configure_session(CONF.database.connection)
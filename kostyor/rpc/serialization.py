@@ -0,0 +1,76 @@
+import datetime
+import struct
+
+import pytz
+
+from kombu.serialization import registry
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+# Extension types of msgpack used to encode types that msgpack doesn't
+# support natively, e.g. start and end time of upgrades.
+_NAIVE_DATETIME = 1
+_AWARE_DATETIME = 2
+
+# Datetime values are packed as a number of microseconds since the epoch,
+# which is both more compact and faster to decode than ISO 8601 strings.
+_EPOCH = datetime.datetime(1970, 1, 1)
+_MICROSECONDS = struct.Struct('>q')
+
+
+def _default(obj):
+    if isinstance(obj, datetime.datetime):
+        code = _NAIVE_DATETIME
+        if obj.tzinfo is not None:
+            code = _AWARE_DATETIME
+            obj = obj.astimezone(pytz.utc).replace(tzinfo=None)
+
+        delta = obj - _EPOCH
+        microseconds = ((delta.days * 86400 + delta.seconds) * 10 ** 6 +
+                        delta.microseconds)
+        return msgpack.ExtType(code, _MICROSECONDS.pack(microseconds))
+
+    raise TypeError('Object of type %s is not msgpack serializable' %
+                    type(obj).__name__)
+
+
+def _ext_hook(code, data):
+    if code in (_NAIVE_DATETIME, _AWARE_DATETIME):
+        microseconds, = _MICROSECONDS.unpack(data)
+        value = _EPOCH + datetime.timedelta(microseconds=microseconds)
+        if code == _AWARE_DATETIME:
+            value = pytz.utc.localize(value)
+        return value
+
+    return msgpack.ExtType(code, data)
+
+
+def dumps(obj):
+    return msgpack.packb(obj, use_bin_type=True, default=_default)
+
+
+def loads(data):
+    return msgpack.unpackb(data, raw=False, ext_hook=_ext_hook)
+
+
+def register():
+    """Register msgpack serializer that's aware of Kostyor types.
+
+    It replaces the one shipped with kombu under the same name, so it's
+    enough to set ``msgpack`` as a serializer and add it to accepted
+    content in ``[rpc]`` section. Messages without datetime values are
+    plain msgpack, so they are readable by kombu's own serializer too.
+
+    Nothing is registered if msgpack is not installed, and kombu's one
+    reports that on attempt to use it.
+    """
+    if msgpack is None:
+        return
+
+    registry.register('msgpack', dumps, loads,
+                      content_type='application/x-msgpack',
+                      content_encoding='binary')
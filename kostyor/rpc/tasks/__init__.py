@@ -1,8 +1,14 @@
-from kostyor.rpc.tasks.execute import execute
+from kostyor.rpc.tasks.discovery import discover_cluster
+from kostyor.rpc.tasks.execute import execute, execute_many
 from kostyor.rpc.tasks.noop import noop
+from kostyor.rpc.tasks.steps import complete_step, fail_step
 
 
 __all__ = [
+    'complete_step',
+    'discover_cluster',
     'execute',
+    'execute_many',
+    'fail_step',
     'noop',
 ]
@@ -0,0 +1,49 @@
+import stevedore
+
+from kostyor.db import api as dbapi
+from kostyor.rpc import topology
+from kostyor.rpc.app import app
+
+
+# Custom states of discovery task, reported in addition to Celery's own,
+# so clients polling for result can tell how far the task has gone.
+DISCOVERING = 'DISCOVERING'
+STORING = 'STORING'
+
+
+@app.task(bind=True, track_started=True)
+def discover_cluster(self, method, parameters, name=None, cluster_id=None):
+    """Discover a deployment and store it as a cluster.
+
+    Discovering large deployments may take minutes, so it's done by the
+    worker rather than within API request.
+
+    :param method: a name of discovery driver to be used
+    :param parameters: a dict of parameters to be passed to the driver
+    :param name: a name of new cluster to be created
+    :param cluster_id: an existing cluster to be updated instead, see
+                       :func:`kostyor.db.api.rediscover_cluster`
+    :return: a cluster created or updated
+    """
+    self.update_state(state=DISCOVERING)
+    driver = stevedore.driver.DriverManager(
+        namespace='kostyor.discovery_drivers',
+        name=method,
+        invoke_on_load=True,
+        invoke_kwds=parameters or {},
+    ).driver
+    info = driver.discover()
+
+    self.update_state(state=STORING)
+    try:
+        if cluster_id is None:
+            return dbapi.discover_cluster(name, info)
+
+        cluster = dbapi.rediscover_cluster(cluster_id, info)
+
+        # Workers may have cached hosts and services that have been moved
+        # or gone since.
+        topology.invalidate()
+        return cluster
+    finally:
+        dbapi.shutdown_session()
@@ -1,40 +1,313 @@
+import collections
+import errno
+import os
+import signal
 import time
+import threading
 import subprocess
 
+from multiprocessing.pool import ThreadPool
+
 from celery.contrib.abortable import AbortableTask
 
+from kostyor.conf import CONF
+from kostyor.db import api as dbapi
+from kostyor.rpc import topology
 from kostyor.rpc.app import app
 
 
+# Checking whether a task is aborted requires a request to result backend,
+# so it's done way less often than the process is checked for exit.
+ABORT_CHECK_INTERVAL = 5
+
+# Time given to the process to exit gracefully once it's terminated.
+TERMINATE_TIMEOUT = 10
+
+# Output is read by lines, though a line longer than that is split into
+# a few in order to keep memory usage bounded.
+OUTPUT_CHUNK_SIZE = 64 * 1024
+
+
+class _Output(object):
+    """Output of a process, captured as it's produced.
+
+    Only a limited number of last lines is kept in memory, while the whole
+    output is spooled to a file if the path is passed. That's important
+    since some processes (e.g. database migrations) may print hundreds of
+    megabytes.
+
+    :param path: a path to the file to spool the output to, or None
+    :param lines: a number of last lines to be kept in memory
+    """
+
+    def __init__(self, path, lines):
+        self.path = path
+        self._tail = collections.deque(maxlen=lines)
+        self._file = None
+
+        if path is not None:
+            try:
+                os.makedirs(os.path.dirname(path))
+            except OSError as exc:
+                if exc.errno != errno.EEXIST:
+                    raise
+            self._file = open(path, 'wb')
+
+    def write(self, chunk):
+        self._tail.append(chunk)
+        if self._file is not None:
+            self._file.write(chunk)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+    @property
+    def tail(self):
+        return b''.join(self._tail).decode('utf-8', 'replace')
+
+
+def _watch(process, output):
+    # Unfortunately, 'timeout' parameter of 'wait' method has been added in
+    # Python 3.3, so we can't use it directly. Instead, the output is read
+    # and the process is waited in a separate thread which sets the event
+    # once the process exits, so the exit is noticed right away rather than
+    # on next poll.
+    exited = threading.Event()
+
+    def _wait():
+        try:
+            readline = process.stdout.readline
+            for chunk in iter(lambda: readline(OUTPUT_CHUNK_SIZE), b''):
+                output.write(chunk)
+        finally:
+            process.wait()
+            output.close()
+            exited.set()
+
+    watcher = threading.Thread(target=_wait)
+    watcher.daemon = True
+    watcher.start()
+    return exited
+
+
+class _Process(object):
+    """A process with captured output which exit can be waited for.
+
+    :param args: process with arguments to be executed
+    :param cwd: path to current working directory to be set
+    :param path: a path to the file to spool the output to, or None
+    """
+
+    def __init__(self, args, cwd, path):
+        self.output = _Output(path, CONF.execute.output_tail_lines)
+        # The process is started in a new session, so it can be terminated
+        # along with its children that may keep the output open otherwise.
+        self._process = subprocess.Popen(args,
+                                         cwd=cwd,
+                                         stdout=subprocess.PIPE,
+                                         stderr=subprocess.STDOUT,
+                                         preexec_fn=os.setsid)
+        self._exited = _watch(self._process, self.output)
+
+    @property
+    def returncode(self):
+        return self._process.returncode
+
+    def wait(self, timeout=None):
+        return self._exited.wait(timeout)
+
+    def _signal(self, signum):
+        try:
+            os.killpg(self._process.pid, signum)
+        except OSError as exc:
+            if exc.errno != errno.ESRCH:
+                raise
+
+    def terminate(self):
+        self._signal(signal.SIGTERM)
+
+        if not self._exited.wait(TERMINATE_TIMEOUT):
+            self._signal(signal.SIGKILL)
+
+            # The output may be still kept open by children of the process,
+            # so don't wait for it forever.
+            self._exited.wait(TERMINATE_TIMEOUT)
+
+    def result(self, returncode):
+        return {
+            'returncode': returncode,
+            'output': self.output.tail,
+            'log': self.output.path,
+        }
+
+
+def _getlogpath(*names):
+    if not CONF.execute.log_dir:
+        return None
+    return '%s.log' % os.path.join(CONF.execute.log_dir, *names)
+
+
+class ExecutionTimedOut(Exception):
+    """Process has not completed within a given timeout.
+
+    Unlike Celery's own TimeLimitExceeded, it tells that the process has
+    been terminated by the task rather than the task by the worker.
+    """
+
+
 @app.task(bind=True, base=AbortableTask)
-def execute(self, args, cwd=None, ignore_errors=False):
+def execute(self, args, cwd=None, ignore_errors=False, timeout=None):
     """Execute an arbitrary process and terminate it if abort() is sent.
 
     In case when process ended with return code non-equal to zero, the
     exception is raised in order to mark celery task as failed.
 
+    Both stdout and stderr of the process are captured. The last lines of
+    the output are returned while the whole output is spooled to a file
+    named after the task in ``[execute] log_dir`` directory.
+
     :param args: process with arguments to be executed
     :param cwd: path to current working directory to be set
     :param ignore_errors: do not raise exception for '!=0' return codes if True
-    :return: process' return code, or 'None' if it was aborted
+    :param timeout: seconds the process is allowed to run; no limit if None
+    :return: a dict with process' return code, or 'None' if it was aborted,
+             the last lines of its output and a path to the whole output
     """
-    process = subprocess.Popen(args, cwd=cwd)
+    process = _Process(
+        args, cwd, _getlogpath(self.request.id or str(os.getpid())))
+
+    deadline = None if timeout is None else time.time() + timeout
+    returncode = None
+
+    while True:
+        interval = ABORT_CHECK_INTERVAL
+        if deadline is not None:
+            interval = max(min(interval, deadline - time.time()), 0)
+
+        if process.wait(interval):
+            returncode = process.returncode
+            break
+
+        if deadline is not None and time.time() >= deadline:
+            process.terminate()
+            raise ExecutionTimedOut(
+                'Command "%s" has timed out after %s seconds: %s' % (
+                    ' '.join(args), timeout, process.output.tail))
 
-    # Unfortunately, 'timeout' parameter of 'wait' method has been added in
-    # Python 3.3, so we can't use to do a periodic check for 'is_aborted()'
-    # value and that's why 'poll()' and 'sleep()' are used.
-    while process.poll() is None:
         if self.is_aborted():
             process.terminate()
             break
 
-        time.sleep(1)
-
     # Celery treats exceptions from task as way to mark it failed. So let's
     # throw one to do so in case return code is not zero.
     if all([not ignore_errors,
-            process.returncode is not None,
-            process.returncode != 0]):
-        raise subprocess.CalledProcessError(process.returncode, ' '.join(args))
+            returncode is not None,
+            returncode != 0]):
+        raise subprocess.CalledProcessError(
+            returncode, ' '.join(args), process.output.tail)
+
+    return process.result(returncode)
+
+
+class ExecutionFailed(Exception):
+    """Process has failed on some hosts."""
+
+
+@app.task(bind=True, base=AbortableTask)
+def execute_many(self, args, hosts, cwd=None, ignore_errors=False,
+                 timeout=None, concurrency=None):
+    """Execute an arbitrary process on each of given hosts.
+
+    Unlike executing a task per host, it's one message to broker and one
+    result to backend no matter how many hosts there are. Processes are
+    executed concurrently, though no more than ``concurrency`` at once.
+    Each argument is a template formatted by attributes of a host, e.g.
+    ``['ssh', '{hostname}', 'service', 'nova-compute', 'restart']``.
+
+    If aborted, running processes are terminated and the rest is skipped.
+
+    :param args: process with arguments templates to be executed
+    :param hosts: a list of hosts, or their IDs, to execute the process for
+    :param cwd: path to current working directory to be set
+    :param ignore_errors: do not raise exception if the process has failed
+                          or timed out on some hosts if True
+    :param timeout: seconds the process is allowed to run on each host
+    :param concurrency: a number of processes to be executed at once;
+                        ``[execute] concurrency`` is used if not passed
+    :return: a mapping of hostnames to results, see :func:`execute`; the
+             return code is 'None' if the process was aborted or timed out
+    """
+    # Drivers may pass IDs of hosts rather than hosts themselves in order
+    # to keep messages small, see '[upgrades] pass_references'.
+    try:
+        hosts = topology.hosts.get(hosts)
+    finally:
+        dbapi.shutdown_session()
+
+    aborted = threading.Event()
+    running = set()
+    lock = threading.Lock()
+
+    # Request is thread-local, so it has to be accessed by this thread.
+    taskid = self.request.id or str(os.getpid())
+
+    def _execute(host):
+        with lock:
+            if aborted.is_set():
+                return host['hostname'], None
+
+            process = _Process(
+                [arg.format(**host) for arg in args],
+                cwd,
+                _getlogpath(taskid, host['hostname']))
+            running.add(process)
+
+        try:
+            if not process.wait(timeout):
+                process.terminate()
+            elif not aborted.is_set():
+                return host['hostname'], process.result(process.returncode)
+
+            return host['hostname'], process.result(None)
+        finally:
+            with lock:
+                running.discard(process)
+
+    pool = ThreadPool(min(concurrency or CONF.execute.concurrency,
+                          len(hosts)) or 1)
+    try:
+        pending = pool.map_async(_execute, hosts)
+
+        # Checking for abort is done by this thread only, so the number of
+        # requests to result backend doesn't depend on number of hosts.
+        while not pending.ready():
+            pending.wait(ABORT_CHECK_INTERVAL)
+
+            if not pending.ready() and self.is_aborted():
+                with lock:
+                    aborted.set()
+                    processes = list(running)
+
+                for process in processes:
+                    process.terminate()
+                break
+
+        results = dict(pending.get())
+    finally:
+        pool.close()
+        pool.join()
+
+    if aborted.is_set():
+        return results
+
+    failed = sorted(
+        hostname for hostname, result in results.items()
+        if result['returncode'] != 0)
+
+    if failed and not ignore_errors:
+        raise ExecutionFailed(
+            'Command "%s" has failed on hosts: %s' % (
+                ' '.join(args), ', '.join(failed)))
 
-    return process.returncode
+    return results
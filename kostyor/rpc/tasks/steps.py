@@ -0,0 +1,52 @@
+from kostyor.common import constants
+from kostyor.db import api as dbapi
+from kostyor.rpc.app import app
+
+
+@app.task
+def complete_step(*step_ids):
+    """Mark upgrade steps as succeed once they are executed.
+
+    The task is chained right after tasks of each upgrade step. Once the
+    step is marked, next steps that are ready are sent to execution, unless
+    the upgrade is not in progress anymore (e.g. it has been paused). In
+    that case the upgrade halts right here, and steps that aren't executed
+    yet will be dispatched on resume.
+
+    :param step_ids: upgrade steps to be marked; there are a few of them
+                     if steps have been coalesced
+    """
+    # Engines send this task along with steps, so they can't be imported
+    # at module level without circular import.
+    from kostyor.upgrades import engines
+
+    try:
+        upgrade = dbapi.complete_upgrade_steps(step_ids)
+
+        if upgrade['status'] == constants.UPGRADE_IN_PROGRESS:
+            engines.advance(upgrade)
+    finally:
+        dbapi.shutdown_session()
+
+
+@app.task
+def fail_step(*step_ids):
+    """Mark upgrade steps as failed once some of their tasks have failed.
+
+    The task is linked as an error callback to tasks of each upgrade step,
+    so a failed step doesn't stay in progress forever. It blocks its lane,
+    while steps of other lanes that are ready are sent to execution in its
+    place.
+
+    :param step_ids: upgrade steps to be marked; there are a few of them
+                     if steps have been coalesced
+    """
+    from kostyor.upgrades import engines
+
+    try:
+        upgrade = dbapi.fail_upgrade_steps(step_ids)
+
+        if upgrade['status'] == constants.UPGRADE_IN_PROGRESS:
+            engines.advance(upgrade)
+    finally:
+        dbapi.shutdown_session()
@@ -0,0 +1,102 @@
+import collections
+import threading
+
+import six
+
+from celery.worker.control import control_command
+
+from kostyor.common import exceptions
+from kostyor.conf import CONF
+from kostyor.db import api as dbapi
+from kostyor.rpc.app import app
+
+
+class TopologyCache(object):
+    """Read-through cache of hosts or services known to a worker.
+
+    Upgrade drivers may pass IDs of hosts and services to tasks instead of
+    their attributes, see ``[upgrades] pass_references``. Tasks resolve
+    them through the cache, so each object is fetched from the database
+    once per worker process rather than carried by every message. Only
+    missing objects are fetched, all at once, and the least recently used
+    ones are evicted once ``[upgrades] topology_cache_size`` is reached.
+
+    The topology doesn't change while upgrade is in progress. Yet it may be
+    changed by rediscovery between upgrades or while an upgrade is paused,
+    so caches are cleared then, see :func:`invalidate`.
+
+    :param load: a function to get a list of objects by their IDs
+    :param exception: an exception to be raised for unknown IDs
+    """
+
+    def __init__(self, load, exception):
+        self._load = load
+        self._exception = exception
+        self._objects = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, refs):
+        """Get objects referenced by given IDs.
+
+        :param refs: a list of IDs; objects are passed through as is, so
+                     tasks work in both reference-passing mode and not
+        :returns: a list of objects in the order of given references
+        :raises NotFound: if some of objects are missing in the database
+        """
+        ids = [ref for ref in refs if isinstance(ref, six.string_types)]
+
+        with self._lock:
+            objects = {
+                id_: self._objects[id_] for id_ in ids if id_ in self._objects
+            }
+
+        missing = set(ids) - set(objects)
+        if missing:
+            loaded = {obj['id']: obj for obj in self._load(list(missing))}
+
+            unknown = sorted(missing - set(loaded))
+            if unknown:
+                raise self._exception(', '.join(unknown))
+            objects.update(loaded)
+
+        with self._lock:
+            for id_ in ids:
+                self._objects.pop(id_, None)
+                self._objects[id_] = objects[id_]
+
+            while len(self._objects) > CONF.upgrades.topology_cache_size:
+                self._objects.popitem(last=False)
+
+        return [
+            objects[ref] if isinstance(ref, six.string_types) else ref
+            for ref in refs
+        ]
+
+    def clear(self):
+        with self._lock:
+            self._objects.clear()
+
+
+hosts = TopologyCache(dbapi.get_hosts, exceptions.HostNotFound)
+services = TopologyCache(dbapi.get_services, exceptions.ServiceNotFound)
+
+
+@control_command()
+def clear_topology_cache(state):
+    """Clear topology caches of a worker, see :func:`invalidate`."""
+    hosts.clear()
+    services.clear()
+    return {'ok': 'topology cache cleared'}
+
+
+def invalidate():
+    """Clear topology caches of this process and of all workers.
+
+    It's called once a cluster is rediscovered and once an upgrade is
+    resumed, since the cluster might have been rediscovered while the
+    upgrade was paused. Workers clear their caches once they receive
+    the broadcast.
+    """
+    hosts.clear()
+    services.clear()
+    app.control.broadcast('clear_topology_cache')
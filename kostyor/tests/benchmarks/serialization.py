@@ -0,0 +1,116 @@
+"""Compare serializers on messages and results of upgrade tasks.
+
+Steps of a synthetic plan are turned into the same chains the engines
+send (a driver task followed by step completion), and each serializer
+available to RPC layer encodes and decodes them. Hosts are either
+embedded into signatures or passed by reference, see ``[upgrades]
+pass_references``. An upgrade record with datetime fields stands for
+results.
+
+    $ python -m kostyor.tests.benchmarks.serialization --hosts 1000
+"""
+
+from __future__ import print_function
+
+import argparse
+import datetime
+import time
+
+import celery
+
+from kombu import serialization
+from oslo_utils import uuidutils
+
+from kostyor.common import constants
+from kostyor.rpc import tasks
+from kostyor.rpc.app import app  # noqa, registers serializers
+
+
+SERIALIZERS = ['json', 'msgpack']
+
+
+def make_chains(hosts_number, batch_size, references):
+    cluster_id = uuidutils.generate_uuid()
+    hosts = [
+        {'id': uuidutils.generate_uuid(),
+         'hostname': 'compute-%d.example.com' % i,
+         'cluster_id': cluster_id}
+        for i in range(hosts_number)
+    ]
+
+    chains = []
+    for i in range(0, hosts_number, batch_size):
+        batch = hosts[i:i + batch_size]
+        if references:
+            batch = [host['id'] for host in batch]
+
+        chains.append(celery.chain(
+            tasks.execute_many.si(
+                ['ssh', '{hostname}', 'systemctl', 'restart', 'nova-compute'],
+                batch),
+            tasks.complete_step.si(uuidutils.generate_uuid()),
+        ))
+    return [dict(chain) for chain in chains]
+
+
+def make_upgrade():
+    return {
+        'id': uuidutils.generate_uuid(),
+        'cluster_id': uuidutils.generate_uuid(),
+        'from_version': constants.MITAKA,
+        'to_version': constants.NEWTON,
+        'status': constants.UPGRADE_IN_PROGRESS,
+        'upgrade_start_time': datetime.datetime.utcnow(),
+        'upgrade_end_time': datetime.datetime.utcnow(),
+        'driver': 'noop',
+        'engine': 'node-by-node',
+        'parameters': {'batch_size': '10%'},
+    }
+
+
+def measure(payloads, serializer, repeat):
+    accept = serialization.prepare_accept_content([serializer])
+
+    encode, decode = [], []
+    for _ in range(repeat):
+        started = time.time()
+        messages = [serialization.dumps(payload, serializer=serializer)
+                    for payload in payloads]
+        encode.append(time.time() - started)
+
+        started = time.time()
+        for content_type, encoding, data in messages:
+            serialization.loads(data, content_type, encoding, accept=accept)
+        decode.append(time.time() - started)
+
+    size = sum(len(data) for _, _, data in messages)
+    return min(encode), min(decode), size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--hosts', type=int, default=1000,
+                        help='a number of hosts in the plan')
+    parser.add_argument('--batch', type=int, default=10,
+                        help='a number of hosts upgraded by each step')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='a number of times to repeat the measurement')
+    args = parser.parse_args()
+
+    samples = [
+        ('signatures', make_chains(args.hosts, args.batch, False)),
+        ('references', make_chains(args.hosts, args.batch, True)),
+        ('upgrades', [make_upgrade() for _ in range(args.hosts)]),
+    ]
+
+    print('%-12s %-10s %10s %10s %12s' % (
+        'payload', 'serializer', 'encode, s', 'decode, s', 'bytes'))
+    for name, payloads in samples:
+        for serializer in SERIALIZERS:
+            encode, decode, size = measure(payloads, serializer, args.repeat)
+            print('%-12s %-10s %10.4f %10.4f %12d' % (
+                name, serializer, encode, decode, size))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,4 @@
+import time
 import unittest
 
 from kostyor.inventory import discover
@@ -47,3 +48,106 @@ class OpenStackServiceDiscoveryTest(unittest.TestCase):
         fk_endpointmanager.return_value = [fake_endpoint]
         fk_servicemanager.return_value = [fake_service]
         self.assertEqual(expected, self.osd.discover_keystone())
+
+    @mock.patch("keystoneclient.v2_0.endpoints.EndpointManager.list")
+    @mock.patch("keystoneclient.v2_0.services.ServiceManager.list")
+    def test_discover_keystone_catalog(self, fk_servicemanager,
+                                       fk_endpointmanager):
+        def _endpoint(service_id, region, internalurl, publicurl=None):
+            return mock.Mock(service_id=service_id,
+                             region=region,
+                             internalurl=internalurl,
+                             publicurl=publicurl)
+
+        def _service(id_, name):
+            # 'name' is a special argument of Mock, so set it afterwards.
+            service = mock.Mock(id=id_)
+            service.name = name
+            return service
+
+        fk_servicemanager.return_value = [
+            _service('nova-id', 'nova'),
+            _service('glance-id', 'glance'),
+        ]
+        fk_endpointmanager.return_value = [
+            _endpoint('nova-id', 'RegionOne', 'http://[fd00::1]:8774/v2',
+                      'https://Nova.example.com/v2'),
+            _endpoint('nova-id', 'RegionTwo', 'http://[FD00::2]:8774/v2'),
+            _endpoint('glance-id', 'RegionOne', 'http://10.0.0.1:9292'),
+            _endpoint('glance-id', 'RegionTwo', 'http://10.0.0.1:9292'),
+            _endpoint('unknown-id', 'RegionOne', 'http://10.0.0.3'),
+        ]
+
+        self.assertEqual(
+            [('fd00::1', 'nova-api'),
+             ('fd00::2', 'nova-api'),
+             ('10.0.0.1', 'glance-api')],
+            self.osd.discover_keystone())
+
+        self.osd.region_name = 'RegionOne'
+        self.assertEqual(
+            [('fd00::1', 'nova-api'),
+             ('10.0.0.1', 'glance-api')],
+            self.osd.discover_keystone())
+
+        # Hostnames are kept as is, just like other probes report them.
+        self.osd.interface = 'public'
+        self.assertEqual(
+            [('Nova.example.com', 'nova-api')],
+            self.osd.discover_keystone())
+
+    def _stub_probes(self, **probes):
+        for name, probe in probes.items():
+            patcher = mock.patch.object(self.osd, 'discover_' + name,
+                                        side_effect=probe)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_discover(self):
+        self._stub_probes(
+            keystone=lambda: [('foo', 'nova-api')],
+            nova=lambda: [('foo', 'nova-conductor'), ('bar', 'nova-compute')],
+            neutron=lambda: [('bar', 'neutron-l3')])
+
+        self.assertEqual(
+            {
+                'hosts': {
+                    'foo': [{'name': 'nova-api'}, {'name': 'nova-conductor'}],
+                    'bar': [{'name': 'nova-compute'}, {'name': 'neutron-l3'}],
+                },
+            },
+            self.osd.discover())
+
+    def test_discover_concurrently(self):
+        def _probe():
+            time.sleep(0.5)
+            return []
+
+        self._stub_probes(keystone=_probe, nova=_probe, neutron=_probe)
+
+        # Discovery takes as long as the slowest probe, not the sum of all.
+        started = time.time()
+        self.assertEqual({'hosts': {}}, self.osd.discover())
+        self.assertLess(time.time() - started, 1.2)
+
+    def test_discover_partial_results(self):
+        def _neutron():
+            raise RuntimeError('Service Unavailable')
+
+        self.osd.timeout = 0.2
+        self._stub_probes(
+            keystone=lambda: [('foo', 'nova-api')],
+            nova=lambda: time.sleep(5),
+            neutron=_neutron)
+
+        started = time.time()
+        info = self.osd.discover()
+
+        self.assertLess(time.time() - started, 1)
+        self.assertEqual({'foo': [{'name': 'nova-api'}]}, info['hosts'])
+        self.assertEqual(
+            {
+                'nova': 'Timed out after 0.2 seconds',
+                'neutron': 'RuntimeError: Service Unavailable',
+            },
+            info['errors'])
@@ -0,0 +1,96 @@
+import io
+import json
+import os
+
+import fixtures
+import oslotest.base
+
+from kostyor.common import constants
+from kostyor.inventory import static
+
+
+class StaticInventoryDiscoveryTest(oslotest.base.BaseTestCase):
+
+    records = [
+        {'hostname': 'host-a', 'services': [
+            {'name': 'nova-api', 'version': constants.NEWTON},
+            {'name': 'nova-conductor'},
+        ]},
+        {'hostname': 'host-b', 'services': [
+            {'name': 'nova-compute', 'version': constants.NEWTON},
+        ]},
+        {'hostname': 'host-a', 'services': [
+            {'name': 'nova-api', 'version': constants.NEWTON},
+            {'name': 'nova-scheduler'},
+        ]},
+    ]
+
+    expected = {
+        'host-a': [
+            {'name': 'nova-api', 'version': constants.NEWTON},
+            {'name': 'nova-conductor', 'version': None},
+            {'name': 'nova-scheduler', 'version': None},
+        ],
+        'host-b': [
+            {'name': 'nova-compute', 'version': constants.NEWTON},
+        ],
+    }
+
+    def setUp(self):
+        super(StaticInventoryDiscoveryTest, self).setUp()
+        self.tempdir = self.useFixture(fixtures.TempDir()).path
+
+    def _write(self, filename, content):
+        path = os.path.join(self.tempdir, filename)
+        with io.open(path, 'w', encoding='utf-8') as stream:
+            stream.write(content)
+        return path
+
+    def test_discover_jsonl(self):
+        path = self._write('inventory.jsonl', u'\n'.join(
+            [json.dumps(record) for record in self.records] + [u'']))
+
+        info = static.StaticInventoryDiscovery(
+            path, version=constants.NEWTON).discover()
+
+        self.assertEqual(constants.NEWTON, info['version'])
+        self.assertNotIn('status', info)
+        self.assertEqual(self.expected, info['hosts'])
+        self.assertEqual(['host-a', 'host-b'], list(info['hosts']))
+
+    def test_discover_yaml(self):
+        path = self._write('inventory.yaml', u'''
+---
+hostname: host-a
+services:
+  - {name: nova-api, version: newton}
+  - name: nova-conductor
+---
+hostname: host-b
+services:
+  - {name: nova-compute, version: newton}
+---
+hostname: host-a
+services:
+  - {name: nova-api, version: newton}
+  - {name: nova-scheduler}
+''')
+
+        info = static.StaticInventoryDiscovery(path).discover()
+
+        # Version and status are left to a cluster if not passed.
+        self.assertNotIn('version', info)
+        self.assertNotIn('status', info)
+        self.assertEqual(self.expected, info['hosts'])
+
+    def test_discover_format_is_passed(self):
+        path = self._write('inventory', u'hostname: host-a\n')
+
+        info = static.StaticInventoryDiscovery(path, format='yaml').discover()
+
+        self.assertEqual({'host-a': []}, info['hosts'])
+
+    def test_unsupported_format(self):
+        self.assertRaises(ValueError,
+                          static.StaticInventoryDiscovery,
+                          'inventory.csv', format='csv')
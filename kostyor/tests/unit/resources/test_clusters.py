@@ -3,7 +3,8 @@ import json
 import mock
 import oslotest.base
 
-from kostyor.common import constants
+from kostyor.common import constants, exceptions
+from kostyor.conf import CONF
 from kostyor.rest_api import app
 
 
@@ -37,6 +38,61 @@ class TestClustersEndpoint(oslotest.base.BaseTestCase):
         received = json.loads(resp.get_data(as_text=True))
         self.assertEqual(expected, received)
 
+        # Clusters are listed page by page even if no limit is passed.
+        fake_db_get_clusters.assert_called_once_with(limit=100)
+
+    @mock.patch('kostyor.db.api.get_clusters')
+    def test_get_clusters_filters(self, fake_db_get_clusters):
+        fake_db_get_clusters.return_value = []
+
+        resp = self.app.get(
+            '/clusters?limit=10&marker=11d7f0ab&status=%s&version=%s' % (
+                constants.READY_FOR_UPGRADE, constants.MITAKA))
+        self.assertEqual(200, resp.status_code)
+
+        fake_db_get_clusters.assert_called_once_with(
+            limit=10,
+            marker='11d7f0ab',
+            status=constants.READY_FOR_UPGRADE,
+            version=constants.MITAKA)
+
+    @mock.patch('kostyor.db.api.get_clusters')
+    def test_get_clusters_page_size_configured(self, fake_db_get_clusters):
+        fake_db_get_clusters.return_value = []
+        for option, value in [('default_page_size', 5),
+                              ('max_page_size', 10)]:
+            CONF.set_override(option, value, group='api')
+            self.addCleanup(CONF.clear_override, option, group='api')
+
+        self.assertEqual(200, self.app.get('/clusters').status_code)
+        self.assertEqual(200, self.app.get('/clusters?limit=10').status_code)
+        self.assertEqual(400, self.app.get('/clusters?limit=11').status_code)
+
+        self.assertEqual(
+            [mock.call(limit=5), mock.call(limit=10)],
+            fake_db_get_clusters.call_args_list)
+
+    @mock.patch('kostyor.db.api.get_clusters')
+    def test_get_clusters_wrong_filters(self, fake_db_get_clusters):
+        resp = self.app.get('/clusters?limit=0&version=queens&name=test')
+        self.assertEqual(400, resp.status_code)
+
+        received = json.loads(resp.get_data(as_text=True))
+        self.assertEqual(
+            ['limit', 'name', 'version'], sorted(received['errors']))
+        self.assertFalse(fake_db_get_clusters.called)
+
+    @mock.patch('kostyor.db.api.get_clusters')
+    def test_get_clusters_marker_not_found(self, fake_db_get_clusters):
+        fake_db_get_clusters.side_effect = \
+            exceptions.MarkerNotFound('marker not found')
+
+        resp = self.app.get('/clusters?marker=11d7f0ab')
+        self.assertEqual(400, resp.status_code)
+
+        received = json.loads(resp.get_data(as_text=True))
+        self.assertEqual({'message': 'marker not found'}, received)
+
     @mock.patch('kostyor.db.api.get_cluster')
     def test_get_cluster_status(self, fake_db_get_cluster):
         expected = {'id': '1feef932-e694-48e3-adc9-b85b13a1aa7b',
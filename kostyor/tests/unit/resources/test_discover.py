@@ -4,6 +4,7 @@ import mock
 import oslotest.base
 import stevedore
 
+from kostyor.common import exceptions
 from kostyor.resources import discover
 from kostyor.rest_api import app
 
@@ -32,17 +33,18 @@ class TestDiscoverEndpoint(oslotest.base.BaseTestCase):
         # Class attributes are evaluated only once on module import time.
         # So patching global ExtensionManager above is not enough to make
         # things correct.
-        patcher = mock.patch.dict(
-            discover.Discover._schema,
-            {
-                'method': {
-                    'type': 'string',
-                    'required': True,
-                    'allowed': ext_manager.names(),
-                }
-            })
-        patcher.start()
-        self.addCleanup(patcher.stop)
+        for resource in (discover.Discover, discover.Rediscover):
+            patcher = mock.patch.dict(
+                resource._schema,
+                {
+                    'method': {
+                        'type': 'string',
+                        'required': True,
+                        'allowed': ext_manager.names(),
+                    }
+                })
+            patcher.start()
+            self.addCleanup(patcher.stop)
 
     def test_post_name_is_required(self):
         resp = self.app.post(
@@ -102,14 +104,11 @@ class TestDiscoverEndpoint(oslotest.base.BaseTestCase):
 
         self.assertEqual(expected_error, error)
 
-    @mock.patch(
-        'kostyor.resources.discover.dbapi.discover_cluster', return_value={
-            'name': 'mycluster',
-            'version': 'newton',
-            'status': 'READY FOR UPGRADE',
-        }
-    )
-    def test_post_extension_is_called(self, _):
+    @mock.patch('kostyor.resources.discover.tasks.discover_cluster')
+    def test_post_dispatches_job(self, discover_cluster):
+        discover_cluster.apply_async.return_value = mock.Mock(
+            id='1f5d2e6a-2c7b-4b68-a3d6-0a4b4c1b9c2e', state='PENDING')
+
         resp = self.app.post(
             '/clusters/discover',
             content_type='application/json',
@@ -123,14 +122,22 @@ class TestDiscoverEndpoint(oslotest.base.BaseTestCase):
                 }
             })
         )
-        self.assertEqual(201, resp.status_code)
+        self.assertEqual(202, resp.status_code)
+        self.assertTrue(resp.headers['Location'].endswith(
+            '/clusters/discover/1f5d2e6a-2c7b-4b68-a3d6-0a4b4c1b9c2e'))
+        self.assertEqual(
+            {
+                'id': '1f5d2e6a-2c7b-4b68-a3d6-0a4b4c1b9c2e',
+                'status': 'PENDING',
+                'cluster': None,
+                'error': None,
+            },
+            json.loads(resp.get_data(as_text=True)))
 
-        self.discover_ext.plugin.assert_called_once_with(
-            a=1,
-            b=True,
-            c='something',
-        )
-        self.discover_ext.plugin().discover.assert_called_once_with()
+        discover_cluster.apply_async.assert_called_once_with(
+            args=('test-discover', {'a': 1, 'b': True, 'c': 'something'}),
+            kwargs={'name': 'mycluster'})
+        self.assertFalse(self.discover_ext.plugin.called)
 
     def test_get_methods(self):
         resp = self.app.get(
@@ -141,3 +148,125 @@ class TestDiscoverEndpoint(oslotest.base.BaseTestCase):
 
         received = json.loads(resp.get_data(as_text=True))
         self.assertEqual(['test-discover'], received)
+
+    @mock.patch('kostyor.resources.discover.tasks.discover_cluster')
+    @mock.patch('kostyor.resources.discover.dbapi.get_cluster')
+    def test_post_rediscover(self, get_cluster, discover_cluster):
+        discover_cluster.apply_async.return_value = mock.Mock(
+            id='1f5d2e6a-2c7b-4b68-a3d6-0a4b4c1b9c2e', state='PENDING')
+
+        resp = self.app.post(
+            '/clusters/a3bf1a8c-7b42-4c2d-b1fd-4c6ee4bc2a6b/discover',
+            content_type='application/json',
+            data=json.dumps({
+                'method': 'test-discover',
+                'parameters': {'a': 1},
+            })
+        )
+        self.assertEqual(202, resp.status_code)
+        self.assertEqual(
+            '1f5d2e6a-2c7b-4b68-a3d6-0a4b4c1b9c2e',
+            json.loads(resp.get_data(as_text=True))['id'])
+
+        get_cluster.assert_called_once_with(
+            'a3bf1a8c-7b42-4c2d-b1fd-4c6ee4bc2a6b')
+        discover_cluster.apply_async.assert_called_once_with(
+            args=('test-discover', {'a': 1}),
+            kwargs={'cluster_id': 'a3bf1a8c-7b42-4c2d-b1fd-4c6ee4bc2a6b'})
+
+    def test_post_rediscover_method_is_required(self):
+        resp = self.app.post(
+            '/clusters/a3bf1a8c-7b42-4c2d-b1fd-4c6ee4bc2a6b/discover',
+            content_type='application/json',
+            data=json.dumps({})
+        )
+        self.assertEqual(400, resp.status_code)
+
+        error = json.loads(resp.get_data(as_text=True))
+        expected_error = {
+            'message': 'Cannot rediscover a cluster, passed data are '
+                       'incorrect. See "errors" attribute for details.',
+            'errors': {'method': ['required field']},
+        }
+
+        self.assertEqual(expected_error, error)
+
+    @mock.patch('kostyor.resources.discover.tasks.discover_cluster')
+    @mock.patch(
+        'kostyor.resources.discover.dbapi.get_cluster',
+        side_effect=exceptions.ClusterNotFound('Cluster not found.'))
+    def test_post_rediscover_cluster_not_found(self, _, discover_cluster):
+        resp = self.app.post(
+            '/clusters/does-not-exist/discover',
+            content_type='application/json',
+            data=json.dumps({'method': 'test-discover'})
+        )
+        self.assertEqual(404, resp.status_code)
+        self.assertEqual(
+            {'message': 'Cluster not found.'},
+            json.loads(resp.get_data(as_text=True)))
+        self.assertFalse(discover_cluster.apply_async.called)
+
+
+class TestDiscoverJobEndpoint(oslotest.base.BaseTestCase):
+
+    def setUp(self):
+        super(TestDiscoverJobEndpoint, self).setUp()
+        self.app = app.test_client()
+
+        patcher = mock.patch('kostyor.resources.discover.AsyncResult')
+        self.addCleanup(patcher.stop)
+        self.result = patcher.start().return_value
+        self.result.successful.return_value = False
+        self.result.failed.return_value = False
+
+    def _get(self, job_id):
+        resp = self.app.get('/clusters/discover/%s' % job_id)
+        self.assertEqual(200, resp.status_code)
+        return json.loads(resp.get_data(as_text=True))
+
+    def test_get_in_progress(self):
+        self.result.state = 'DISCOVERING'
+
+        self.assertEqual(
+            {
+                'id': 'job-id',
+                'status': 'DISCOVERING',
+                'cluster': None,
+                'error': None,
+            },
+            self._get('job-id'))
+
+    def test_get_succeeded(self):
+        self.result.state = 'SUCCESS'
+        self.result.successful.return_value = True
+        self.result.result = {
+            'id': 'a3bf1a8c-7b42-4c2d-b1fd-4c6ee4bc2a6b',
+            'name': 'mycluster',
+            'version': 'newton',
+            'status': 'READY FOR UPGRADE',
+        }
+
+        self.assertEqual(
+            {
+                'id': 'job-id',
+                'status': 'SUCCESS',
+                'cluster': self.result.result,
+                'error': None,
+            },
+            self._get('job-id'))
+
+    def test_get_failed(self):
+        self.result.state = 'FAILURE'
+        self.result.failed.return_value = True
+        self.result.result = exceptions.UpgradeIsInProgress(
+            'Cluster is being upgraded.')
+
+        self.assertEqual(
+            {
+                'id': 'job-id',
+                'status': 'FAILURE',
+                'cluster': None,
+                'error': 'Cluster is being upgraded.',
+            },
+            self._get('job-id'))
@@ -0,0 +1,70 @@
+import json
+
+import mock
+import oslotest.base
+
+from kostyor.common import exceptions
+from kostyor.rest_api import app
+
+
+class TestPlanEndpoint(oslotest.base.BaseTestCase):
+
+    def setUp(self):
+        super(TestPlanEndpoint, self).setUp()
+        self.app = app.test_client()
+
+    @mock.patch('kostyor.db.api.get_cluster_topology')
+    def test_get_plan(self, fake_get_cluster_topology):
+        fake_get_cluster_topology.return_value = (
+            [
+                {'id': 'host-1', 'hostname': 'ctrl-1',
+                 'services': ['service-1', 'service-2']},
+                {'id': 'host-2', 'hostname': 'ctrl-2',
+                 'services': ['service-3']},
+            ],
+            [
+                {'id': 'service-1', 'name': 'keystone-wsgi-admin'},
+                {'id': 'service-2', 'name': 'heat-api'},
+                {'id': 'service-3', 'name': 'aodh-api'},
+            ],
+        )
+
+        resp = self.app.get('/clusters/1234/plan')
+        self.assertEqual(200, resp.status_code)
+
+        received = json.loads(resp.get_data(as_text=True))
+        self.assertEqual({
+            'stages': [
+                [
+                    {'service': 'keystone-wsgi-admin',
+                     'service_id': 'service-1',
+                     'host': 'ctrl-1',
+                     'host_id': 'host-1'},
+                ],
+                [
+                    {'service': 'heat-api',
+                     'service_id': 'service-2',
+                     'host': 'ctrl-1',
+                     'host_id': 'host-1'},
+                    {'service': 'aodh-api',
+                     'service_id': 'service-3',
+                     'host': 'ctrl-2',
+                     'host_id': 'host-2'},
+                ],
+            ],
+            'steps': 3,
+            'critical_path_length': 2,
+        }, received)
+
+        fake_get_cluster_topology.assert_called_once_with('1234')
+
+    @mock.patch('kostyor.db.api.get_cluster_topology')
+    def test_get_plan_cluster_not_found(self, fake_get_cluster_topology):
+        fake_get_cluster_topology.side_effect = \
+            exceptions.ClusterNotFound('cluster not found')
+
+        resp = self.app.get('/clusters/1234/plan')
+        self.assertEqual(404, resp.status_code)
+
+        received = json.loads(resp.get_data(as_text=True))
+        self.assertEqual({'message': 'cluster not found'}, received)
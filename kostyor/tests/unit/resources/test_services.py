@@ -12,17 +12,10 @@ class TestServicesEndpoint(oslotest.base.BaseTestCase):
     def setUp(self):
         super(TestServicesEndpoint, self).setUp()
         self.app = app.test_client()
-        self.fake_host = {
-            'id': '1111',
-            'hostname': 'hostname_1',
-            'cluster_id': '1234'
-        }
 
-    @mock.patch('kostyor.db.api.get_services_by_host')
-    @mock.patch('kostyor.db.api.get_hosts_by_cluster')
+    @mock.patch('kostyor.db.api.get_services_by_cluster')
     def test_service_list_cluster_exists_success(self,
-                                                 get_hosts_by_cluster,
-                                                 get_services_by_host):
+                                                 get_services_by_cluster):
         fake_nova_api = {
             'id': 'nova-api-3333',
             'name': 'nova-api',
@@ -32,8 +25,8 @@ class TestServicesEndpoint(oslotest.base.BaseTestCase):
         fake_keystone_api = fake_nova_api.copy()
         fake_keystone_api['id'] = 'keystone-api-4444'
         fake_keystone_api['name'] = 'keystone-api'
-        get_hosts_by_cluster.return_value = [self.fake_host]
-        get_services_by_host.return_value = [fake_nova_api, fake_keystone_api]
+        get_services_by_cluster.return_value = [fake_keystone_api,
+                                                fake_nova_api]
 
         resp = self.app.get('/clusters/1234/services')
         self.assertEqual(200, resp.status_code)
@@ -41,15 +34,12 @@ class TestServicesEndpoint(oslotest.base.BaseTestCase):
         received = json.loads(resp.get_data(as_text=True))
         self.assertEqual([fake_keystone_api, fake_nova_api], received)
 
-        get_hosts_by_cluster.assert_called_once_with('1234')
-        get_services_by_host.assert_called_once_with('1111')
+        get_services_by_cluster.assert_called_once_with('1234')
 
-    @mock.patch('kostyor.db.api.get_services_by_host')
-    @mock.patch('kostyor.db.api.get_hosts_by_cluster')
+    @mock.patch('kostyor.db.api.get_services_by_cluster')
     def test_service_list_wrong_cluster_id_404(self,
-                                               get_hosts_by_cluster,
-                                               get_services_by_host):
-        get_hosts_by_cluster.side_effect = \
+                                               get_services_by_cluster):
+        get_services_by_cluster.side_effect = \
             exceptions.ClusterNotFound('cluster not found')
 
         resp = self.app.get('/clusters/fake/services')
@@ -59,5 +49,4 @@ class TestServicesEndpoint(oslotest.base.BaseTestCase):
         error = {'message': 'cluster not found'}
         self.assertEqual(error, received)
 
-        get_hosts_by_cluster.assert_called_once_with('fake')
-        self.assertFalse(get_services_by_host.called)
+        get_services_by_cluster.assert_called_once_with('fake')
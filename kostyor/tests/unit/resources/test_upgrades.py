@@ -8,6 +8,7 @@ import stevedore
 from kostyor.common import constants, exceptions
 from kostyor.rest_api import app
 from kostyor.resources import Upgrade
+from kostyor.resources import upgrades
 
 
 class TestUpgradesEndpoint(oslotest.base.BaseTestCase):
@@ -68,7 +69,54 @@ class TestUpgradesEndpoint(oslotest.base.BaseTestCase):
         for exp, rec in zip(expected, received):
             self._assert_upgrades(exp, rec)
 
-        fake_db_get_upgrades.assert_called_once_with()
+        # Upgrades are listed page by page even if no limit is passed.
+        fake_db_get_upgrades.assert_called_once_with(limit=100)
+
+    @mock.patch('kostyor.db.api.get_upgrades')
+    def test_get_upgrades_filters(self, fake_db_get_upgrades):
+        fake_db_get_upgrades.return_value = []
+
+        resp = self.app.get(
+            '/upgrades?cluster_id=%s&limit=20&marker=%s&status=%s'
+            '&from_version=%s&to_version=%s'
+            '&started_after=2017-01-01T10:00:00Z'
+            '&started_before=2017-01-31T12:00:00%%2B02:00' % (
+                self.fake_upgrade['cluster_id'],
+                self.fake_upgrade['id'],
+                constants.UPGRADE_PAUSED,
+                constants.MITAKA,
+                constants.NEWTON))
+        self.assertEqual(200, resp.status_code)
+
+        fake_db_get_upgrades.assert_called_once_with(
+            cluster_id=self.fake_upgrade['cluster_id'],
+            limit=20,
+            marker=self.fake_upgrade['id'],
+            status=constants.UPGRADE_PAUSED,
+            from_version=constants.MITAKA,
+            to_version=constants.NEWTON,
+            started_after=datetime.datetime(2017, 1, 1, 10, 0),
+            started_before=datetime.datetime(2017, 1, 31, 10, 0))
+
+    @mock.patch('kostyor.db.api.get_upgrades')
+    def test_get_upgrades_limit_too_large(self, fake_db_get_upgrades):
+        resp = self.app.get('/upgrades?limit=1001')
+        self.assertEqual(400, resp.status_code)
+
+        received = json.loads(resp.get_data(as_text=True))
+        self.assertEqual(['limit'], sorted(received['errors']))
+        self.assertFalse(fake_db_get_upgrades.called)
+
+    @mock.patch('kostyor.db.api.get_upgrades')
+    def test_get_upgrades_wrong_filters(self, fake_db_get_upgrades):
+        resp = self.app.get(
+            '/upgrades?limit=many&status=running&started_after=yesterday')
+        self.assertEqual(400, resp.status_code)
+
+        received = json.loads(resp.get_data(as_text=True))
+        self.assertEqual(
+            ['limit', 'started_after', 'status'], sorted(received['errors']))
+        self.assertFalse(fake_db_get_upgrades.called)
 
     @mock.patch('kostyor.db.api.get_upgrade')
     def test_get_upgrade(self, fake_db_get_upgrade):
@@ -113,6 +161,8 @@ class TestUpgradesEndpoint(oslotest.base.BaseTestCase):
         fake_create_upgrade.assert_called_once_with(
             self.fake_upgrade['cluster_id'],
             constants.NEWTON,
+            driver='noop',
+            parameters={},
         )
         self.engine_ext.plugin.assert_called_once_with(
             self.fake_upgrade,
@@ -188,6 +238,8 @@ class TestUpgradesEndpoint(oslotest.base.BaseTestCase):
         fake_createupgrade.assert_called_once_with(
             self.fake_upgrade['cluster_id'],
             constants.NEWTON,
+            driver='noop',
+            parameters={},
         )
         self.engine_ext.plugin.assert_called_once_with(
             self.fake_upgrade,
@@ -289,6 +341,23 @@ class TestUpgradesEndpoint(oslotest.base.BaseTestCase):
         }
         self.assertEqual(expected_error, error)
 
+    @mock.patch('kostyor.db.api.create_cluster_upgrade')
+    def test_post_upgrades_invalid_batch_size(self, fake_create_upgrade):
+        resp = self.app.post(
+            '/upgrades',
+            content_type='application/json',
+            data=json.dumps({
+                'cluster_id': self.fake_upgrade['cluster_id'],
+                'to_version': constants.NEWTON,
+                'parameters': {'batch_size': 'lots'},
+            })
+        )
+        self.assertEqual(400, resp.status_code)
+
+        # The cluster must not be left in upgrade in progress state.
+        self.assertFalse(fake_create_upgrade.called)
+        self.assertFalse(self.engine_ext.plugin.called)
+
     @mock.patch('kostyor.db.api.get_cluster')
     @mock.patch('kostyor.db.api.create_cluster_upgrade')
     def test_post_upgrades_params(self, fake_create_upgrade, _):
@@ -315,6 +384,8 @@ class TestUpgradesEndpoint(oslotest.base.BaseTestCase):
         fake_create_upgrade.assert_called_once_with(
             self.fake_upgrade['cluster_id'],
             constants.NEWTON,
+            driver='noop',
+            parameters={'x': 42, 'y': 'do nothing at all'},
         )
         self.assertEqual({
             'x': 42,
@@ -443,3 +514,97 @@ class TestUpgradesEndpoint(oslotest.base.BaseTestCase):
             'errors': {'action': [u'unallowed value unsupported']},
         }
         self.assertEqual(error, received)
+
+    @mock.patch('kostyor.upgrades.engines.resume')
+    @mock.patch('kostyor.db.api.continue_cluster_upgrade')
+    @mock.patch('kostyor.db.api.get_upgrade_by_cluster')
+    def test_continue_cluster_upgrade(self, fake_get_upgrade,
+                                      fake_continue_upgrade, fake_resume):
+        upgrade = dict(self.fake_upgrade,
+                       status=constants.UPGRADE_PAUSED,
+                       driver='noop',
+                       parameters={'x': 42})
+        fake_get_upgrade.return_value = upgrade
+        fake_continue_upgrade.return_value = self.fake_upgrade
+
+        result = upgrades.continue_cluster_upgrade(upgrade['cluster_id'])
+
+        self.assertEqual(self.fake_upgrade, result)
+        fake_continue_upgrade.assert_called_once_with(upgrade['cluster_id'])
+        fake_resume.assert_called_once_with(upgrade, mock.ANY)
+        self.assertEqual({'x': 42}, fake_resume.call_args[0][1].parameters)
+
+    @mock.patch('kostyor.upgrades.engines.resume')
+    @mock.patch('kostyor.db.api.continue_cluster_upgrade')
+    @mock.patch('kostyor.db.api.get_upgrade_by_cluster')
+    def test_continue_cluster_upgrade_in_progress(self, fake_get_upgrade,
+                                                  fake_continue_upgrade,
+                                                  fake_resume):
+        fake_get_upgrade.return_value = self.fake_upgrade
+
+        self.assertRaises(
+            exceptions.UpgradeIsInProgress,
+            upgrades.continue_cluster_upgrade,
+            self.fake_upgrade['cluster_id'])
+
+        self.assertFalse(fake_continue_upgrade.called)
+        self.assertFalse(fake_resume.called)
+
+    @mock.patch('kostyor.upgrades.engines.resume')
+    @mock.patch('kostyor.db.api.continue_cluster_upgrade')
+    @mock.patch('kostyor.db.api.get_upgrade_by_cluster')
+    def test_continue_cluster_upgrade_not_paused(self, fake_get_upgrade,
+                                                 fake_continue_upgrade,
+                                                 fake_resume):
+        for status in (constants.UPGRADE_CANCELLED,
+                       constants.UPGRADE_SUCCEED):
+            fake_get_upgrade.return_value = dict(self.fake_upgrade,
+                                                 status=status)
+
+            self.assertRaises(
+                exceptions.UpgradeIsNotPaused,
+                upgrades.continue_cluster_upgrade,
+                self.fake_upgrade['cluster_id'])
+
+        self.assertFalse(fake_continue_upgrade.called)
+        self.assertFalse(fake_resume.called)
+
+    @mock.patch('kostyor.upgrades.engines.stop')
+    @mock.patch('kostyor.db.api.pause_cluster_upgrade')
+    @mock.patch('kostyor.db.api.get_upgrade_by_cluster')
+    def test_pause_cluster_upgrade(self, fake_get_upgrade,
+                                   fake_pause_upgrade, fake_stop):
+        fake_get_upgrade.return_value = self.fake_upgrade
+        fake_pause_upgrade.return_value = self.fake_upgrade
+
+        result = upgrades.pause_cluster_upgrade(
+            self.fake_upgrade['cluster_id'])
+
+        self.assertEqual(self.fake_upgrade, result)
+        fake_pause_upgrade.assert_called_once_with(
+            self.fake_upgrade['cluster_id'])
+        fake_stop.assert_called_once_with(self.fake_upgrade)
+
+    @mock.patch('kostyor.upgrades.engines.stop')
+    @mock.patch('kostyor.db.api.cancel_cluster_upgrade')
+    @mock.patch('kostyor.db.api.get_upgrade_by_cluster')
+    def test_cancel_cluster_upgrade(self, fake_get_upgrade,
+                                    fake_cancel_upgrade, fake_stop):
+        fake_get_upgrade.return_value = self.fake_upgrade
+        fake_cancel_upgrade.return_value = self.fake_upgrade
+
+        calls = mock.Mock()
+        calls.attach_mock(fake_cancel_upgrade, 'cancel')
+        calls.attach_mock(fake_stop, 'stop')
+
+        result = upgrades.cancel_cluster_upgrade(
+            self.fake_upgrade['cluster_id'])
+
+        self.assertEqual(self.fake_upgrade, result)
+
+        # Tasks are stopped only once the upgrade is cancelled, so steps
+        # completed meanwhile don't send next ones.
+        self.assertEqual(
+            [mock.call.cancel(self.fake_upgrade['cluster_id']),
+             mock.call.stop(self.fake_upgrade, abort=True)],
+            calls.mock_calls)
@@ -17,6 +17,9 @@ class TestRpcApp(oslotest.base.BaseTestCase):
         expected_tasks = [
             'kostyor.rpc.tasks.noop.noop',
             'kostyor.rpc.tasks.execute.execute',
+            'kostyor.rpc.tasks.execute.execute_many',
+            'kostyor.rpc.tasks.steps.complete_step',
+            'kostyor.rpc.tasks.discovery.discover_cluster',
         ]
 
         self.assertTrue(set(expected_tasks).issubset(app.tasks))
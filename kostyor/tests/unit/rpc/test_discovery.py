@@ -0,0 +1,64 @@
+import mock
+import oslotest.base
+
+from kostyor.rpc.tasks import discover_cluster
+
+
+class TestDiscoverCluster(oslotest.base.BaseTestCase):
+
+    info = {
+        'version': 'newton',
+        'hosts': {'host-a': [{'name': 'nova-api'}]},
+    }
+
+    def setUp(self):
+        super(TestDiscoverCluster, self).setUp()
+
+        patcher = mock.patch('kostyor.rpc.tasks.discovery.dbapi')
+        self.addCleanup(patcher.stop)
+        self.dbapi = patcher.start()
+
+        patcher = mock.patch('kostyor.rpc.tasks.discovery.topology')
+        self.addCleanup(patcher.stop)
+        self.topology = patcher.start()
+
+        patcher = mock.patch('stevedore.driver.DriverManager')
+        self.addCleanup(patcher.stop)
+        self.manager = patcher.start()
+        self.manager.return_value.driver.discover.return_value = self.info
+
+        patcher = mock.patch.object(discover_cluster, 'update_state')
+        self.addCleanup(patcher.stop)
+        self.update_state = patcher.start()
+
+    def _discover_cluster(self, *args, **kwargs):
+        return discover_cluster.apply(
+            args=args, kwargs=kwargs, throw=True).result
+
+    def test_discover_cluster(self):
+        result = self._discover_cluster('openstack', {'a': 1}, name='test')
+
+        self.assertEqual(self.dbapi.discover_cluster.return_value, result)
+        self.manager.assert_called_once_with(
+            namespace='kostyor.discovery_drivers',
+            name='openstack',
+            invoke_on_load=True,
+            invoke_kwds={'a': 1})
+        self.dbapi.discover_cluster.assert_called_once_with('test', self.info)
+        self.assertFalse(self.dbapi.rediscover_cluster.called)
+        self.assertFalse(self.topology.invalidate.called)
+        self.dbapi.shutdown_session.assert_called_once_with()
+        self.assertEqual(
+            [mock.call(state='DISCOVERING'), mock.call(state='STORING')],
+            self.update_state.call_args_list)
+
+    def test_rediscover_cluster(self):
+        result = self._discover_cluster('openstack', {}, cluster_id='id')
+
+        self.assertEqual(self.dbapi.rediscover_cluster.return_value, result)
+        self.dbapi.rediscover_cluster.assert_called_once_with(
+            'id', self.info)
+        self.assertFalse(self.dbapi.discover_cluster.called)
+
+        # Workers may have cached hosts that have been moved or gone.
+        self.topology.invalidate.assert_called_once_with()
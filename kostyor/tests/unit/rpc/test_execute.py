@@ -0,0 +1,214 @@
+import os
+import subprocess
+import sys
+import time
+
+import fixtures
+import mock
+import oslotest.base
+
+from kostyor.common import exceptions
+from kostyor.conf import CONF
+from kostyor.rpc import topology
+from kostyor.rpc.tasks import execute, execute_many
+
+
+# The module is shadowed by the task of the same name in the package.
+execute_module = sys.modules['kostyor.rpc.tasks.execute']
+
+
+class TestExecute(oslotest.base.BaseTestCase):
+
+    def setUp(self):
+        super(TestExecute, self).setUp()
+
+        patcher = mock.patch.object(execute, 'is_aborted', return_value=False)
+        self.addCleanup(patcher.stop)
+        self.is_aborted = patcher.start()
+
+        self.log_dir = os.path.join(
+            self.useFixture(fixtures.TempDir()).path, 'logs')
+        CONF.set_override('log_dir', self.log_dir, group='execute')
+        self.addCleanup(CONF.clear_override, 'log_dir', group='execute')
+
+    def _execute(self, *args, **kwargs):
+        return execute.apply(
+            args=args, kwargs=kwargs, task_id='fake-task', throw=True).result
+
+    def test_execute(self):
+        result = self._execute(['sh', '-c', 'echo out; echo err >&2'])
+
+        self.assertEqual(0, result['returncode'])
+        self.assertEqual('out\nerr\n', result['output'])
+        self.assertEqual(os.path.join(self.log_dir, 'fake-task.log'),
+                         result['log'])
+
+        with open(result['log']) as log:
+            self.assertEqual('out\nerr\n', log.read())
+
+    def test_execute_output_tail(self):
+        CONF.set_override('output_tail_lines', 3, group='execute')
+        self.addCleanup(CONF.clear_override, 'output_tail_lines',
+                        group='execute')
+
+        result = self._execute(['seq', '1000'])
+
+        self.assertEqual('998\n999\n1000\n', result['output'])
+        with open(result['log']) as log:
+            self.assertEqual(
+                ''.join('%d\n' % i for i in range(1, 1001)), log.read())
+
+    def test_execute_no_log_dir(self):
+        CONF.set_override('log_dir', '', group='execute')
+
+        result = self._execute(['echo', 'out'])
+
+        self.assertEqual('out\n', result['output'])
+        self.assertIsNone(result['log'])
+        self.assertFalse(os.path.exists(self.log_dir))
+
+    def test_execute_failed(self):
+        exc = self.assertRaises(subprocess.CalledProcessError,
+                                self._execute,
+                                ['sh', '-c', 'echo failed; exit 1'])
+        self.assertEqual('failed\n', exc.output)
+
+    def test_execute_failed_ignore_errors(self):
+        result = self._execute(['false'], ignore_errors=True)
+        self.assertEqual(1, result['returncode'])
+
+    def test_execute_exit_is_noticed_immediately(self):
+        started = time.time()
+        self._execute(['sleep', '0.1'])
+
+        # The process exit must not wait for the next abort check.
+        self.assertLess(time.time() - started,
+                        execute_module.ABORT_CHECK_INTERVAL)
+        self.assertFalse(self.is_aborted.called)
+
+    @mock.patch.object(execute_module, 'ABORT_CHECK_INTERVAL', 0.1)
+    def test_execute_aborted(self):
+        self.is_aborted.return_value = True
+
+        started = time.time()
+        result = self._execute(['sleep', '30'])
+
+        self.assertIsNone(result['returncode'])
+        self.assertLess(time.time() - started, 5)
+
+    def test_execute_timeout(self):
+        started = time.time()
+        self.assertRaises(execute_module.ExecutionTimedOut,
+                          self._execute, ['sleep', '30'], timeout=0.2)
+        self.assertLess(time.time() - started, 5)
+        self.assertFalse(self.is_aborted.called)
+
+
+class TestExecuteMany(oslotest.base.BaseTestCase):
+
+    hosts = [{'hostname': 'host-%d' % i} for i in range(1, 6)]
+
+    def setUp(self):
+        super(TestExecuteMany, self).setUp()
+
+        patcher = mock.patch.object(
+            execute_many, 'is_aborted', return_value=False)
+        self.addCleanup(patcher.stop)
+        self.is_aborted = patcher.start()
+
+        self.log_dir = self.useFixture(fixtures.TempDir()).path
+        CONF.set_override('log_dir', self.log_dir, group='execute')
+        self.addCleanup(CONF.clear_override, 'log_dir', group='execute')
+
+    def _execute_many(self, *args, **kwargs):
+        return execute_many.apply(
+            args=args, kwargs=kwargs, task_id='fake-task', throw=True).result
+
+    def test_execute_many(self):
+        results = self._execute_many(['echo', 'upgrade {hostname}'],
+                                     self.hosts)
+
+        self.assertEqual(
+            {
+                host['hostname']: {
+                    'returncode': 0,
+                    'output': 'upgrade %s\n' % host['hostname'],
+                    'log': os.path.join(
+                        self.log_dir, 'fake-task', host['hostname'] + '.log'),
+                }
+                for host in self.hosts
+            },
+            results)
+
+    def test_execute_many_references(self):
+        hosts = [dict(host, id='id-%d' % i)
+                 for i, host in enumerate(self.hosts)]
+        load = mock.Mock(return_value=hosts)
+        cache = topology.TopologyCache(load, exceptions.HostNotFound)
+
+        with mock.patch.object(topology, 'hosts', cache):
+            results = self._execute_many(
+                ['echo', '{hostname}'], [host['id'] for host in hosts])
+
+        self.assertEqual(
+            sorted(host['hostname'] for host in self.hosts), sorted(results))
+        self.assertEqual(1, load.call_count)
+
+    def test_execute_many_concurrently(self):
+        started = time.time()
+        self._execute_many(['sleep', '0.5'], self.hosts, concurrency=5)
+
+        self.assertLess(time.time() - started, 2)
+
+    def test_execute_many_concurrency_is_bounded(self):
+        with mock.patch.object(execute_module, 'ThreadPool',
+                               wraps=execute_module.ThreadPool) as pool:
+            self._execute_many(['true'], self.hosts, concurrency=2)
+        pool.assert_called_once_with(2)
+
+    def test_execute_many_no_hosts(self):
+        self.assertEqual({}, self._execute_many(['true'], []))
+
+    def test_execute_many_failed(self):
+        exc = self.assertRaises(
+            execute_module.ExecutionFailed,
+            self._execute_many,
+            ['sh', '-c', 'test {hostname} != host-2 -a {hostname} != host-4'],
+            self.hosts)
+        self.assertIn('host-2, host-4', str(exc))
+
+    def test_execute_many_failed_ignore_errors(self):
+        results = self._execute_many(
+            ['sh', '-c', 'test {hostname} != host-2'],
+            self.hosts, ignore_errors=True)
+
+        self.assertEqual(
+            {'host-1': 0, 'host-2': 1, 'host-3': 0, 'host-4': 0, 'host-5': 0},
+            {hostname: result['returncode']
+             for hostname, result in results.items()})
+
+    def test_execute_many_timeout(self):
+        results = self._execute_many(
+            ['sh', '-c', 'test {hostname} = host-1 || sleep 30'],
+            self.hosts, ignore_errors=True, timeout=0.2)
+
+        self.assertEqual(
+            {'host-1': 0, 'host-2': None, 'host-3': None, 'host-4': None,
+             'host-5': None},
+            {hostname: result['returncode']
+             for hostname, result in results.items()})
+
+    @mock.patch.object(execute_module, 'ABORT_CHECK_INTERVAL', 0.1)
+    def test_execute_many_aborted(self):
+        self.is_aborted.return_value = True
+
+        started = time.time()
+        results = self._execute_many(['sleep', '30'], self.hosts,
+                                     concurrency=2)
+
+        self.assertLess(time.time() - started, 5)
+        self.assertEqual(
+            [None, None],
+            [result['returncode']
+             for result in results.values() if result is not None])
+        self.assertEqual(3, list(results.values()).count(None))
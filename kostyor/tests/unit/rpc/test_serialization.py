@@ -0,0 +1,60 @@
+import datetime
+
+import oslotest.base
+import pytz
+
+from kombu import serialization as kombu_serialization
+
+from kostyor.common import constants
+from kostyor.rpc import serialization
+from kostyor.rpc import tasks
+from kostyor.rpc.app import app  # noqa, registers serializers
+
+
+class TestMsgpackSerializer(oslotest.base.BaseTestCase):
+
+    def _roundtrip(self, obj, serializer='msgpack'):
+        content_type, encoding, data = kombu_serialization.dumps(
+            obj, serializer=serializer)
+        return kombu_serialization.loads(
+            data, content_type, encoding,
+            accept=kombu_serialization.prepare_accept_content([serializer]))
+
+    def test_upgrade(self):
+        upgrade = {
+            'id': 'd174522c-95fc-4996-8dfa-0c2405a3b0c1',
+            'status': constants.UPGRADE_IN_PROGRESS,
+            'upgrade_start_time': datetime.datetime(2017, 1, 2, 3, 4, 5, 6),
+            'upgrade_end_time': None,
+            'parameters': {'batch_size': '10%'},
+        }
+
+        self.assertEqual(upgrade, self._roundtrip(upgrade))
+
+    def test_aware_datetime(self):
+        value = pytz.timezone('Europe/Kiev').localize(
+            datetime.datetime(2017, 1, 2, 3, 4, 5))
+
+        result = self._roundtrip([value])[0]
+
+        self.assertEqual(value, result)
+        self.assertEqual(pytz.utc, result.tzinfo)
+
+    def test_signature(self):
+        signature = tasks.execute_many.si(
+            ['echo', '{hostname}'], [{'id': 'host-1', 'hostname': 'host-1'}])
+
+        # Tasks receive exactly what they'd receive with JSON.
+        self.assertEqual(self._roundtrip(signature, 'json'),
+                         self._roundtrip(signature))
+
+    def test_unsupported_type(self):
+        self.assertRaises(TypeError, serialization.dumps, object())
+
+    def test_unknown_extension(self):
+        import msgpack
+
+        data = msgpack.packb(msgpack.ExtType(42, b'foo'))
+
+        self.assertEqual(msgpack.ExtType(42, b'foo'),
+                         serialization.loads(data))
@@ -0,0 +1,73 @@
+import mock
+import oslotest.base
+
+from kostyor.common import constants
+from kostyor.rpc.tasks import complete_step, fail_step
+
+
+class TestCompleteStep(oslotest.base.BaseTestCase):
+
+    def setUp(self):
+        super(TestCompleteStep, self).setUp()
+
+        patcher = mock.patch('kostyor.rpc.tasks.steps.dbapi')
+        self.addCleanup(patcher.stop)
+        self.dbapi = patcher.start()
+
+        patcher = mock.patch('kostyor.upgrades.engines.advance')
+        self.addCleanup(patcher.stop)
+        self.advance = patcher.start()
+
+    def test_complete_step(self):
+        upgrade = {'id': 'upgrade', 'status': constants.UPGRADE_IN_PROGRESS}
+        self.dbapi.complete_upgrade_steps.return_value = upgrade
+
+        complete_step.apply(args=('step-1', 'step-2'), throw=True)
+
+        self.dbapi.complete_upgrade_steps.assert_called_once_with(
+            ('step-1', 'step-2'))
+        self.advance.assert_called_once_with(upgrade)
+        self.dbapi.shutdown_session.assert_called_once_with()
+
+    def test_complete_step_upgrade_paused(self):
+        self.dbapi.complete_upgrade_steps.return_value = {
+            'id': 'upgrade', 'status': constants.UPGRADE_PAUSED}
+
+        complete_step.apply(args=('step',), throw=True)
+
+        self.assertFalse(self.advance.called)
+        self.dbapi.shutdown_session.assert_called_once_with()
+
+
+class TestFailStep(oslotest.base.BaseTestCase):
+
+    def setUp(self):
+        super(TestFailStep, self).setUp()
+
+        patcher = mock.patch('kostyor.rpc.tasks.steps.dbapi')
+        self.addCleanup(patcher.stop)
+        self.dbapi = patcher.start()
+
+        patcher = mock.patch('kostyor.upgrades.engines.advance')
+        self.addCleanup(patcher.stop)
+        self.advance = patcher.start()
+
+    def test_fail_step(self):
+        upgrade = {'id': 'upgrade', 'status': constants.UPGRADE_IN_PROGRESS}
+        self.dbapi.fail_upgrade_steps.return_value = upgrade
+
+        fail_step.apply(args=('step-1', 'step-2'), throw=True)
+
+        self.dbapi.fail_upgrade_steps.assert_called_once_with(
+            ('step-1', 'step-2'))
+        self.advance.assert_called_once_with(upgrade)
+        self.dbapi.shutdown_session.assert_called_once_with()
+
+    def test_fail_step_upgrade_cancelled(self):
+        self.dbapi.fail_upgrade_steps.return_value = {
+            'id': 'upgrade', 'status': constants.UPGRADE_CANCELLED}
+
+        fail_step.apply(args=('step',), throw=True)
+
+        self.assertFalse(self.advance.called)
+        self.dbapi.shutdown_session.assert_called_once_with()
@@ -0,0 +1,95 @@
+import mock
+import oslotest.base
+
+from kostyor.common import exceptions
+from kostyor.conf import CONF
+from kostyor.rpc import topology
+
+
+class TestTopologyCache(oslotest.base.BaseTestCase):
+
+    hosts = [{'id': 'host-%d' % i, 'hostname': 'host-%d' % i}
+             for i in range(1, 6)]
+
+    def setUp(self):
+        super(TestTopologyCache, self).setUp()
+
+        hosts = {host['id']: host for host in self.hosts}
+        self.load = mock.Mock(side_effect=lambda ids: [
+            hosts[id_] for id_ in ids if id_ in hosts])
+        self.cache = topology.TopologyCache(
+            self.load, exceptions.HostNotFound)
+
+    def test_get(self):
+        self.assertEqual(
+            [self.hosts[2], self.hosts[0]],
+            self.cache.get(['host-3', 'host-1']))
+        self.assertEqual(
+            [self.hosts[0], self.hosts[1]],
+            self.cache.get(['host-1', 'host-2']))
+
+        # Only missing hosts are loaded, all at once.
+        self.assertEqual(
+            [['host-1', 'host-3'], ['host-2']],
+            [sorted(call[0][0]) for call in self.load.call_args_list])
+
+    def test_get_objects_pass_through(self):
+        host = {'id': 'host-9', 'hostname': 'host-9'}
+
+        self.assertEqual(
+            [host, self.hosts[0]], self.cache.get([host, 'host-1']))
+        self.load.assert_called_once_with(['host-1'])
+
+    def test_get_not_found(self):
+        exc = self.assertRaises(exceptions.HostNotFound,
+                                self.cache.get, ['host-1', 'foo', 'bar'])
+
+        self.assertEqual('bar, foo', str(exc))
+
+    def test_least_recently_used_evicted(self):
+        CONF.set_override('topology_cache_size', 2, group='upgrades')
+        self.addCleanup(
+            CONF.clear_override, 'topology_cache_size', group='upgrades')
+
+        self.cache.get(['host-1'])
+        self.cache.get(['host-2'])
+        self.cache.get(['host-1'])
+        self.cache.get(['host-3'])
+        self.load.reset_mock()
+
+        self.cache.get(['host-1', 'host-2'])
+        self.load.assert_called_once_with(['host-2'])
+
+    def test_clear(self):
+        self.cache.get(['host-1'])
+        self.cache.clear()
+        self.cache.get(['host-1'])
+
+        self.assertEqual(2, self.load.call_count)
+
+
+class TestInvalidate(oslotest.base.BaseTestCase):
+
+    def setUp(self):
+        super(TestInvalidate, self).setUp()
+
+        for name in ('hosts', 'services'):
+            patcher = mock.patch.object(topology, name)
+            self.addCleanup(patcher.stop)
+            patcher.start()
+
+    @mock.patch('kostyor.rpc.topology.app')
+    def test_invalidate(self, app):
+        topology.invalidate()
+
+        topology.hosts.clear.assert_called_once_with()
+        topology.services.clear.assert_called_once_with()
+        app.control.broadcast.assert_called_once_with(
+            'clear_topology_cache')
+
+    def test_clear_topology_cache(self):
+        result = topology.clear_topology_cache(mock.Mock())
+
+        self.assertEqual({'ok': 'topology cache cleared'}, result)
+        topology.hosts.clear.assert_called_once_with()
+        topology.services.clear.assert_called_once_with()
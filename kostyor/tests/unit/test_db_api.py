@@ -1,3 +1,4 @@
+import os
 import uuid
 import datetime
 import operator
@@ -5,6 +6,7 @@ import operator
 from kostyor.db import models
 from kostyor.db import api as db_api
 
+import fixtures
 import mock
 import sqlalchemy as sa
 from sqlalchemy.orm import sessionmaker
@@ -12,6 +14,7 @@ from sqlalchemy.orm import sessionmaker
 from oslotest import base
 
 from kostyor.common import constants, exceptions
+from kostyor.conf import CONF
 
 
 class KostyorTestContext(object):
@@ -95,6 +98,27 @@ class DbApiTestCase(base.BaseTestCase):
         result = db_api.get_host(host['id'])
         self.assertEqual(expected_result, result)
 
+    def test_get_hosts(self):
+        host_a = db_api.create_host('host-a', self.cluster['id'])
+        host_b = db_api.create_host('host-b', self.cluster['id'])
+        db_api.create_host('host-c', self.cluster['id'])
+
+        result = db_api.get_hosts([host_b['id'], host_a['id'], 'unknown'])
+
+        hostkeyfn = operator.itemgetter('hostname')
+        self.assertEqual([host_a, host_b], sorted(result, key=hostkeyfn))
+        self.assertEqual([], db_api.get_hosts([]))
+
+    def test_get_services(self):
+        host = db_api.create_host('host-a', self.cluster['id'])
+        service_a = db_api.create_service(
+            'nova-api', host['id'], constants.MITAKA)
+        db_api.create_service('glance-api', host['id'], constants.MITAKA)
+
+        self.assertEqual(
+            [service_a], db_api.get_services([service_a['id'], 'unknown']))
+        self.assertEqual([], db_api.get_services([]))
+
     def test_get_hosts_by_cluster_w_services(self):
         host = models.Host(hostname='host-a', cluster_id=self.cluster['id'])
         service_a = models.Service(name='nova-api', version=constants.MITAKA)
@@ -162,6 +186,74 @@ class DbApiTestCase(base.BaseTestCase):
         ]
         self.assertEqual(expected, actual)
 
+    def test_get_services_by_cluster(self):
+        host_a = models.Host(hostname='host-a', cluster_id=self.cluster['id'])
+        host_b = models.Host(hostname='host-b', cluster_id=self.cluster['id'])
+        nova_api = models.Service(name='nova-api', version=constants.MITAKA)
+        nova_compute = models.Service(name='nova-compute',
+                                      version=constants.MITAKA)
+        host_a.services.extend([nova_api, nova_compute])
+        host_b.services.append(nova_compute)
+
+        # Services of other clusters must not be returned.
+        cluster = db_api.create_cluster('other', constants.MITAKA,
+                                        constants.READY_FOR_UPGRADE)
+        host_c = models.Host(hostname='host-c', cluster_id=cluster['id'])
+        host_c.services.append(models.Service(name='glance-api'))
+
+        self.context.session.add_all([host_a, host_b, host_c])
+        self.context.session.commit()
+
+        expected = [
+            {
+                'id': nova_api.id,
+                'name': 'nova-api',
+                'version': constants.MITAKA,
+                'hosts': [host_a.id],
+            },
+            {
+                'id': nova_compute.id,
+                'name': 'nova-compute',
+                'version': constants.MITAKA,
+                'hosts': [host_a.id, host_b.id],
+            },
+        ]
+        self.assertEqual(
+            expected, db_api.get_services_by_cluster(self.cluster['id']))
+
+    def test_get_services_by_cluster_fixed_number_of_queries(self):
+        def _count_queries(hosts_number):
+            cluster = db_api.discover_cluster('test', {
+                'hosts': {
+                    'host-%d' % i: [{'name': 'nova-compute'},
+                                    {'name': 'neutron-l3-agent'}]
+                    for i in range(hosts_number)
+                },
+            })
+
+            statements = []
+
+            def _listener(conn, cursor, statement, *args):
+                statements.append(statement)
+
+            sa.event.listen(
+                self.context.engine, 'before_cursor_execute', _listener)
+            try:
+                services = db_api.get_services_by_cluster(cluster['id'])
+            finally:
+                sa.event.remove(
+                    self.context.engine, 'before_cursor_execute', _listener)
+
+            self.assertEqual(2, len(services))
+            return len(statements)
+
+        self.assertEqual(_count_queries(1), _count_queries(50))
+
+    def test_get_services_by_cluster_wrong_cluster(self):
+        self.assertRaises(exceptions.ClusterNotFound,
+                          db_api.get_services_by_cluster,
+                          'non-existing-id')
+
     def test_get_services_by_host_wrong_host_id_empty_list(self):
         result = db_api.get_services_by_host('fake-host-id')
         self.assertEqual([], result)
@@ -181,6 +273,8 @@ class DbApiTestCase(base.BaseTestCase):
                 'status': constants.UPGRADE_PAUSED,
                 'upgrade_start_time': datetime.datetime.utcnow(),
                 'upgrade_end_time': datetime.datetime.utcnow(),
+                'driver': None,
+                'parameters': None,
             } for _ in range(0, 2)
         ]
         self.context.session.bulk_insert_mappings(models.UpgradeTask, expected)
@@ -198,6 +292,8 @@ class DbApiTestCase(base.BaseTestCase):
                 'status': constants.UPGRADE_PAUSED,
                 'upgrade_start_time': datetime.datetime.utcnow(),
                 'upgrade_end_time': datetime.datetime.utcnow(),
+                'driver': None,
+                'parameters': None,
             } for _ in range(0, 3)
         ]
         # make second entry to belong the same cluster as first one does
@@ -207,6 +303,98 @@ class DbApiTestCase(base.BaseTestCase):
         retrieved = db_api.get_upgrades(expected[0]['cluster_id'])
         self.assertEqual(expected[0:2], retrieved)
 
+    def test_get_clusters_paginated(self):
+        for i in range(0, 5):
+            db_api.create_cluster('test' + str(i), constants.MITAKA,
+                                  constants.READY_FOR_UPGRADE)
+        expected = sorted(db_api.get_clusters(),
+                          key=operator.itemgetter('id'))
+
+        first = db_api.get_clusters(limit=4)
+        second = db_api.get_clusters(limit=4, marker=first[-1]['id'])
+
+        self.assertEqual(expected[:4], first)
+        self.assertEqual(expected[4:], second)
+
+    def test_get_clusters_filtered(self):
+        cluster = db_api.create_cluster('test', constants.NEWTON,
+                                        constants.UPGRADE_PAUSED)
+        db_api.create_cluster('test', constants.NEWTON,
+                              constants.READY_FOR_UPGRADE)
+
+        self.assertEqual(
+            [cluster],
+            db_api.get_clusters(version=constants.NEWTON,
+                                status=constants.UPGRADE_PAUSED))
+
+    def test_get_clusters_marker_not_found(self):
+        self.assertRaises(exceptions.MarkerNotFound,
+                          db_api.get_clusters,
+                          marker='non-existing-id')
+
+    def _create_upgrades(self):
+        cluster_ids = [str(uuid.uuid4()), str(uuid.uuid4())]
+        upgrades = [
+            {
+                'id': str(uuid.uuid4()),
+                'cluster_id': cluster_ids[i % 2],
+                'from_version': constants.MITAKA,
+                'to_version': constants.NEWTON,
+                'status': (constants.UPGRADE_SUCCEED if i < 4
+                           else constants.UPGRADE_IN_PROGRESS),
+                'upgrade_start_time': datetime.datetime(2017, 1, 1 + i // 2),
+                'upgrade_end_time': None,
+                'driver': None,
+                'parameters': None,
+            } for i in range(0, 6)
+        ]
+        self.context.session.bulk_insert_mappings(models.UpgradeTask, upgrades)
+
+        # Upgrades started at the same time are ordered by ID.
+        return sorted(upgrades, key=operator.itemgetter(
+            'upgrade_start_time', 'id'))
+
+    def test_get_upgrades_paginated(self):
+        expected = self._create_upgrades()
+
+        pages, marker = [], None
+        while True:
+            page = db_api.get_upgrades(limit=4, marker=marker)
+            if not page:
+                break
+            pages.append(page)
+            marker = page[-1]['id']
+
+        self.assertEqual([expected[:4], expected[4:]], pages)
+
+    def test_get_upgrades_paginated_started_at_same_time(self):
+        expected = self._create_upgrades()
+
+        self.assertEqual(
+            expected[2:5],
+            db_api.get_upgrades(limit=3, marker=expected[1]['id']))
+
+    def test_get_upgrades_filtered(self):
+        expected = self._create_upgrades()
+        cluster_id = expected[-1]['cluster_id']
+
+        self.assertEqual(
+            [upgrade for upgrade in expected[2:]
+             if upgrade['cluster_id'] == cluster_id
+             and upgrade['status'] == constants.UPGRADE_SUCCEED],
+            db_api.get_upgrades(
+                cluster_id=cluster_id,
+                status=constants.UPGRADE_SUCCEED,
+                to_version=constants.NEWTON,
+                from_version=constants.MITAKA,
+                started_after=datetime.datetime(2017, 1, 1, 12),
+                started_before=datetime.datetime(2017, 1, 3)))
+
+    def test_get_upgrades_marker_not_found(self):
+        self.assertRaises(exceptions.MarkerNotFound,
+                          db_api.get_upgrades,
+                          marker='non-existing-id')
+
     def test_create_cluster_upgrade(self):
         cluster = db_api.create_cluster("test",
                                         constants.MITAKA,
@@ -219,6 +407,375 @@ class DbApiTestCase(base.BaseTestCase):
         self.assertEqual(constants.MITAKA, upgrade['from_version'])
         self.assertEqual(constants.NEWTON, upgrade['to_version'])
 
+    def test_create_cluster_upgrade_driver_parameters(self):
+        upgrade = db_api.create_cluster_upgrade(self.cluster['id'],
+                                                constants.NEWTON,
+                                                driver='noop',
+                                                parameters={'x': 42})
+
+        self.assertEqual(constants.UPGRADE_IN_PROGRESS, upgrade['status'])
+        self.assertEqual('noop', upgrade['driver'])
+        self.assertEqual({'x': 42}, upgrade['parameters'])
+        self.assertEqual(upgrade,
+                         db_api.get_upgrade_by_cluster(self.cluster['id']))
+
+    def test_continue_cluster_upgrade_most_recent(self):
+        expected = [
+            {
+                'id': str(uuid.uuid4()),
+                'cluster_id': self.cluster['id'],
+                'from_version': constants.MITAKA,
+                'to_version': constants.NEWTON,
+                'status': constants.UPGRADE_PAUSED,
+                'upgrade_start_time': datetime.datetime(2016, 10, day),
+            } for day in (1, 3, 2)
+        ]
+        self.context.session.bulk_insert_mappings(models.UpgradeTask, expected)
+
+        db_api.continue_cluster_upgrade(self.cluster['id'])
+
+        self.assertEqual(
+            [constants.UPGRADE_PAUSED,
+             constants.UPGRADE_IN_PROGRESS,
+             constants.UPGRADE_PAUSED],
+            [db_api.get_upgrade(upgrade['id'])['status']
+             for upgrade in expected])
+
+    def _create_upgrade_steps(self):
+        upgrade = db_api.create_cluster_upgrade(self.cluster['id'],
+                                                constants.NEWTON)
+        service_a = models.Service(name='nova-api', version=constants.MITAKA)
+        service_b = models.Service(name='nova-compute',
+                                   version=constants.MITAKA)
+        host_a = models.Host(hostname='host-a', cluster_id=self.cluster['id'])
+        host_b = models.Host(hostname='host-b', cluster_id=self.cluster['id'])
+        self.context.session.add_all([service_a, service_b, host_a, host_b])
+        self.context.session.commit()
+
+        service_a, service_b = service_a.to_dict(), service_b.to_dict()
+        host_a, host_b = host_a.to_dict(), host_b.to_dict()
+        steps = db_api.create_upgrade_steps(upgrade['id'], [
+            [[(None, [])]],
+            [[(service_a, [host_b, host_a])]],
+            [[(service_b, [host_a])], [(service_b, [host_b])]],
+        ])
+        return upgrade, steps, (service_a, service_b), (host_a, host_b)
+
+    def test_create_upgrade_steps(self):
+        upgrade, steps, services, hosts = self._create_upgrade_steps()
+
+        self.assertEqual(
+            [(0, 0, 0, None, []),
+             (1, 0, 0, services[0], [hosts[1], hosts[0]]),
+             (2, 0, 0, services[1], [hosts[0]]),
+             (2, 1, 0, services[1], [hosts[1]])],
+            [(step['stage'], step['lane'], step['position'],
+              step['service'], step['hosts']) for step in steps])
+
+        for step in steps:
+            self.assertIsNotNone(step['id'])
+            self.assertEqual(upgrade['id'], step['upgrade_task_id'])
+            self.assertEqual(constants.STEP_PENDING, step['status'])
+
+    def test_get_upgrade_steps(self):
+        upgrade, steps, services, hosts = self._create_upgrade_steps()
+
+        retrieved = db_api.get_upgrade_steps(upgrade['id'])
+
+        # Hosts of a step are ordered by hostname no matter in what order
+        # they have been passed.
+        steps[1]['hosts'].sort(key=operator.itemgetter('hostname'))
+        self.assertEqual(steps, retrieved)
+
+    def test_get_upgrade_steps_by_statuses(self):
+        upgrade, steps, _, _ = self._create_upgrade_steps()
+
+        db_api.complete_upgrade_steps([steps[0]['id']])
+        db_api.complete_upgrade_steps([steps[2]['id']])
+
+        retrieved = db_api.get_upgrade_steps(
+            upgrade['id'], statuses=[constants.STEP_PENDING])
+        self.assertEqual([steps[1]['id'], steps[3]['id']],
+                         [step['id'] for step in retrieved])
+
+        retrieved = db_api.get_upgrade_steps(
+            upgrade['id'], statuses=[constants.STEP_SUCCEED])
+        self.assertEqual([steps[0]['id'], steps[2]['id']],
+                         [step['id'] for step in retrieved])
+
+    def test_complete_upgrade_steps(self):
+        upgrade, steps, _, _ = self._create_upgrade_steps()
+
+        self.assertEqual(upgrade, db_api.complete_upgrade_steps(
+            [steps[1]['id'], steps[3]['id']]))
+        self.assertEqual(
+            [constants.STEP_PENDING,
+             constants.STEP_SUCCEED,
+             constants.STEP_PENDING,
+             constants.STEP_SUCCEED],
+            [step['status'] for step in db_api.get_upgrade_steps(
+                upgrade['id'])])
+
+    def test_complete_upgrade_steps_not_found(self):
+        self.assertRaises(exceptions.UpgradeStepNotFound,
+                          db_api.complete_upgrade_steps, [])
+        self.assertRaises(exceptions.UpgradeStepNotFound,
+                          db_api.complete_upgrade_steps, ['non-existing-id'])
+
+    def test_fail_upgrade_steps(self):
+        upgrade, steps, _, _ = self._create_upgrade_steps()
+        db_api.complete_upgrade_steps([steps[0]['id']])
+        db_api.claim_upgrade_steps(upgrade['id'], 2)
+
+        # Only steps in progress are marked as failed.
+        self.assertEqual(upgrade, db_api.fail_upgrade_steps(
+            [steps[1]['id'], steps[2]['id']]))
+        self.assertEqual(
+            [constants.STEP_SUCCEED,
+             constants.STEP_FAILED,
+             constants.STEP_PENDING,
+             constants.STEP_PENDING],
+            [step['status'] for step in db_api.get_upgrade_steps(
+                upgrade['id'])])
+
+    def test_fail_upgrade_steps_not_found(self):
+        self.assertRaises(exceptions.UpgradeStepNotFound,
+                          db_api.fail_upgrade_steps, ['non-existing-id'])
+
+    def test_set_upgrade_task_ids(self):
+        upgrade, steps, _, _ = self._create_upgrade_steps()
+
+        db_api.set_upgrade_task_ids({
+            steps[0]['id']: ['task-1', 'task-2'],
+            steps[2]['id']: ['task-3'],
+        })
+
+        self.assertEqual(
+            [['task-1', 'task-2'], None, ['task-3'], None],
+            [step['task_ids'] for step in db_api.get_upgrade_steps(
+                upgrade['id'])])
+
+    def test_get_upgrade_steps_by_ids(self):
+        upgrade, steps, _, _ = self._create_upgrade_steps()
+
+        self.assertEqual(
+            [(steps[1]['id'], ['host-a', 'host-b']),
+             (steps[3]['id'], ['host-b'])],
+            [(step['id'], [host['hostname'] for host in step['hosts']])
+             for step in db_api.get_upgrade_steps(
+                 upgrade['id'], step_ids=[steps[3]['id'], steps[1]['id']])])
+
+    def _claim_upgrade_steps(self, upgrade_id, window, coalesce=False):
+        return [
+            (step['stage'], step['lane'], step['position'])
+            for step in db_api.claim_upgrade_steps(
+                upgrade_id, window, coalesce=coalesce)
+        ]
+
+    def test_claim_upgrade_steps(self):
+        upgrade = db_api.create_cluster_upgrade(self.cluster['id'],
+                                                constants.NEWTON)
+        service = models.Service(name='nova-compute')
+        self.context.session.add(service)
+        self.context.session.commit()
+
+        service = service.to_dict()
+        steps = db_api.create_upgrade_steps(upgrade['id'], [
+            [[(None, [])]],
+            [[(service, []), (service, [])], [(service, [])], [(service, [])]],
+            [[(service, [])]],
+        ])
+        steps = {
+            (step['stage'], step['lane'], step['position']): step['id']
+            for step in steps
+        }
+
+        # The next stage is not started until the current one completes.
+        self.assertEqual(
+            [(0, 0, 0)], self._claim_upgrade_steps(upgrade['id'], 2))
+        self.assertEqual([], self._claim_upgrade_steps(upgrade['id'], 2))
+        db_api.complete_upgrade_steps([steps[(0, 0, 0)]])
+
+        # Lanes are executed in parallel, though no more than the window.
+        self.assertEqual(
+            [(1, 0, 0), (1, 1, 0)],
+            self._claim_upgrade_steps(upgrade['id'], 2))
+        self.assertEqual([], self._claim_upgrade_steps(upgrade['id'], 2))
+
+        # Steps of the same lane are executed one by one.
+        db_api.complete_upgrade_steps([steps[(1, 0, 0)]])
+        self.assertEqual(
+            [(1, 0, 1)], self._claim_upgrade_steps(upgrade['id'], 2))
+        self.assertEqual(
+            [(1, 2, 0)], self._claim_upgrade_steps(upgrade['id'], 3))
+
+        for step in [(1, 0, 1), (1, 1, 0), (1, 2, 0)]:
+            db_api.complete_upgrade_steps([steps[step]])
+        self.assertEqual(
+            [(2, 0, 0)], self._claim_upgrade_steps(upgrade['id'], 2))
+
+        db_api.complete_upgrade_steps([steps[(2, 0, 0)]])
+        self.assertEqual([], self._claim_upgrade_steps(upgrade['id'], 2))
+
+    def test_claim_upgrade_steps_coalesce(self):
+        upgrade = db_api.create_cluster_upgrade(self.cluster['id'],
+                                                constants.NEWTON)
+        service = models.Service(name='nova-compute')
+        host_a = models.Host(hostname='host-a', cluster_id=self.cluster['id'])
+        host_b = models.Host(hostname='host-b', cluster_id=self.cluster['id'])
+        self.context.session.add_all([service, host_a, host_b])
+        self.context.session.commit()
+
+        service = service.to_dict()
+        host_a, host_b = host_a.to_dict(), host_b.to_dict()
+        steps = db_api.create_upgrade_steps(upgrade['id'], [
+            [[(service, [host_a, host_b]),
+              (service, [host_b, host_a]),
+              (service, [host_a]),
+              (service, [host_a])],
+             [(service, [host_b])]],
+        ])
+
+        # Steps on the same hosts are claimed along with the first one of
+        # the lane, no matter in what order hosts are.
+        self.assertEqual(
+            [(0, 0, 0), (0, 0, 1), (0, 1, 0)],
+            self._claim_upgrade_steps(upgrade['id'], 2, coalesce=True))
+
+        db_api.complete_upgrade_steps([step['id'] for step in steps[:2]])
+        self.assertEqual(
+            [(0, 0, 2), (0, 0, 3)],
+            self._claim_upgrade_steps(upgrade['id'], 2, coalesce=True))
+
+    def test_claim_upgrade_steps_upgrade_not_in_progress(self):
+        upgrade, _, _, _ = self._create_upgrade_steps()
+
+        for action in (db_api.pause_cluster_upgrade,
+                       db_api.cancel_cluster_upgrade):
+            action(self.cluster['id'])
+            self.assertEqual([], db_api.claim_upgrade_steps(upgrade['id'], 2))
+
+    def test_claim_upgrade_steps_concurrently(self):
+        # Two workers claim steps of the same upgrade at once, each through
+        # its own connection, while SQLite ignores row locks.
+        path = os.path.join(self.useFixture(fixtures.TempDir()).path, 'db')
+        engine = sa.create_engine('sqlite:///' + path)
+        models.Base.metadata.create_all(engine)
+        first = sessionmaker(bind=engine)()
+        second = sessionmaker(bind=engine)()
+        self.addCleanup(second.close)
+        self.addCleanup(first.close)
+
+        with mock.patch.object(db_api, 'db_session', first):
+            cluster = db_api.create_cluster('test', constants.MITAKA,
+                                            constants.READY_FOR_UPGRADE)
+            upgrade = db_api.create_cluster_upgrade(cluster['id'],
+                                                    constants.NEWTON)
+            db_api.create_upgrade_steps(upgrade['id'], [[[(None, [])]]])
+
+        claimed, sessions = [], [first, second]
+
+        def _claim():
+            with mock.patch.object(db_api, 'db_session', sessions.pop(0)):
+                claimed.extend(db_api.claim_upgrade_steps(upgrade['id'], 2))
+
+        def _listener(conn, cursor, statement, *args):
+            # The second worker claims steps right before the first one
+            # marks steps it's found ready as in progress.
+            if statement.startswith('UPDATE upgrade_steps') and sessions:
+                _claim()
+
+        sa.event.listen(engine, 'before_cursor_execute', _listener)
+        self.addCleanup(
+            sa.event.remove, engine, 'before_cursor_execute', _listener)
+        _claim()
+
+        self.assertEqual(1, len(claimed))
+
+    def test_claim_upgrade_steps_failed_step_blocks_lane(self):
+        upgrade, steps, _, _ = self._create_upgrade_steps()
+        db_api.complete_upgrade_steps([steps[0]['id']])
+        self.context.session.query(models.UpgradeStep) \
+            .filter_by(id=steps[1]['id']) \
+            .update({'status': constants.STEP_FAILED})
+        self.context.session.commit()
+
+        self.assertEqual([], db_api.claim_upgrade_steps(upgrade['id'], 2))
+
+    def test_reset_upgrade_steps(self):
+        upgrade, steps, _, _ = self._create_upgrade_steps()
+        db_api.complete_upgrade_steps([steps[0]['id']])
+        db_api.claim_upgrade_steps(upgrade['id'], 2)
+        db_api.set_upgrade_task_ids({steps[1]['id']: ['task-1']})
+
+        db_api.reset_upgrade_steps(upgrade['id'])
+
+        self.assertEqual(
+            [(constants.STEP_SUCCEED, None),
+             (constants.STEP_PENDING, None),
+             (constants.STEP_PENDING, None),
+             (constants.STEP_PENDING, None)],
+            [(step['status'], step['task_ids'])
+             for step in db_api.get_upgrade_steps(upgrade['id'])])
+
+    def test_reset_upgrade_steps_active(self):
+        upgrade, steps, _, _ = self._create_upgrade_steps()
+        db_api.complete_upgrade_steps([steps[0]['id']])
+        db_api.complete_upgrade_steps([steps[1]['id']])
+        db_api.claim_upgrade_steps(upgrade['id'], 2)
+        db_api.set_upgrade_task_ids({steps[2]['id']: ['task-1'],
+                                     steps[3]['id']: ['task-2']})
+
+        db_api.reset_upgrade_steps(upgrade['id'], active=[steps[2]['id']])
+
+        self.assertEqual(
+            [(constants.STEP_SUCCEED, None),
+             (constants.STEP_SUCCEED, None),
+             (constants.STEP_IN_PROGRESS, ['task-1']),
+             (constants.STEP_PENDING, None)],
+            [(step['status'], step['task_ids'])
+             for step in db_api.get_upgrade_steps(upgrade['id'])])
+
+    def test_claim_upgrade_steps_completes_upgrade(self):
+        upgrade, steps, _, _ = self._create_upgrade_steps()
+        db_api.complete_upgrade_steps([step['id'] for step in steps[:3]])
+
+        # The upgrade goes on as long as some step is unfinished.
+        self.assertEqual(
+            [steps[3]['id']],
+            [step['id'] for step in db_api.claim_upgrade_steps(
+                upgrade['id'], 2)])
+        self.assertEqual([], db_api.claim_upgrade_steps(upgrade['id'], 2))
+        self.assertEqual(constants.UPGRADE_IN_PROGRESS,
+                         db_api.get_upgrade(upgrade['id'])['status'])
+
+        db_api.complete_upgrade_steps([steps[3]['id']])
+        self.assertEqual([], db_api.claim_upgrade_steps(upgrade['id'], 2))
+
+        upgrade = db_api.get_upgrade(upgrade['id'])
+        cluster = db_api.get_cluster(self.cluster['id'])
+        self.assertEqual(constants.UPGRADE_SUCCEED, upgrade['status'])
+        self.assertIsNotNone(upgrade['upgrade_end_time'])
+        self.assertEqual(constants.UPGRADE_SUCCEED, cluster['status'])
+        self.assertEqual(constants.NEWTON, cluster['version'])
+
+        # Once upgraded, the cluster can be rediscovered once again.
+        db_api.rediscover_cluster(self.cluster['id'], {})
+
+    def test_cancel_cluster_upgrade_cancels_steps(self):
+        upgrade, steps, _, _ = self._create_upgrade_steps()
+        db_api.complete_upgrade_steps([steps[0]['id']])
+
+        db_api.cancel_cluster_upgrade(self.cluster['id'])
+
+        self.assertEqual(
+            [constants.STEP_SUCCEED,
+             constants.STEP_CANCELLED,
+             constants.STEP_CANCELLED,
+             constants.STEP_CANCELLED],
+            [step['status'] for step in db_api.get_upgrade_steps(
+                upgrade['id'])])
+
     def test_create_cluster_upgrade_not_found(self):
         self.assertRaises(exceptions.ClusterNotFound,
                           db_api.create_cluster_upgrade,
@@ -331,6 +888,173 @@ class DbApiTestCase(base.BaseTestCase):
             services['nova-api'].hosts[0],
             services['nova-conductor'].hosts[0])
 
+    def test_discover_cluster_fixed_number_of_queries(self):
+        def _count_queries(hosts_number):
+            statements = []
+
+            def _listener(conn, cursor, statement, *args):
+                statements.append(statement)
+
+            sa.event.listen(
+                self.context.engine, 'before_cursor_execute', _listener)
+            try:
+                cluster = db_api.discover_cluster('test', {
+                    'hosts': {
+                        'host-%d' % i: [
+                            {'name': 'nova-compute'},
+                            {'name': 'neutron-openvswitch-agent'},
+                        ]
+                        for i in range(hosts_number)
+                    },
+                })
+            finally:
+                sa.event.remove(
+                    self.context.engine, 'before_cursor_execute', _listener)
+
+            hosts = db_api.get_hosts_by_cluster(cluster['id'])
+            self.assertEqual(hosts_number, len(hosts))
+            return len(statements)
+
+        self.assertEqual(_count_queries(2), _count_queries(100))
+
+    def _get_topology(self, cluster_id):
+        hosts, services = db_api.get_cluster_topology(cluster_id)
+        services = {service['id']: service for service in services}
+        return {
+            host['hostname']: sorted(
+                (services[service]['name'], services[service]['version'])
+                for service in host['services'])
+            for host in hosts
+        }
+
+    def test_rediscover_cluster(self):
+        cluster = db_api.discover_cluster('test', {
+            'version': constants.MITAKA,
+            'hosts': {
+                'host-a': [{'name': 'nova-api', 'version': constants.MITAKA},
+                           {'name': 'nova-conductor'}],
+                'host-b': [{'name': 'nova-compute'}],
+                'host-c': [{'name': 'nova-compute'}],
+            },
+        })
+        hosts = {host['hostname']: host['id']
+                 for host in db_api.get_hosts_by_cluster(cluster['id'])}
+
+        result = db_api.rediscover_cluster(cluster['id'], {
+            'version': constants.NEWTON,
+            'hosts': {
+                'host-a': [{'name': 'nova-api', 'version': constants.NEWTON}],
+                'host-b': [{'name': 'nova-compute'},
+                           {'name': 'nova-conductor'}],
+                'host-d': [{'name': 'nova-compute'},
+                           {'name': 'cinder-volume'}],
+            },
+        })
+
+        self.assertEqual(
+            dict(cluster, version=constants.NEWTON), result)
+        self.assertEqual(
+            {
+                'host-a': [('nova-api', constants.NEWTON)],
+                'host-b': [('nova-compute', None), ('nova-conductor', None)],
+                'host-d': [('cinder-volume', None), ('nova-compute', None)],
+            },
+            self._get_topology(cluster['id']))
+
+        # Hosts that have stayed are kept as is, while gone ones are
+        # detached from the cluster.
+        self.assertEqual(
+            hosts['host-a'],
+            self.context.session.query(models.Host).filter_by(
+                hostname='host-a').one().id)
+        self.assertIsNone(
+            self.context.session.query(models.Host).filter_by(
+                hostname='host-c').one().cluster_id)
+
+    def test_rediscover_cluster_nothing_changed(self):
+        info = {
+            'version': constants.MITAKA,
+            'hosts': {
+                'host-%d' % i: [{'name': 'nova-compute'}] for i in range(10)
+            },
+        }
+        cluster = db_api.discover_cluster('test', info)
+
+        statements = []
+
+        def _listener(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        sa.event.listen(
+            self.context.engine, 'before_cursor_execute', _listener)
+        try:
+            db_api.rediscover_cluster(cluster['id'], info)
+        finally:
+            sa.event.remove(
+                self.context.engine, 'before_cursor_execute', _listener)
+
+        self.assertEqual(
+            [], [statement for statement in statements
+                 if not statement.lstrip().startswith('SELECT')])
+
+    def test_rediscover_cluster_incomplete(self):
+        cluster = db_api.discover_cluster('test', {
+            'hosts': {
+                'host-a': [{'name': 'nova-api'}],
+                'host-b': [{'name': 'neutron-server'}],
+            },
+        })
+        topology = self._get_topology(cluster['id'])
+
+        # Neutron probe has timed out, so host-b only looks gone.
+        self.assertRaises(exceptions.IncompleteDiscovery,
+                          db_api.rediscover_cluster,
+                          cluster['id'], {
+                              'hosts': {'host-a': [{'name': 'nova-api'}]},
+                              'errors': {
+                                  'neutron': 'Timed out after 30 seconds',
+                              },
+                          })
+
+        self.assertEqual(topology, self._get_topology(cluster['id']))
+
+    def test_rediscover_cluster_upgrade_in_progress(self):
+        db_api.create_cluster_upgrade(self.cluster['id'], constants.NEWTON)
+
+        self.assertRaises(exceptions.UpgradeIsInProgress,
+                          db_api.rediscover_cluster,
+                          self.cluster['id'], {})
+
+    def test_rediscover_cluster_not_found(self):
+        self.assertRaises(exceptions.ClusterNotFound,
+                          db_api.rediscover_cluster,
+                          'non-existing-id', {})
+
+    def test_discover_cluster_incomplete(self):
+        clusters = db_api.get_clusters()
+
+        exc = self.assertRaises(exceptions.IncompleteDiscovery,
+                                db_api.discover_cluster, 'test', {
+                                    'hosts': {
+                                        'host-a': [{'name': 'nova-api'}],
+                                    },
+                                    'errors': {
+                                        'neutron': 'Timed out after 30 '
+                                                   'seconds',
+                                    },
+                                })
+
+        self.assertIn('neutron (Timed out after 30 seconds)', str(exc))
+        self.assertEqual(clusters, db_api.get_clusters())
+
+    def test_discover_cluster_no_hosts(self):
+        cluster = db_api.discover_cluster('test', {
+            'version': constants.NEWTON,
+        })
+
+        self.assertEqual(cluster, db_api.get_cluster(cluster['id']))
+        self.assertEqual([], db_api.get_hosts_by_cluster(cluster['id']))
+
     def test_get_service_with_hosts(self):
         service_a = models.Service(name='nova-api', version=constants.MITAKA)
         service_b = models.Service(name='glance-api', version=constants.MITAKA)
@@ -396,3 +1120,271 @@ class DbApiTestCase(base.BaseTestCase):
 
         self.assertIsNone(service)
         self.assertIsNone(hosts)
+
+    def test_get_cluster_topology(self):
+        service_a = models.Service(name='nova-api', version=constants.MITAKA)
+        service_b = models.Service(name='glance-api', version=constants.MITAKA)
+        host_a = models.Host(hostname='host-a', cluster_id=self.cluster['id'])
+        host_b = models.Host(hostname='host-b', cluster_id=self.cluster['id'])
+        host_c = models.Host(hostname='host-c', cluster_id=self.cluster['id'])
+        host_a.services.extend([service_a, service_b])
+        host_b.services.append(service_a)
+        self.context.session.add_all([host_a, host_b, host_c])
+        self.context.session.commit()
+
+        hosts, services = db_api.get_cluster_topology(self.cluster['id'])
+
+        for entry in hosts:
+            entry['services'].sort()
+        for entry in services:
+            entry['hosts'].sort()
+
+        hostkeyfn = operator.itemgetter('hostname')
+        self.assertEqual(
+            sorted([
+                {
+                    'id': host_a.id,
+                    'cluster_id': self.cluster['id'],
+                    'hostname': 'host-a',
+                    'services': sorted([service_a.id, service_b.id]),
+                },
+                {
+                    'id': host_b.id,
+                    'cluster_id': self.cluster['id'],
+                    'hostname': 'host-b',
+                    'services': [service_a.id],
+                },
+                {
+                    'id': host_c.id,
+                    'cluster_id': self.cluster['id'],
+                    'hostname': 'host-c',
+                    'services': [],
+                },
+            ], key=hostkeyfn),
+            sorted(hosts, key=hostkeyfn))
+
+        servicekeyfn = operator.itemgetter('name')
+        self.assertEqual(
+            sorted([
+                {
+                    'id': service_a.id,
+                    'name': 'nova-api',
+                    'version': constants.MITAKA,
+                    'hosts': sorted([host_a.id, host_b.id]),
+                },
+                {
+                    'id': service_b.id,
+                    'name': 'glance-api',
+                    'version': constants.MITAKA,
+                    'hosts': [host_a.id],
+                },
+            ], key=servicekeyfn),
+            sorted(services, key=servicekeyfn))
+
+    def test_get_cluster_topology_fixed_number_of_queries(self):
+        def _count_queries(hosts_number):
+            cluster = db_api.create_cluster('test',
+                                            constants.MITAKA,
+                                            constants.READY_FOR_UPGRADE)
+            service = models.Service(name='nova-compute')
+            for i in range(hosts_number):
+                host = models.Host(hostname='host-%d' % i,
+                                   cluster_id=cluster['id'])
+                host.services.append(service)
+                self.context.session.add(host)
+            self.context.session.commit()
+
+            statements = []
+
+            def _listener(conn, cursor, statement, *args):
+                statements.append(statement)
+
+            sa.event.listen(
+                self.context.engine, 'before_cursor_execute', _listener)
+            try:
+                hosts, services = db_api.get_cluster_topology(cluster['id'])
+            finally:
+                sa.event.remove(
+                    self.context.engine, 'before_cursor_execute', _listener)
+
+            self.assertEqual(hosts_number, len(hosts))
+            return len(statements)
+
+        self.assertEqual(_count_queries(1), _count_queries(50))
+
+    def test_get_cluster_topology_wrong_cluster(self):
+        self.assertRaises(exceptions.ClusterNotFound,
+                          db_api.get_cluster_topology,
+                          'non-existing-id')
+
+    def test_get_services_with_hosts(self):
+        service_a = models.Service(name='nova-api', version=constants.MITAKA)
+        service_b = models.Service(name='glance-api', version=constants.MITAKA)
+        service_c = models.Service(name='nova-api', version=constants.MITAKA)
+        host_a = models.Host(hostname='host-a', cluster_id=self.cluster['id'])
+        host_b = models.Host(hostname='host-b', cluster_id=self.cluster['id'])
+        host_c = models.Host(hostname='host-c', cluster_id=self.cluster['id'])
+        host_a.services.extend([service_a, service_b])
+        host_b.services.append(service_a)
+        host_c.services.append(service_c)
+
+        cluster = db_api.create_cluster('another',
+                                        constants.MITAKA,
+                                        constants.READY_FOR_UPGRADE)
+        host_d = models.Host(hostname='host-d', cluster_id=cluster['id'])
+        host_d.services.append(models.Service(name='heat-api'))
+
+        self.context.session.add_all([host_a, host_b, host_c, host_d])
+        self.context.session.commit()
+
+        services = db_api.get_services_with_hosts(self.cluster['id'])
+
+        def _tohost(host):
+            return {
+                'id': host.id,
+                'cluster_id': self.cluster['id'],
+                'hostname': host.hostname,
+            }
+
+        def _toservice(service):
+            return {
+                'id': service.id,
+                'name': service.name,
+                'version': constants.MITAKA,
+            }
+
+        self.assertEqual(sorted(['nova-api', 'glance-api']), sorted(services))
+        self.assertEqual(
+            [(_toservice(service_b), [_tohost(host_a)])],
+            services['glance-api'])
+        self.assertEqual(
+            sorted([
+                (_toservice(service_a), [_tohost(host_a), _tohost(host_b)]),
+                (_toservice(service_c), [_tohost(host_c)]),
+            ], key=lambda entry: entry[0]['id']),
+            sorted(services['nova-api'], key=lambda entry: entry[0]['id']))
+
+    def test_get_services_with_hosts_no_found(self):
+        services = db_api.get_services_with_hosts(self.cluster['id'])
+        self.assertEqual({}, services)
+
+    def _get_query_plans(self, fn, *args):
+        statements = []
+
+        def _listener(conn, cursor, statement, parameters, *args):
+            if statement.lstrip().upper().startswith('SELECT'):
+                statements.append((statement, parameters))
+
+        sa.event.listen(
+            self.context.engine, 'before_cursor_execute', _listener)
+        try:
+            fn(*args)
+        finally:
+            sa.event.remove(
+                self.context.engine, 'before_cursor_execute', _listener)
+
+        return [
+            row[-1]
+            for statement, parameters in statements
+            for row in self.context.engine.execute(
+                'EXPLAIN QUERY PLAN ' + statement, parameters)
+        ]
+
+    def test_lookups_use_indexes(self):
+        # Lookups must not degrade to full scans of tables as they grow, so
+        # let's ensure that query plans search by index instead. Please note,
+        # lookups by primary key are always done by index.
+        cluster = db_api.create_cluster('test', constants.MITAKA,
+                                        constants.READY_FOR_UPGRADE)
+        host = db_api.create_host('host-1', cluster['id'])
+        service = db_api.create_service('nova-api', host['id'],
+                                        constants.MITAKA)
+        upgrade = db_api.create_cluster_upgrade(cluster['id'],
+                                                constants.NEWTON)
+        db_api.create_upgrade_steps(upgrade['id'], [[[(service, [host])]]])
+
+        lookups = [
+            (db_api.get_upgrade_by_cluster, cluster['id']),
+            (db_api.get_upgrades, cluster['id']),
+            (db_api.get_hosts_by_cluster, cluster['id']),
+            (db_api.get_service_with_hosts, 'nova-api', cluster['id']),
+            (db_api.get_services_by_host, host['id']),
+            (db_api.get_services_by_cluster, cluster['id']),
+            (db_api.get_upgrade_steps, upgrade['id']),
+        ]
+
+        for lookup in lookups:
+            plans = self._get_query_plans(*lookup)
+
+            self.assertNotEqual([], plans)
+            for plan in plans:
+                # Full scans look like 'SCAN TABLE hosts' or 'SCAN hosts'
+                # depending on SQLite version, while index scans mention
+                # the index being used.
+                if plan.startswith('SCAN') and 'INDEX' not in plan:
+                    self.fail('%s does a full scan: %s' % (
+                        lookup[0].__name__, plan))
+
+
+class ConfigureSessionTestCase(base.BaseTestCase):
+    def setUp(self):
+        super(ConfigureSessionTestCase, self).setUp()
+
+        patcher = mock.patch.object(db_api, 'db_session')
+        self.addCleanup(patcher.stop)
+        self.db_session = patcher.start()
+
+        self.addCleanup(CONF.clear_override, 'connection_debug',
+                        group='database')
+        self.addCleanup(CONF.clear_override, 'max_pool_size',
+                        group='database')
+        self.addCleanup(CONF.clear_override, 'statement_timeout',
+                        group='database')
+
+    def _get_engine(self):
+        return self.db_session.configure.call_args[1]['bind']
+
+    def test_configure_session_sqlite(self):
+        path = os.path.join(self.useFixture(fixtures.TempDir()).path, 'db')
+
+        db_api.configure_session('sqlite:///' + path)
+
+        engine = self._get_engine()
+        self.addCleanup(engine.dispose)
+        self.assertEqual(
+            'wal', engine.execute('PRAGMA journal_mode').scalar())
+        self.assertEqual(
+            30000, engine.execute('PRAGMA busy_timeout').scalar())
+
+    @mock.patch.object(sa.event, 'listen')
+    @mock.patch.object(db_api, 'create_engine')
+    def test_configure_session_pool_options(self, create_engine, listen):
+        CONF.set_override('max_pool_size', 20, group='database')
+        CONF.set_override('connection_debug', 100, group='database')
+
+        db_api.configure_session('postgresql://kostyor@localhost/kostyor')
+
+        create_engine.assert_called_once_with(
+            mock.ANY,
+            convert_unicode=True,
+            pool_recycle=3600,
+            pool_pre_ping=True,
+            pool_size=20,
+            echo='debug')
+        self.assertFalse(listen.called)
+
+    @mock.patch.object(sa.event, 'listen')
+    @mock.patch.object(db_api, 'create_engine')
+    def test_configure_session_statement_timeout(self, create_engine, listen):
+        CONF.set_override('statement_timeout', 5000, group='database')
+
+        db_api.configure_session('postgresql://kostyor@localhost/kostyor')
+
+        engine, event, listener = listen.call_args[0]
+        self.assertEqual(create_engine.return_value, engine)
+        self.assertEqual('connect', event)
+
+        conn = mock.Mock()
+        listener(conn, mock.Mock())
+        conn.cursor.return_value.execute.assert_called_once_with(
+            'SET statement_timeout = 5000')
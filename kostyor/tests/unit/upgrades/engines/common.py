@@ -1,5 +1,6 @@
 import mock
 
+from kostyor.common import constants
 from kostyor.rpc import tasks
 from kostyor.upgrades.drivers import base as basedriver
 
@@ -20,5 +21,63 @@ class MockUpgradeDriver(basedriver.UpgradeDriver):
 
         instance = super(MockUpgradeDriver, cls).__new__(cls)
         for method in cls._methods:
-            setattr(instance, method, mock.Mock(return_value=tasks.noop.si()))
+            # Each call must return a new signature, just like real drivers
+            # do, since task IDs are assigned to signatures in-place.
+            setattr(instance, method, mock.Mock(
+                side_effect=lambda *args, **kwargs: tasks.noop.si()))
         return instance
+
+
+def fake_create_upgrade_steps(upgrade_id, plan):
+    """Imitate persisting of a given plan by assigning IDs to its steps."""
+    return [
+        {
+            'id': '%s-%d-%d-%d' % (upgrade_id, stage, lane, position),
+            'upgrade_task_id': upgrade_id,
+            'stage': stage,
+            'lane': lane,
+            'position': position,
+            'status': constants.STEP_PENDING,
+            'task_ids': None,
+            'service': service,
+            'hosts': hosts,
+        }
+        for stage, lanes in enumerate(plan)
+        for lane, steps in enumerate(lanes)
+        for position, (service, hosts) in enumerate(steps)
+    ]
+
+
+def fake_steps_api(stepsapi):
+    """Make a mocked DB API persist a plan and claim all its steps at once.
+
+    Steps are claimed in order of the plan, so the driver is asked for
+    tasks of steps in that order too.
+    """
+    steps = []
+
+    def create_upgrade_steps(upgrade_id, plan):
+        steps[:] = fake_create_upgrade_steps(upgrade_id, plan)
+        return list(steps)
+
+    def claim_upgrade_steps(upgrade_id, window, coalesce=False):
+        claimed, steps[:] = list(steps), []
+        return claimed
+
+    stepsapi.create_upgrade_steps.side_effect = create_upgrade_steps
+    stepsapi.claim_upgrade_steps.side_effect = claim_upgrade_steps
+    return stepsapi
+
+
+def getplan(stepsapi):
+    """Get a plan persisted via a mocked DB API as names of its steps."""
+    plan = stepsapi.create_upgrade_steps.call_args[0][1]
+    return [
+        [
+            [(service and service['name'],
+              [host['hostname'] for host in hosts])
+             for service, hosts in lane]
+            for lane in stage
+        ]
+        for stage in plan
+    ]
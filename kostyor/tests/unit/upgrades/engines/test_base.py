@@ -0,0 +1,268 @@
+import celery
+import mock
+import oslotest.base
+
+from kostyor.common import constants
+from kostyor.rpc import tasks
+from kostyor.upgrades import engines
+
+from .common import MockUpgradeDriver, fake_create_upgrade_steps
+
+
+class TestDispatch(oslotest.base.BaseTestCase):
+
+    upgrade = {
+        'id': 'd174522c-95fc-4996-8dfa-0c2405a3b0c1',
+        'cluster_id': '2ba8fad8-3a0f-47db-a45b-62df1d811687',
+        'status': constants.UPGRADE_IN_PROGRESS,
+        'driver': 'noop',
+        'parameters': {'batch_size': 2},
+    }
+
+    def setUp(self):
+        super(TestDispatch, self).setUp()
+        self.driver = MockUpgradeDriver()
+        self.driver.start.side_effect = \
+            lambda service, hosts: tasks.execute.si(
+                [service['name'], hosts[0]['hostname']])
+
+        patcher = mock.patch('kostyor.upgrades.engines.base.dbapi')
+        self.addCleanup(patcher.stop)
+        self.dbapi = patcher.start()
+
+        self.steps = fake_create_upgrade_steps(self.upgrade['id'], [
+            [[(None, [])]],
+            [[({'name': 'nova-compute'}, [{'hostname': 'host-1'}]),
+              ({'name': 'neutron-l3-agent'}, [{'hostname': 'host-1'}])],
+             [({'name': 'nova-compute'}, [{'hostname': 'host-2'}])]],
+        ])
+
+    def _dispatch(self, *args, **kwargs):
+        chains, chain = [], celery.chain
+
+        def _chain(*tasks):
+            chains.append(chain(*tasks))
+            return chains[-1]
+
+        with mock.patch('celery.chain', side_effect=_chain), \
+                mock.patch('celery.canvas._chain.apply_async') as send:
+            saved = engines.dispatch(
+                self.upgrade, self.driver, *args, **kwargs)
+
+        self.assertEqual(len(chains), send.call_count)
+        return chains, saved
+
+    def test_dispatch(self):
+        self.dbapi.claim_upgrade_steps.side_effect = [
+            [self.steps[1], self.steps[3]], []]
+
+        chains, saved = self._dispatch()
+
+        self.dbapi.claim_upgrade_steps.assert_called_once_with(
+            self.upgrade['id'], 16, coalesce=False)
+        self.assertFalse(self.driver.pre_upgrade.called)
+        self.assertEqual(0, saved)
+
+        # Each step is sent on its own, followed by the task that marks
+        # the step as completed.
+        self.assertEqual(
+            [[(['nova-compute', 'host-1'],), (self.steps[1]['id'],)],
+             [(['nova-compute', 'host-2'],), (self.steps[3]['id'],)]],
+            [[task.args for task in chain.tasks] for chain in chains])
+        self.dbapi.set_upgrade_task_ids.assert_called_once_with({
+            step['id']: [task.id for task in chain.tasks]
+            for step, chain in zip([self.steps[1], self.steps[3]], chains)
+        })
+        self.assertFalse(self.dbapi.complete_upgrade_steps.called)
+
+        # If some task fails, the step is marked as failed instead.
+        self.assertEqual(
+            [[(tasks.fail_step.name, (self.steps[1]['id'],))],
+             [(tasks.fail_step.name, (self.steps[3]['id'],))]],
+            [[(errback['task'], tuple(errback['args']))
+              for errback in chain.options['link_error']]
+             for chain in chains])
+
+    def test_dispatch_noop_completed_right_away(self):
+        self.dbapi.claim_upgrade_steps.side_effect = [
+            self.steps[:1], [self.steps[1]], []]
+
+        chains, saved = self._dispatch(window=1)
+
+        self.assertEqual(
+            [mock.call(self.upgrade['id'], 1, coalesce=False)] * 2,
+            self.dbapi.claim_upgrade_steps.call_args_list)
+        self.driver.pre_upgrade.assert_called_once_with()
+
+        # The noop pre-upgrade step is neither sent, nor is the task that
+        # marks it as completed, and the next step is sent instead.
+        self.dbapi.complete_upgrade_steps.assert_called_once_with(
+            [self.steps[0]['id']])
+        self.assertEqual(2, saved)
+        self.assertEqual(
+            [[(['nova-compute', 'host-1'],), (self.steps[1]['id'],)]],
+            [[task.args for task in chain.tasks] for chain in chains])
+
+    def test_dispatch_coalesce(self):
+        self.driver.coalesce = True
+        self.driver.start_many = mock.Mock(
+            side_effect=lambda services, hosts: tasks.execute.si(
+                [service['name'] for service in services]))
+        self.dbapi.claim_upgrade_steps.side_effect = [self.steps[1:], []]
+
+        chains, saved = self._dispatch()
+
+        self.dbapi.claim_upgrade_steps.assert_called_once_with(
+            self.upgrade['id'], 16, coalesce=True)
+
+        # Steps of the same lane are sent as one chain, and marked as
+        # completed by one task.
+        self.assertEqual(
+            [[(['nova-compute', 'neutron-l3-agent'],),
+              (self.steps[1]['id'], self.steps[2]['id'])],
+             [(['nova-compute', 'host-2'],), (self.steps[3]['id'],)]],
+            [[task.args for task in chain.tasks] for chain in chains])
+        self.assertEqual(1, saved)
+
+    def test_dispatch_nothing_ready(self):
+        self.dbapi.claim_upgrade_steps.return_value = []
+
+        self.assertEqual(([], 0), self._dispatch())
+        self.assertFalse(self.dbapi.set_upgrade_task_ids.called)
+
+    def test_dispatch_same_steps_claimed_again(self):
+        # If completed steps are claimed again for whatever reason, they
+        # aren't completed over and over again.
+        self.dbapi.claim_upgrade_steps.return_value = self.steps[:1]
+
+        self.assertEqual(([], 2), self._dispatch())
+        self.assertEqual(2, self.dbapi.claim_upgrade_steps.call_count)
+        self.dbapi.complete_upgrade_steps.assert_called_once_with(
+            [self.steps[0]['id']])
+
+    @mock.patch('kostyor.upgrades.engines.base.dispatch')
+    @mock.patch('stevedore.driver.DriverManager')
+    def test_advance(self, manager, dispatch):
+        engines.advance(self.upgrade)
+
+        manager.assert_called_once_with(
+            namespace='kostyor.upgrades.drivers',
+            name='noop',
+            invoke_on_load=True,
+            invoke_kwds={'parameters': {'batch_size': 2}})
+        dispatch.assert_called_once_with(
+            self.upgrade, manager.return_value.driver)
+
+
+class TestResume(oslotest.base.BaseTestCase):
+
+    upgrade = {
+        'id': 'd174522c-95fc-4996-8dfa-0c2405a3b0c1',
+        'cluster_id': '2ba8fad8-3a0f-47db-a45b-62df1d811687',
+        'status': constants.UPGRADE_IN_PROGRESS,
+    }
+
+    @mock.patch('kostyor.upgrades.engines.base.AsyncResult')
+    @mock.patch('kostyor.upgrades.engines.base.topology')
+    @mock.patch('kostyor.upgrades.engines.base.dispatch')
+    @mock.patch('kostyor.upgrades.engines.base.dbapi')
+    def test_resume(self, dbapi, dispatch, topology, asyncresult):
+        driver = MockUpgradeDriver()
+        dbapi.get_upgrade_steps.return_value = [
+            {'id': 'running', 'task_ids': ['task-1', 'task-2']},
+            {'id': 'queued', 'task_ids': ['task-3', 'task-4']},
+            {'id': 'finished', 'task_ids': ['task-5']},
+            {'id': 'failed', 'task_ids': ['task-6', 'task-7']},
+            {'id': 'unsent', 'task_ids': None},
+        ]
+        states = {
+            'task-1': 'SUCCESS', 'task-2': 'STARTED',
+            'task-3': 'PENDING', 'task-4': 'PENDING',
+            'task-5': 'SUCCESS',
+            'task-6': 'FAILURE', 'task-7': 'PENDING',
+        }
+
+        def _asyncresult(taskid, app):
+            state = states[taskid]
+            return mock.Mock(
+                ready=mock.Mock(return_value=state in ('SUCCESS', 'FAILURE')),
+                successful=mock.Mock(return_value=state == 'SUCCESS'))
+        asyncresult.side_effect = _asyncresult
+
+        engines.resume(self.upgrade, driver)
+
+        # Steps that have been let finish on pause are left in progress,
+        # while the rest of unfinished ones is executed once again.
+        dbapi.get_upgrade_steps.assert_called_once_with(
+            self.upgrade['id'], statuses=[constants.STEP_IN_PROGRESS])
+        dbapi.reset_upgrade_steps.assert_called_once_with(
+            self.upgrade['id'], active=['running', 'queued'])
+        dispatch.assert_called_once_with(self.upgrade, driver)
+
+        # The cluster may have been rediscovered while paused.
+        topology.invalidate.assert_called_once_with()
+
+
+class TestStop(oslotest.base.BaseTestCase):
+
+    upgrade = {
+        'id': 'd174522c-95fc-4996-8dfa-0c2405a3b0c1',
+        'cluster_id': '2ba8fad8-3a0f-47db-a45b-62df1d811687',
+        'status': constants.UPGRADE_PAUSED,
+    }
+
+    def setUp(self):
+        super(TestStop, self).setUp()
+
+        patcher = mock.patch('kostyor.upgrades.engines.base.dbapi')
+        self.addCleanup(patcher.stop)
+        self.dbapi = patcher.start()
+
+        # Lanes #0 and #1 are in flight.
+        steps = fake_create_upgrade_steps(self.upgrade['id'], [
+            [[('a', [])], [('c', [])]],
+        ])
+        for step in steps:
+            step['status'] = constants.STEP_IN_PROGRESS
+            step['task_ids'] = [step['service'] + '-1', step['service'] + '-2']
+        self.dbapi.get_upgrade_steps.return_value = steps
+
+        patcher = mock.patch('kostyor.upgrades.engines.base.app')
+        self.addCleanup(patcher.stop)
+        self.app = patcher.start()
+
+        patcher = mock.patch(
+            'kostyor.upgrades.engines.base.AbortableAsyncResult')
+        self.addCleanup(patcher.stop)
+        self.result = patcher.start()
+
+    def test_stop(self):
+        engines.stop(self.upgrade)
+
+        # Pending steps have never been sent, and steps in flight are let
+        # finish, so there's nothing to revoke.
+        self.assertFalse(self.dbapi.get_upgrade_steps.called)
+        self.assertFalse(self.app.control.revoke.called)
+        self.assertFalse(self.result.called)
+
+    def test_stop_abort(self):
+        engines.stop(self.upgrade, abort=True)
+
+        self.dbapi.get_upgrade_steps.assert_called_once_with(
+            self.upgrade['id'], statuses=[constants.STEP_IN_PROGRESS,
+                                          constants.STEP_CANCELLED])
+        self.app.control.revoke.assert_called_once_with(
+            ['a-1', 'a-2', 'c-1', 'c-2'])
+        self.assertEqual(
+            [mock.call(taskid, app=self.app)
+             for taskid in ['a-1', 'a-2', 'c-1', 'c-2']],
+            self.result.call_args_list)
+        self.assertEqual(4, self.result.return_value.abort.call_count)
+
+    def test_stop_nothing_left(self):
+        self.dbapi.get_upgrade_steps.return_value = []
+
+        engines.stop(self.upgrade, abort=True)
+
+        self.assertFalse(self.app.control.revoke.called)
+        self.assertFalse(self.result.called)
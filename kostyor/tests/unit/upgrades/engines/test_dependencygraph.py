@@ -0,0 +1,147 @@
+import datetime
+
+import mock
+import oslotest.base
+
+from kostyor.common import constants, exceptions
+from kostyor.upgrades import engines
+from kostyor.upgrades.engines import dependencygraph, scenario
+
+from .common import MockUpgradeDriver, fake_steps_api, getplan
+
+
+class TestDependencyGraphEngine(oslotest.base.BaseTestCase):
+
+    assignment = {
+        'ctrl-1': [
+            'keystone-wsgi-admin',
+            'nova-api',
+            'nova-conductor',
+            'neutron-server',
+            'neutron-openvswitch-agent',
+            'heat-api',
+            'aodh-api',
+        ],
+        'ctrl-2': [
+            'keystone-wsgi-admin',
+            'nova-api',
+            'heat-api',
+        ],
+        'ctrl-3': [
+            'aodh-api',
+        ],
+        'cmp-1': [
+            'nova-compute',
+            'neutron-openvswitch-agent',
+        ],
+        'cmp-2': [
+            'nova-compute',
+            'neutron-openvswitch-agent',
+        ],
+    }
+
+    upgrade = {
+        'id': 'd174522c-95fc-4996-8dfa-0c2405a3b0c1',
+        'cluster_id': '2ba8fad8-3a0f-47db-a45b-62df1d811687',
+        'from_version': constants.MITAKA,
+        'to_version': constants.NEWTON,
+        'upgrade_start_time': datetime.datetime.utcnow(),
+        'upgrade_end_time': None,
+        'status': constants.READY_FOR_UPGRADE,
+    }
+
+    @classmethod
+    def get_fake_cluster_topology(cls, assignment):
+        hosts, services = [], []
+
+        for hostname, names in sorted(assignment.items()):
+            host = {'id': hostname, 'hostname': hostname, 'services': []}
+            for name in names:
+                service = {'id': '%s@%s' % (name, hostname), 'name': name}
+                host['services'].append(service['id'])
+                services.append(service)
+            hosts.append(host)
+
+        return hosts, services
+
+    def setUp(self):
+        super(TestDependencyGraphEngine, self).setUp()
+        self.engine = engines.DependencyGraph(
+            self.upgrade, MockUpgradeDriver()
+        )
+
+        patcher = mock.patch(
+            'kostyor.upgrades.engines.dependencygraph.dbapi')
+        self.addCleanup(patcher.stop)
+        self.dbapi = patcher.start()
+        self.dbapi.get_cluster_topology.return_value = \
+            self.get_fake_cluster_topology(self.assignment)
+
+        patcher = mock.patch('kostyor.upgrades.engines.base.dbapi')
+        self.addCleanup(patcher.stop)
+        self.stepsapi = fake_steps_api(patcher.start())
+
+    def _get_stages(self, assignment):
+        hosts, services = self.get_fake_cluster_topology(assignment)
+        services = {service['id']: service for service in services}
+
+        return [
+            [(service['name'], host['hostname']) for service, host in stage]
+            for stage in dependencygraph.getstages(hosts, services)
+        ]
+
+    def test_getstages(self):
+        self.assertEqual([
+            [('keystone-wsgi-admin', 'ctrl-1')],
+            [('keystone-wsgi-admin', 'ctrl-2')],
+            [('nova-conductor', 'ctrl-1')],
+            [('nova-api', 'ctrl-1')],
+            [('nova-api', 'ctrl-2')],
+            [('nova-compute', 'cmp-1'), ('nova-compute', 'cmp-2')],
+            [('neutron-server', 'ctrl-1')],
+            [('neutron-openvswitch-agent', 'ctrl-1')],
+            [('neutron-openvswitch-agent', 'cmp-1'),
+             ('neutron-openvswitch-agent', 'cmp-2')],
+            [('heat-api', 'ctrl-1')],
+            [('heat-api', 'ctrl-2'), ('aodh-api', 'ctrl-1')],
+            [('aodh-api', 'ctrl-3')],
+        ], self._get_stages(self.assignment))
+
+    def test_getstages_independent_projects(self):
+        self.assertEqual([
+            [('keystone-wsgi-admin', 'ctrl-1')],
+            [('aodh-api', 'ctrl-2'),
+             ('gnocchi-api', 'ctrl-3'),
+             ('swift-proxy-server', 'ctrl-4')],
+        ], self._get_stages({
+            'ctrl-1': ['keystone-wsgi-admin'],
+            'ctrl-2': ['aodh-api'],
+            'ctrl-3': ['gnocchi-api'],
+            'ctrl-4': ['swift-proxy-server'],
+        }))
+
+    def test_getstages_cyclic_dependency(self):
+        # Compiled scenario is free of cycles, so the one here bypasses
+        # validation in order to check the graph is checked too.
+        index = scenario.COMPILED_SCENARIO
+        index = index._replace(requirements=dict(
+            index.requirements, Keystone=frozenset(['Glance'])))
+
+        with mock.patch.object(dependencygraph, 'COMPILED_SCENARIO', index):
+            self.assertRaises(exceptions.CyclicDependency,
+                              self._get_stages,
+                              {'ctrl-1': ['keystone-wsgi-admin'],
+                               'ctrl-2': ['glance-api']})
+
+    def test_start(self):
+        self.engine.start()
+
+        self.engine.driver.pre_upgrade.assert_called_once_with()
+        self.assertEqual(15, self.engine.driver.start.call_count)
+
+        plan = getplan(self.stepsapi)
+        self.assertEqual(13, len(plan))
+        self.assertEqual([[('nova-api', ['ctrl-2'])]], plan[5])
+        self.assertEqual(
+            [[('nova-compute', ['cmp-1'])], [('nova-compute', ['cmp-2'])]],
+            plan[6])
@@ -3,10 +3,11 @@ import datetime
 import mock
 import oslotest.base
 
-from kostyor.common import constants
+from kostyor.common import constants, exceptions
 from kostyor.upgrades import engines
+from kostyor.upgrades.engines import nodebynode, scenario
 
-from .common import MockUpgradeDriver
+from .common import MockUpgradeDriver, fake_steps_api, getplan
 
 
 class TestNodeByNodeEngine(oslotest.base.BaseTestCase):
@@ -42,7 +43,31 @@ class TestNodeByNodeEngine(oslotest.base.BaseTestCase):
         patcher = mock.patch('kostyor.upgrades.engines.nodebynode.dbapi')
         self.addCleanup(patcher.stop)
         self.dbapi = patcher.start()
-        self.dbapi.get_hosts_by_cluster.return_value = self.hosts
+
+        patcher = mock.patch('kostyor.upgrades.engines.base.dbapi')
+        self.addCleanup(patcher.stop)
+        self.stepsapi = fake_steps_api(patcher.start())
+
+    @classmethod
+    def get_fake_cluster_topology(cls, assignment, hosts=None):
+        hosts = [dict(host, services=[]) for host in hosts or cls.hosts]
+        services = {}
+
+        for host in hosts:
+            for service in assignment.get(host['id'], []):
+                service = services.setdefault(
+                    service['name'],
+                    dict(service, id=service['name'], hosts=[]))
+                service['hosts'].append(host['id'])
+                host['services'].append(service['id'])
+
+        return hosts, list(services.values())
+
+    def get_upgrade_steps(self):
+        return [
+            (service['name'], [host['hostname'] for host in hosts])
+            for (service, hosts), _ in self.engine.driver.start.call_args_list
+        ]
 
     def test_multinode_assignment(self):
         assignment = {
@@ -80,40 +105,41 @@ class TestNodeByNodeEngine(oslotest.base.BaseTestCase):
                 {'name': 'cinder-volume'},
             ],
         }
-        self.dbapi.get_services_by_host = lambda host: assignment.get(host, [])
+        self.dbapi.get_cluster_topology.return_value = \
+            self.get_fake_cluster_topology(assignment)
 
         self.engine.start()
 
         self.engine.driver.pre_upgrade.assert_called_once_with()
         self.assertEqual([
             # controller
-            mock.call({'name': 'keystone-wsgi-admin'}, [self.hosts[1]]),
-            mock.call({'name': 'keystone-wsgi-public'}, [self.hosts[1]]),
-            mock.call({'name': 'glance-api'}, [self.hosts[1]]),
-            mock.call({'name': 'glance-registry'}, [self.hosts[1]]),
-            mock.call({'name': 'nova-conductor'}, [self.hosts[1]]),
-            mock.call({'name': 'nova-scheduler'}, [self.hosts[1]]),
-            mock.call({'name': 'nova-spicehtml5proxy'}, [self.hosts[1]]),
-            mock.call({'name': 'nova-api'}, [self.hosts[1]]),
-            mock.call({'name': 'neutron-server'}, [self.hosts[1]]),
-            mock.call({'name': 'neutron-linuxbridge-agent'}, [self.hosts[1]]),
-            mock.call({'name': 'neutron-l3-agent'}, [self.hosts[1]]),
-            mock.call({'name': 'neutron-dhcp-agent'}, [self.hosts[1]]),
-            mock.call({'name': 'neutron-metering-agent'}, [self.hosts[1]]),
-            mock.call({'name': 'neutron-metadata-agent'}, [self.hosts[1]]),
-            mock.call({'name': 'neutron-ns-metadata-proxy'}, [self.hosts[1]]),
-            mock.call({'name': 'cinder-api'}, [self.hosts[1]]),
-            mock.call({'name': 'cinder-scheduler'}, [self.hosts[1]]),
-            mock.call({'name': 'heat-api'}, [self.hosts[1]]),
-            mock.call({'name': 'heat-engine'}, [self.hosts[1]]),
-            mock.call({'name': 'heat-api-cfn'}, [self.hosts[1]]),
-            mock.call({'name': 'heat-api-cloudwatch'}, [self.hosts[1]]),
+            ('keystone-wsgi-admin', ['host-2']),
+            ('keystone-wsgi-public', ['host-2']),
+            ('glance-api', ['host-2']),
+            ('glance-registry', ['host-2']),
+            ('nova-conductor', ['host-2']),
+            ('nova-scheduler', ['host-2']),
+            ('nova-spicehtml5proxy', ['host-2']),
+            ('nova-api', ['host-2']),
+            ('neutron-server', ['host-2']),
+            ('neutron-linuxbridge-agent', ['host-2']),
+            ('neutron-l3-agent', ['host-2']),
+            ('neutron-dhcp-agent', ['host-2']),
+            ('neutron-metering-agent', ['host-2']),
+            ('neutron-metadata-agent', ['host-2']),
+            ('neutron-ns-metadata-proxy', ['host-2']),
+            ('cinder-api', ['host-2']),
+            ('cinder-scheduler', ['host-2']),
+            ('heat-api', ['host-2']),
+            ('heat-engine', ['host-2']),
+            ('heat-api-cfn', ['host-2']),
+            ('heat-api-cloudwatch', ['host-2']),
             # compute
-            mock.call({'name': 'nova-compute'}, [self.hosts[0]]),
-            mock.call({'name': 'neutron-linuxbridge-agent'}, [self.hosts[0]]),
+            ('nova-compute', ['host-1']),
+            ('neutron-linuxbridge-agent', ['host-1']),
             # storage
-            mock.call({'name': 'cinder-volume'}, [self.hosts[2]]),
-        ], self.engine.driver.start.call_args_list)
+            ('cinder-volume', ['host-3']),
+        ], self.get_upgrade_steps())
 
     def test_all_in_one_assignment(self):
         assignment = {
@@ -143,33 +169,140 @@ class TestNodeByNodeEngine(oslotest.base.BaseTestCase):
                 {'name': 'cinder-volume'},
             ],
         }
-        self.dbapi.get_services_by_host = lambda host: assignment.get(host, [])
+        self.dbapi.get_cluster_topology.return_value = \
+            self.get_fake_cluster_topology(assignment)
 
         self.engine.start()
 
         self.engine.driver.pre_upgrade.assert_called_once_with()
         self.assertEqual([
-            mock.call({'name': 'keystone-wsgi-admin'}, [self.hosts[0]]),
-            mock.call({'name': 'keystone-wsgi-public'}, [self.hosts[0]]),
-            mock.call({'name': 'glance-api'}, [self.hosts[0]]),
-            mock.call({'name': 'glance-registry'}, [self.hosts[0]]),
-            mock.call({'name': 'nova-conductor'}, [self.hosts[0]]),
-            mock.call({'name': 'nova-scheduler'}, [self.hosts[0]]),
-            mock.call({'name': 'nova-spicehtml5proxy'}, [self.hosts[0]]),
-            mock.call({'name': 'nova-api'}, [self.hosts[0]]),
-            mock.call({'name': 'nova-compute'}, [self.hosts[0]]),
-            mock.call({'name': 'neutron-server'}, [self.hosts[0]]),
-            mock.call({'name': 'neutron-linuxbridge-agent'}, [self.hosts[0]]),
-            mock.call({'name': 'neutron-l3-agent'}, [self.hosts[0]]),
-            mock.call({'name': 'neutron-dhcp-agent'}, [self.hosts[0]]),
-            mock.call({'name': 'neutron-metering-agent'}, [self.hosts[0]]),
-            mock.call({'name': 'neutron-metadata-agent'}, [self.hosts[0]]),
-            mock.call({'name': 'neutron-ns-metadata-proxy'}, [self.hosts[0]]),
-            mock.call({'name': 'cinder-api'}, [self.hosts[0]]),
-            mock.call({'name': 'cinder-scheduler'}, [self.hosts[0]]),
-            mock.call({'name': 'cinder-volume'}, [self.hosts[0]]),
-            mock.call({'name': 'heat-api'}, [self.hosts[0]]),
-            mock.call({'name': 'heat-engine'}, [self.hosts[0]]),
-            mock.call({'name': 'heat-api-cfn'}, [self.hosts[0]]),
-            mock.call({'name': 'heat-api-cloudwatch'}, [self.hosts[0]]),
-        ], self.engine.driver.start.call_args_list)
+            ('keystone-wsgi-admin', ['host-1']),
+            ('keystone-wsgi-public', ['host-1']),
+            ('glance-api', ['host-1']),
+            ('glance-registry', ['host-1']),
+            ('nova-conductor', ['host-1']),
+            ('nova-scheduler', ['host-1']),
+            ('nova-spicehtml5proxy', ['host-1']),
+            ('nova-api', ['host-1']),
+            ('nova-compute', ['host-1']),
+            ('neutron-server', ['host-1']),
+            ('neutron-linuxbridge-agent', ['host-1']),
+            ('neutron-l3-agent', ['host-1']),
+            ('neutron-dhcp-agent', ['host-1']),
+            ('neutron-metering-agent', ['host-1']),
+            ('neutron-metadata-agent', ['host-1']),
+            ('neutron-ns-metadata-proxy', ['host-1']),
+            ('cinder-api', ['host-1']),
+            ('cinder-scheduler', ['host-1']),
+            ('cinder-volume', ['host-1']),
+            ('heat-api', ['host-1']),
+            ('heat-engine', ['host-1']),
+            ('heat-api-cfn', ['host-1']),
+            ('heat-api-cloudwatch', ['host-1']),
+        ], self.get_upgrade_steps())
+
+    def _start_in_waves(self, batch_size):
+        hosts = [
+            {'id': 'host-%d' % i, 'hostname': 'host-%d' % i}
+            for i in range(1, 8)
+        ]
+        assignment = {
+            'host-1': [{'name': 'nova-api'}, {'name': 'nova-compute'}],
+            'host-2': [{'name': 'nova-compute'},
+                       {'name': 'neutron-openvswitch-agent'}],
+            'host-3': [{'name': 'nova-compute'},
+                       {'name': 'neutron-openvswitch-agent'}],
+            'host-4': [{'name': 'nova-compute'}],
+            'host-5': [{'name': 'keystone-wsgi-admin'}],
+            'host-6': [{'name': 'cinder-volume'}],
+            'host-7': [{'name': 'cinder-volume'}],
+        }
+        self.dbapi.get_cluster_topology.return_value = \
+            self.get_fake_cluster_topology(assignment, hosts)
+        self.engine.driver.parameters = {'batch_size': batch_size}
+
+        self.engine.start()
+
+    def test_waves(self):
+        self._start_in_waves(2)
+
+        # Each wave is a stage of the plan with a lane per host, while
+        # the first two stages are pre-upgrade and serial upgrade of hosts.
+        self.assertEqual([
+            [[(None, [])]],
+            [[('keystone-wsgi-admin', ['host-5']),
+              ('nova-api', ['host-1']),
+              ('nova-compute', ['host-1'])]],
+            [[('nova-compute', ['host-2']),
+              ('neutron-openvswitch-agent', ['host-2'])],
+             [('nova-compute', ['host-3']),
+              ('neutron-openvswitch-agent', ['host-3'])]],
+            [[('nova-compute', ['host-4'])]],
+            [[('cinder-volume', ['host-6'])],
+             [('cinder-volume', ['host-7'])]],
+        ], getplan(self.stepsapi))
+
+    def test_waves_percentage(self):
+        self._start_in_waves('50%')
+
+        plan = getplan(self.stepsapi)
+        self.assertEqual([1, 1, 2, 1, 1, 1], [len(stage) for stage in plan])
+
+    def test_invalid_batch_size_without_computes(self):
+        self.dbapi.get_cluster_topology.return_value = \
+            self.get_fake_cluster_topology(
+                {'host-1': [{'name': 'keystone-wsgi-admin'}]},
+                [{'id': 'host-1', 'hostname': 'host-1'}])
+        self.engine.driver.parameters = {'batch_size': 'lots'}
+
+        self.assertRaises(exceptions.InvalidUpgradeParameter,
+                          self.engine.start)
+
+    def test_waves_invalid_batch_size(self):
+        for batch_size in (0, -1, 1.5, '0%', '120%', 'a lot', True):
+            self.assertRaises(exceptions.InvalidUpgradeParameter,
+                              self._start_in_waves,
+                              batch_size)
+
+
+class TestScenarioIndex(oslotest.base.BaseTestCase):
+
+    def test_names_are_unique_and_ranked(self):
+        index = scenario.COMPILED_SCENARIO
+
+        self.assertEqual(len(set(index.names)), len(index.names))
+        self.assertEqual(
+            list(range(len(index.names))),
+            [index.ranks[name] for name in index.names])
+
+    def test_priorities(self):
+        index = scenario.COMPILED_SCENARIO
+
+        self.assertEqual(0, index.priorities['keystone-wsgi-admin'])
+        self.assertLess(index.priorities['ironic-api'],
+                        index.priorities['nova-compute'])
+        self.assertLess(index.priorities['nova-compute'],
+                        index.priorities['cinder-volume'])
+
+    def test_tags_and_projects(self):
+        index = scenario.COMPILED_SCENARIO
+
+        self.assertEqual(frozenset(['controller', 'compute']),
+                         index.tags['neutron-openvswitch-agent'])
+        self.assertEqual('Neutron',
+                         index.projects['neutron-openvswitch-agent'])
+
+    def test_iterhosts_unknown_services_go_last(self):
+        hosts = [
+            {'id': 'host-1', 'services': ['service-1']},
+            {'id': 'host-2', 'services': []},
+            {'id': 'host-3', 'services': ['service-2']},
+        ]
+        services = {
+            'service-1': {'id': 'service-1', 'name': 'unknown-service'},
+            'service-2': {'id': 'service-2', 'name': 'nova-compute'},
+        }
+
+        self.assertEqual(
+            ['host-3', 'host-1', 'host-2'],
+            [host['id'] for host in nodebynode.iterhosts(hosts, services)])
@@ -0,0 +1,101 @@
+import oslotest.base
+
+from kostyor.common import exceptions
+from kostyor.upgrades.engines import scenario
+from kostyor.upgrades.engines.scenario import Project, Service
+
+
+class TestCompileScenario(oslotest.base.BaseTestCase):
+
+    def test_scenario_has_no_duplicates(self):
+        names = [
+            service.name
+            for project in scenario.SCENARIO
+            for service in project.services
+        ]
+
+        self.assertEqual(len(set(names)), len(names))
+
+    def test_tables_are_immutable(self):
+        index = scenario.COMPILED_SCENARIO
+
+        for table in (index.ranks, index.priorities, index.tags,
+                      index.projects, index.members, index.requirements):
+            with self.assertRaises(TypeError):
+                table['nova-api'] = 42
+
+        self.assertIsInstance(index.names, tuple)
+        self.assertIsInstance(index.members['Nova'], tuple)
+        self.assertIsInstance(index.requirements['Nova'], frozenset)
+
+    def test_members_and_requirements(self):
+        index = scenario.COMPILED_SCENARIO
+
+        self.assertEqual(('cinder-api', 'cinder-scheduler', 'cinder-volume'),
+                         index.members['Cinder'])
+        self.assertEqual(frozenset(['Keystone', 'Glance']),
+                         index.requirements['Nova'])
+        self.assertEqual(frozenset(), index.requirements['Keystone'])
+
+    def test_project_without_requirements(self):
+        index = scenario.compile_scenario([
+            Project('Keystone', [Service('keystone-api', ['controller'])]),
+        ], {})
+
+        self.assertEqual(frozenset(), index.requirements['Keystone'])
+
+    def test_identical_duplicates_are_merged(self):
+        index = scenario.compile_scenario([
+            Project('Swift', [
+                Service('swift-object-server', ['storage']),
+                Service('swift-proxy-server', ['controller']),
+                Service('swift-object-server', ['storage']),
+            ]),
+        ], {})
+
+        self.assertEqual(('swift-object-server', 'swift-proxy-server'),
+                         index.names)
+        self.assertEqual(('swift-object-server', 'swift-proxy-server'),
+                         index.members['Swift'])
+
+    def test_conflicting_duplicates(self):
+        self.assertRaises(
+            exceptions.InvalidScenario,
+            scenario.compile_scenario, [
+                Project('Swift', [
+                    Service('swift-object-server', ['storage']),
+                    Service('swift-object-server', ['controller']),
+                ]),
+            ], {})
+
+    def test_duplicate_projects(self):
+        self.assertRaises(
+            exceptions.InvalidScenario,
+            scenario.compile_scenario, [
+                Project('Nova', [Service('nova-api', ['controller'])]),
+                Project('Nova', [Service('nova-compute', ['compute'])]),
+            ], {})
+
+    def test_unknown_tags(self):
+        for tags in (['network'], []):
+            self.assertRaises(
+                exceptions.InvalidScenario,
+                scenario.compile_scenario, [
+                    Project('Nova', [Service('nova-api', tags)]),
+                ], {})
+
+    def test_unknown_requirements(self):
+        projects = [Project('Nova', [Service('nova-api', ['controller'])])]
+
+        for requirements in ({'Nova': ['Keystone']}, {'Glance': []}):
+            self.assertRaises(
+                exceptions.InvalidScenario,
+                scenario.compile_scenario, projects, requirements)
+
+    def test_cyclic_requirements(self):
+        self.assertRaises(
+            exceptions.CyclicDependency,
+            scenario.compile_scenario, [
+                Project('Keystone', [Service('keystone-api', ['controller'])]),
+                Project('Glance', [Service('glance-api', ['controller'])]),
+            ], {'Keystone': ['Glance'], 'Glance': ['Keystone']})
@@ -6,7 +6,7 @@ import oslotest.base
 from kostyor.common import constants
 from kostyor.upgrades import engines
 
-from .common import MockUpgradeDriver
+from .common import MockUpgradeDriver, fake_steps_api
 
 
 class TestServiceByServiceEngine(oslotest.base.BaseTestCase):
@@ -36,23 +36,15 @@ class TestServiceByServiceEngine(oslotest.base.BaseTestCase):
     }
 
     @classmethod
-    def get_fake_get_service_with_hosts(cls, assignment):
-        def get_service_with_hosts(service_name, cluster_id):
-            service = None
-            hosts = []
-
-            for hostid, services in assignment.items():
-                try:
-                    tmp_service = next(
-                        svc for svc in services if svc['name'] == service_name)
-                except StopIteration:
-                    continue
-                else:
-                    service = tmp_service
-                    hosts.append(hostid)
-
-            return service, list(filter(lambda h: h['id'] in hosts, cls.hosts))
-        return get_service_with_hosts
+    def get_fake_services_with_hosts(cls, assignment):
+        services = {}
+
+        for host in cls.hosts:
+            for service in assignment.get(host['id'], []):
+                entry = services.setdefault(service['name'], (service, []))
+                entry[1].append(host)
+
+        return {name: [entry] for name, entry in services.items()}
 
     def setUp(self):
         super(TestServiceByServiceEngine, self).setUp()
@@ -64,6 +56,10 @@ class TestServiceByServiceEngine(oslotest.base.BaseTestCase):
         self.addCleanup(patcher.stop)
         self.dbapi = patcher.start()
 
+        patcher = mock.patch('kostyor.upgrades.engines.base.dbapi')
+        self.addCleanup(patcher.stop)
+        self.stepsapi = fake_steps_api(patcher.start())
+
     def test_multinode_assignment(self):
         assignment = {
             # compute
@@ -101,8 +97,8 @@ class TestServiceByServiceEngine(oslotest.base.BaseTestCase):
             ],
         }
 
-        self.dbapi.get_service_with_hosts = \
-            self.get_fake_get_service_with_hosts(assignment)
+        self.dbapi.get_services_with_hosts.return_value = \
+            self.get_fake_services_with_hosts(assignment)
 
         self.engine.start()
 
@@ -163,8 +159,8 @@ class TestServiceByServiceEngine(oslotest.base.BaseTestCase):
             ],
         }
 
-        self.dbapi.get_service_with_hosts = \
-            self.get_fake_get_service_with_hosts(assignment)
+        self.dbapi.get_services_with_hosts.return_value = \
+            self.get_fake_services_with_hosts(assignment)
 
         self.engine.start()
 
@@ -0,0 +1,40 @@
+import mock
+import oslotest.base
+
+from kostyor.rpc import tasks
+from kostyor.upgrades.drivers import base
+from kostyor.upgrades.drivers import noop
+
+
+class TestUpgradeDriver(oslotest.base.BaseTestCase):
+
+    class Driver(base.UpgradeDriver):
+
+        start = mock.Mock(side_effect=lambda service, hosts: tasks.execute.si(
+            [service['name']] + [host['hostname'] for host in hosts]))
+
+    def test_start_many(self):
+        hosts = [{'hostname': 'host-1'}, {'hostname': 'host-2'}]
+
+        signature = self.Driver().start_many(
+            [{'name': 'nova-api'}, {'name': 'nova-conductor'}], hosts)
+
+        self.assertFalse(self.Driver.coalesce)
+        self.assertEqual('celery.chain', signature['task'])
+        self.assertEqual(
+            [(['nova-api', 'host-1', 'host-2'],),
+             (['nova-conductor', 'host-1', 'host-2'],)],
+            [task.args for task in signature.tasks])
+
+
+class TestNoopDriver(oslotest.base.BaseTestCase):
+
+    def test_start_many(self):
+        driver = noop.NoopDriver()
+
+        signature = driver.start_many(
+            [{'name': 'nova-api'}, {'name': 'nova-conductor'}],
+            [{'hostname': 'host-1'}])
+
+        self.assertTrue(driver.coalesce)
+        self.assertEqual(tasks.noop.name, signature['task'])
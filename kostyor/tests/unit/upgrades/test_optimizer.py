@@ -0,0 +1,69 @@
+import celery
+import oslotest.base
+
+from kostyor.rpc import tasks
+from kostyor.upgrades import optimizer
+
+
+def _execute(name):
+    return tasks.execute.si([name])
+
+
+def _names(signature):
+    if signature['task'] in ('celery.chain', 'celery.group'):
+        return (signature['task'].split('.')[1],
+                [_names(task) for task in signature.tasks])
+    return signature.args[0][0]
+
+
+class TestOptimize(oslotest.base.BaseTestCase):
+
+    def test_task(self):
+        signature = _execute('a')
+
+        self.assertEqual((signature, 0), optimizer.optimize(signature))
+
+    def test_noop(self):
+        self.assertEqual((None, 1), optimizer.optimize(tasks.noop.si()))
+
+    def test_noops_dropped(self):
+        signature, saved = optimizer.optimize(celery.chain(
+            tasks.noop.si(), _execute('a'), tasks.noop.si(), _execute('b')))
+
+        self.assertEqual(('chain', ['a', 'b']), _names(signature))
+        self.assertEqual(2, saved)
+
+    def test_nothing_left(self):
+        signature, saved = optimizer.optimize(celery.group(
+            tasks.noop.si(), celery.chain(tasks.noop.si(), tasks.noop.si())))
+
+        self.assertIsNone(signature)
+        self.assertEqual(3, saved)
+
+    def test_single_task_unwrapped(self):
+        signature, saved = optimizer.optimize(
+            celery.group(tasks.noop.si(), _execute('a')))
+
+        self.assertEqual('a', _names(signature))
+        self.assertEqual(1, saved)
+
+    def test_chains_flattened(self):
+        # Please note, Celery turns a group followed by a task into a chord
+        # when chained, so the group is put at the end here.
+        signature, saved = optimizer.optimize(celery.chain(
+            _execute('a'),
+            celery.chain(_execute('b'), tasks.noop.si()),
+            celery.group(
+                celery.chain(_execute('c'), tasks.noop.si()),
+                celery.group(_execute('d'), _execute('e')))))
+
+        self.assertEqual(
+            ('chain', ['a', 'b', ('group', ['c', 'd', 'e'])]),
+            _names(signature))
+        self.assertEqual(2, saved)
+
+    def test_chord_left_as_is(self):
+        signature = celery.chord([tasks.noop.si(), _execute('a')],
+                                 _execute('b'))
+
+        self.assertEqual((signature, 0), optimizer.optimize(signature))
@@ -1,15 +1,38 @@
 import abc
+
+import celery
 import six
 
+from kostyor.conf import CONF
 from kostyor.rpc import tasks
 
 
 @six.add_metaclass(abc.ABCMeta)
 class UpgradeDriver():
 
+    #: Whether consecutive steps of a lane that run on the same hosts may be
+    #: executed at one go, see :meth:`start_many`. If they are, a failure of
+    #: any of them makes all of them executed once again on resume.
+    coalesce = False
+
     def __init__(self, parameters=None):
         self.parameters = parameters or {}
 
+    def getrefs(self, objects):
+        """Get hosts or services to be passed to tasks.
+
+        In reference-passing mode, see ``[upgrades] pass_references``, only
+        IDs are passed, so messages don't carry attributes of the same hosts
+        over and over again. Tasks resolve them on workers through
+        :mod:`kostyor.rpc.topology`.
+
+        :param objects: a list of hosts or services
+        :returns: a list of either IDs or given objects
+        """
+        if CONF.upgrades.pass_references:
+            return [obj['id'] for obj in objects]
+        return objects
+
     def pre_upgrade(self):
         """Get tasks to be executed before main upgrade procedure.
 
@@ -25,3 +48,19 @@ class UpgradeDriver():
         :param hosts: a list of hosts to run upgrade on
         :returns: a celery signature
         """
+
+    def start_many(self, services, hosts):
+        """Get tasks to upgrade given services one by one on given hosts.
+
+        It's used instead of :meth:`start` for consecutive steps on the same
+        hosts if :attr:`coalesce` is set. Drivers may override it in order
+        to upgrade all the services by one task, e.g. by one multi-command
+        process.
+
+        :param services: a list of services to be upgraded
+        :param hosts: a list of hosts to run upgrade on
+        :returns: a celery signature
+        """
+        return celery.chain(*[
+            self.start(service, hosts) for service in services
+        ])
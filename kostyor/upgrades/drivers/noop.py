@@ -4,5 +4,10 @@ from kostyor.rpc import tasks
 
 class NoopDriver(base.UpgradeDriver):
 
+    coalesce = True
+
     def start(self, service, hosts):
         return tasks.noop.si()
+
+    def start_many(self, services, hosts):
+        return tasks.noop.si()
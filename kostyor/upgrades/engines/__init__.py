@@ -1,8 +1,16 @@
+from .base import UpgradeEngine, advance, dispatch, resume, stop
+from .dependencygraph import DependencyGraph
 from .nodebynode import NodeByNode
 from .servicebyservice import ServiceByService
 
 
 __all__ = [
+    'DependencyGraph',
     'NodeByNode',
     'ServiceByService',
+    'UpgradeEngine',
+    'advance',
+    'dispatch',
+    'resume',
+    'stop',
 ]
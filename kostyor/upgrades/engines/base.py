@@ -0,0 +1,271 @@
+import abc
+import itertools
+import logging
+import operator
+
+import celery
+import six
+import stevedore
+
+from celery.contrib.abortable import AbortableAsyncResult
+from celery.result import AsyncResult
+
+from kostyor.common import constants
+from kostyor.conf import CONF
+from kostyor.db import api as dbapi
+from kostyor.rpc import tasks, topology
+from kostyor.rpc.app import app
+from kostyor.upgrades import optimizer
+
+
+LOG = logging.getLogger(__name__)
+
+_getlane = operator.itemgetter('stage', 'lane')
+
+
+def _gettaskids(signature):
+    # Driver may return a task as well as a chain, a group or a chord of
+    # tasks, so in order to be able to revoke them all, we need to collect
+    # IDs of every single task.
+    taskids = []
+    for task in getattr(signature, 'tasks', None) or []:
+        taskids.extend(_gettaskids(task))
+
+    if getattr(signature, 'body', None) is not None:
+        taskids.extend(_gettaskids(signature.body))
+
+    if not hasattr(signature, 'tasks'):
+        taskids.append(signature.id)
+    return taskids
+
+
+def _getsignature(driver, steps):
+    if steps[0]['service'] is None:
+        return driver.pre_upgrade()
+
+    if len(steps) == 1:
+        return driver.start(steps[0]['service'], steps[0]['hosts'])
+
+    # Coalesced steps are on the same hosts.
+    return driver.start_many(
+        [step['service'] for step in steps], steps[0]['hosts'])
+
+
+def dispatch(upgrade, driver, window=None):
+    """Send next steps of a given upgrade to execution.
+
+    The plan is kept in the database, and only steps that are ready to be
+    executed are sent, no more than ``window`` of them in flight at once.
+    Each step is sent as a separate chain of its tasks followed by the one
+    that marks it as completed and sends next steps, so the size of broker
+    messages doesn't depend on the size of the plan. If some of the tasks
+    fail, the step is marked as failed instead. IDs of tasks are recorded
+    before sending, so the upgrade can be stopped at any time.
+
+    Tasks are optimized before sending, see :func:`optimizer.optimize`,
+    and steps with nothing left to be executed are completed right away.
+    Consecutive steps on the same hosts are sent as one chain if the
+    driver allows it, see :attr:`UpgradeDriver.coalesce`.
+
+    :param upgrade: an upgrade task the steps belong to
+    :param driver: an upgrade driver to get tasks of steps from
+    :param window: a maximum number of steps in flight at once;
+                   ``[upgrades] dispatch_window`` is used if not passed
+    :returns: a number of broker round trips saved by optimizations
+    """
+    saved, seen = 0, set()
+
+    while True:
+        steps = dbapi.claim_upgrade_steps(
+            upgrade['id'], window or CONF.upgrades.dispatch_window,
+            coalesce=driver.coalesce)
+
+        # Steps completed right away are never claimed again, unless
+        # something has gone wrong, and then it's better to stop here than
+        # to spin forever.
+        if not set(step['id'] for step in steps) - seen:
+            break
+        seen.update(step['id'] for step in steps)
+
+        # Claimed steps of the same lane are coalesced ones.
+        if driver.coalesce:
+            runs = [list(run) for _, run in itertools.groupby(steps, _getlane)]
+        else:
+            runs = [[step] for step in steps]
+
+        taskids, supertasks, completed = {}, [], []
+        for run in runs:
+            stepids = [step['id'] for step in run]
+
+            # Coalesced steps are marked as completed by one task.
+            saved += len(run) - 1
+
+            signature, hops = optimizer.optimize(_getsignature(driver, run))
+            saved += hops
+
+            if signature is None:
+                completed.extend(stepids)
+                saved += 1
+                continue
+
+            # Execute gathered tasks one-by-one preserving order. Please
+            # note, that it doesn't mean there can't be parallel execution
+            # since driver may return a Celery group of tasks instead, and
+            # in that case the group will be executed instead.
+            supertask = celery.chain(
+                signature, tasks.complete_step.si(*stepids))
+
+            # Failed steps would otherwise stay in progress forever and take
+            # a place in the window.
+            supertask.link_error(tasks.fail_step.si(*stepids))
+
+            # Freezing assigns IDs to tasks of the chain in-place, and they
+            # are kept once the chain is sent. The chain may hold copies of
+            # given signatures, so IDs are taken from its own tasks.
+            supertask.freeze()
+            for stepid in stepids:
+                taskids[stepid] = _gettaskids(supertask)
+            supertasks.append(supertask)
+
+        if supertasks:
+            dbapi.set_upgrade_task_ids(taskids)
+
+        for supertask in supertasks:
+            supertask.apply_async()
+
+        # Steps completed right away may unblock next ones.
+        if not completed:
+            break
+        dbapi.complete_upgrade_steps(completed)
+
+    if saved:
+        LOG.info('Upgrade %s: %d broker round trips saved by optimizations',
+                 upgrade['id'], saved)
+    return saved
+
+
+def advance(upgrade):
+    """Send next steps of a given upgrade once some steps have completed.
+
+    It's called by workers, so the upgrade driver is loaded once again
+    with parameters the upgrade has been started with.
+
+    :param upgrade: an upgrade task to advance
+    """
+    driver = stevedore.driver.DriverManager(
+        namespace='kostyor.upgrades.drivers',
+        name=upgrade['driver'] or 'noop',
+        invoke_on_load=True,
+        invoke_kwds={'parameters': upgrade['parameters'] or {}},
+    ).driver
+    dispatch(upgrade, driver)
+
+
+def _isactive(step):
+    # Tasks are either waiting in a queue or being executed until they are
+    # ready. Yet tasks that follow a failed or revoked one in the chain are
+    # never sent, so they'd never be ready.
+    results = [
+        AsyncResult(taskid, app=app) for taskid in step['task_ids'] or []
+    ]
+    if any(result.ready() and not result.successful() for result in results):
+        return False
+    return any(not result.ready() for result in results)
+
+
+def resume(upgrade, driver):
+    """Resume a given upgrade from the step it has been stopped at.
+
+    Only steps that haven't been executed yet are dispatched, so there's
+    no need to plan the upgrade once again. Failed steps are executed once
+    again, and so are steps in progress whose tasks are no longer active.
+    Steps that are still being executed, since they have been let finish
+    on pause, are left in progress and advance the upgrade once completed.
+
+    The cluster may have been rediscovered while the upgrade was paused,
+    so cached topology is invalidated before steps are sent.
+
+    :param upgrade: an upgrade task to resume
+    :param driver: an upgrade driver to get tasks of steps from
+    """
+    steps = dbapi.get_upgrade_steps(upgrade['id'], statuses=[
+        constants.STEP_IN_PROGRESS,
+    ])
+    dbapi.reset_upgrade_steps(upgrade['id'], active=[
+        step['id'] for step in steps if _isactive(step)
+    ])
+    topology.invalidate()
+    dispatch(upgrade, driver)
+
+
+def stop(upgrade, abort=False):
+    """Stop a given upgrade by aborting tasks of steps in flight.
+
+    Steps are sent to execution as previous ones complete, so once the
+    upgrade isn't in progress anymore, it halts right after steps in
+    flight. They are either aborted or let finish.
+
+    Steps in flight are marked as cancelled once the upgrade is, so tasks
+    of cancelled steps are aborted too. Steps that haven't been sent to
+    execution have no tasks.
+
+    :param upgrade: an upgrade task to stop
+    :param abort: abort steps that are being executed if True
+    """
+    if not abort:
+        return
+
+    steps = dbapi.get_upgrade_steps(upgrade['id'], statuses=[
+        constants.STEP_IN_PROGRESS,
+        constants.STEP_CANCELLED,
+    ])
+    taskids = [
+        taskid for step in steps for taskid in step['task_ids'] or []
+    ]
+    if not taskids:
+        return
+
+    # Tasks that haven't been started yet are discarded by workers once
+    # received, while running ones are aborted. Only tasks based on
+    # AbortableTask check whether they are aborted, and abort for others
+    # is no-op.
+    app.control.revoke(taskids)
+    for taskid in taskids:
+        AbortableAsyncResult(taskid, app=app).abort()
+
+
+@six.add_metaclass(abc.ABCMeta)
+class UpgradeEngine(object):
+    """Base class for upgrade engines.
+
+    Engine is responsible for determining a sequence of steps to take for
+    the upgrade, i.e. for a plan. The plan is then persisted, so the upgrade
+    can be resumed without re-planning, and sent to execution.
+
+    :param upgrade: an upgrade task to proceed with
+    :param driver: an upgrade driver to get tasks of steps from
+    """
+
+    def __init__(self, upgrade, driver):
+        self._upgrade = upgrade
+        self.driver = driver
+
+    @abc.abstractmethod
+    def plan(self):
+        """Get a plan of the upgrade.
+
+        :returns: a list of stages executed one by one; each stage is a list
+                  of lanes executed in parallel; each lane is a list of
+                  (service, hosts) steps executed one by one
+        """
+
+    def start(self):
+        plan = [[lane for lane in stage if lane] for stage in self.plan()]
+        plan = [stage for stage in plan if stage]
+
+        # The step that's executed before the main upgrade procedure is the
+        # only one without a service.
+        plan.insert(0, [[(None, [])]])
+
+        dbapi.create_upgrade_steps(self._upgrade['id'], plan)
+        dispatch(self._upgrade, self.driver)
@@ -0,0 +1,135 @@
+import collections
+
+from kostyor.common import exceptions
+from kostyor.db import api as dbapi
+from .base import UpgradeEngine
+from .nodebynode import gethostrole, iterservices
+from .scenario import COMPILED_SCENARIO
+
+
+def getstages(hosts, services):
+    """Get stages of upgrade steps respecting dependencies between them.
+
+    The dependency graph is built from SCENARIO by the following rules:
+
+      - services of the same host are upgraded one-by-one in SCENARIO order
+      - projects are upgraded after projects they require (see REQUIREMENTS)
+      - within a project, services of computes and storages are upgraded
+        only after the ones of controllers
+      - the same service is upgraded on controllers one-by-one in order
+        to keep it available
+
+    Each step is put into the earliest stage where all its dependencies are
+    already satisfied, so the steps of the same stage may be executed in
+    parallel, and the number of stages is the critical path length.
+
+    :param hosts: a list of hosts, each with a list of its service IDs
+    :param services: a mapping of service IDs to services
+    :returns: a list of stages, each is a list of (service, host) pairs
+    """
+    index = COMPILED_SCENARIO
+
+    # Beside steps, the graph has auxiliary barrier nodes per project in
+    # order to avoid quadratic number of edges between projects. Barriers
+    # are never emitted as steps and don't take a stage.
+    predecessors = collections.defaultdict(set)
+    steps = {}
+    projects = collections.defaultdict(list)
+    controllers = {}
+
+    for host in sorted(hosts, key=lambda host: host['hostname']):
+        role = gethostrole(host, services)
+        previous = None
+
+        for service in iterservices(host, services):
+            step = (service['id'], host['id'])
+            steps[step] = (service, host)
+
+            project = index.projects[service['name']]
+            projects[project].append(step)
+
+            predecessors[step].add(('started', project))
+            if previous is not None:
+                predecessors[step].add(previous)
+            previous = step
+
+            if role is None and 'controller' in index.tags[service['name']]:
+                predecessors[('controllers', project)].add(step)
+                if service['name'] in controllers:
+                    predecessors[step].add(controllers[service['name']])
+                controllers[service['name']] = step
+            else:
+                predecessors[step].add(('controllers', project))
+
+    for project, projectsteps in projects.items():
+        predecessors[('started', project)].update(
+            ('finished', requirement)
+            for requirement in index.requirements[project]
+            if requirement in projects)
+        predecessors[('finished', project)].update(projectsteps)
+        predecessors[('controllers', project)].add(('started', project))
+
+    # Compute the longest path to each node by means of Kahn's algorithm.
+    # Since a node is visited only when all its predecessors are, it gets
+    # the final level right away.
+    successors = collections.defaultdict(list)
+    pending = {}
+    for node, nodepredecessors in predecessors.items():
+        pending[node] = len(nodepredecessors)
+        for predecessor in nodepredecessors:
+            successors[predecessor].append(node)
+            pending.setdefault(predecessor, 0)
+
+    levels = {}
+    ready = collections.deque(node for node, n in pending.items() if n == 0)
+    while ready:
+        node = ready.popleft()
+        level = max([levels[p] for p in predecessors[node]] or [0])
+        levels[node] = level + 1 if node in steps else level
+
+        for successor in successors[node]:
+            pending[successor] -= 1
+            if pending[successor] == 0:
+                ready.append(successor)
+
+    if len(levels) != len(pending):
+        raise exceptions.CyclicDependency(
+            'Cannot plan an upgrade due to cyclic dependencies.')
+
+    stages = collections.defaultdict(list)
+    for step in steps:
+        stages[levels[step]].append(step)
+
+    # Steps within a stage are sorted so the plan is reproducible.
+    def _sortkey(step):
+        service, host = steps[step]
+        return index.ranks[service['name']], host['hostname']
+
+    return [
+        [steps[step] for step in sorted(stages[level], key=_sortkey)]
+        for level in sorted(stages)
+    ]
+
+
+class DependencyGraph(UpgradeEngine):
+    """Manage an upgrade of OpenStack environment as a dependency graph.
+
+    Unlike other engines that upgrade services one-by-one, this one builds
+    a dependency graph of upgrade steps and executes independent steps in
+    parallel. That allows, for instance, to upgrade Heat and Aodh at the
+    same time. See :func:`getstages` for the rules the graph is built by.
+
+    :param upgrade: an upgrade task to proceed with
+    """
+
+    def plan(self):
+        hosts, services = dbapi.get_cluster_topology(
+            self._upgrade['cluster_id'])
+        services = {service['id']: service for service in services}
+
+        # Stages are executed one-by-one, while steps within a stage are
+        # executed in parallel, so each step takes its own lane.
+        return [
+            [[(service, [host])] for service, host in stage]
+            for stage in getstages(hosts, services)
+        ]
@@ -1,179 +1,105 @@
 import collections
+import itertools
+import math
 
-import celery
+import six
 
+from kostyor.common import exceptions
 from kostyor.db import api as dbapi
+from .base import UpgradeEngine
+from .scenario import COMPILED_SCENARIO
 
 
-Project = collections.namedtuple('Project', ['name', 'services'])
-Service = collections.namedtuple('Service', ['name', 'tags'])
-
-
-# OpenStack Rolling Upgrade Scenario
-#
-# Overall this is a huge scenario for OpenStack rolling upgrades. The OpenStack
-# services will be upgraded project-by-project in the order specified here.
-SCENARIO = [
-    Project('Keystone', [
-        Service('keystone-wsgi-admin',  ['controller']),
-        Service('keystone-wsgi-public', ['controller']),
-    ]),
-
-    Project('Glance', [
-        Service('glance-api',      ['controller']),
-        Service('glance-registry', ['controller']),
-    ]),
-
-    Project('Nova', [
-        Service('nova-conductor',       ['controller']),
-        Service('nova-scheduler',       ['controller']),
-        Service('nova-cells',           ['controller']),
-        Service('nova-cert',            ['controller']),
-        Service('nova-console',         ['controller']),
-        Service('nova-consoleauth',     ['controller']),
-        Service('nova-network',         ['controller']),
-        Service('nova-novncproxy',      ['controller']),
-        Service('nova-serialproxy',     ['controller']),
-        Service('nova-spicehtml5proxy', ['controller']),
-        Service('nova-xvpvncproxy',     ['controller']),
-        Service('nova-api',             ['controller']),
-        Service('nova-api-metadata',    ['controller']),
-        Service('nova-api-os-compute',  ['controller']),
-        Service('nova-compute',         ['compute']),
-    ]),
-
-    Project('Neutron', [
-        Service('neutron-server',            ['controller']),
-        Service('neutron-openvswitch-agent', ['controller', 'compute']),
-        Service('neutron-linuxbridge-agent', ['controller', 'compute']),
-        Service('neutron-sriov-nic-agent',   ['controller', 'compute']),
-        Service('neutron-l3-agent',          ['controller']),
-        Service('neutron-dhcp-agent',        ['controller']),
-        Service('neutron-metering-agent',    ['controller']),
-        Service('neutron-metadata-agent',    ['controller']),
-        Service('neutron-ns-metadata-proxy', ['controller']),
-    ]),
-
-    Project('Cinder', [
-        Service('cinder-api',       ['controller']),
-        Service('cinder-scheduler', ['controller']),
-        Service('cinder-volume',    ['storage']),
-    ]),
-
-    Project('Horizon', [
-        Service('horizon-wsgi',        ['controller']),
-    ]),
-
-    Project('Heat', [
-        Service('heat-api',            ['controller']),
-        Service('heat-engine',         ['controller']),
-        Service('heat-api-cfn',        ['controller']),
-        Service('heat-api-cloudwatch', ['controller']),
-    ]),
-
-    Project('Ceilometer', [
-        Service('ceilometer-collector',             ['controller']),
-        Service('ceilometer-agent-notification',    ['controller']),
-        Service('ceilometer-polling',               ['controller']),
-
-        # DEPRECATED in favor of Aodh, Gnochi and/or Panko.
-        Service('ceilometer-api',                   ['controller']),
-    ]),
-
-    Project('Aodh', [
-        Service('aodh-evaluator',   ['controller']),
-        Service('aodh-notifier',    ['controller']),
-        Service('aodh-listener',    ['controller']),
-        Service('aodh-api',         ['controller']),
-    ]),
-
-    Project('Gnocchi', [
-        Service('gnocchi-statsd',   ['controller']),
-        Service('gnocchi-metricd',  ['controller']),
-        Service('gnocchi-api',      ['controller']),
-    ]),
-
-    Project('Swift', [
-        Service('swift-proxy-server',           ['controller']),
-        Service('swift-account-auditor',        ['storage']),
-        Service('swift-account-reaper',         ['storage']),
-        Service('swift-account-replicator',     ['storage']),
-        Service('swift-account-server',         ['storage']),
-        Service('swift-account-server',         ['storage']),
-        Service('swift-container-auditor',      ['storage']),
-        Service('swift-container-reconciler',   ['storage']),
-        Service('swift-container-replicator',   ['storage']),
-        Service('swift-container-server',       ['storage']),
-        Service('swift-container-sync',         ['storage']),
-        Service('swift-container-updater',      ['storage']),
-        Service('swift-object-auditor',         ['storage']),
-        Service('swift-object-expirer',         ['storage']),
-        Service('swift-object-reconstructor',   ['storage']),
-        Service('swift-object-replicator',      ['storage']),
-        Service('swift-object-server',          ['storage']),
-        Service('swift-object-server',          ['storage']),
-        Service('swift-object-updater',         ['storage']),
-    ]),
-
-    # Does not support rolling upgrades in Newton; to be implemented in Ocata.
-    Project('Ironic', [
-        Service('ironic-inspector', ['controller']),
-        Service('ironic-conductor', ['controller']),
-        Service('ironic-api',       ['controller']),
-    ]),
-]
-
-
-def iterhosts(hosts):
-    def _sortkey(service):
-        for index, tag in enumerate(['controller', 'compute', 'storage']):
-            if tag in service.tags:
-                return index
-
-    # Generate serviceindex where first goes services of controllers, then -
-    # services of computes, and only then - ones from storages. This is an
-    # essential part for getting proper an upgrade order of hosts as it's
-    # used below to determine most important ones.
-    serviceindex = [
-        service.name
-        for service in sorted(
-            [service for project in SCENARIO for service in project.services],
-            key=_sortkey
-        )
-    ]
+def iterhosts(hosts, services):
+    """Iterate over hosts in the order they should be upgraded.
 
-    def _sortkey(host):
-        services = dbapi.get_services_by_host(host['id'])
-
-        # If no services assigned to the host let's return low priority.
-        if not services:
-            return len(serviceindex)
+    :param hosts: a list of hosts, each with a list of its service IDs
+    :param services: a mapping of service IDs to services
+    """
+    priorities = COMPILED_SCENARIO.priorities
 
+    def _sortkey(host):
         # Well, that's a tricky part. :) We need to sort hosts in the order
         # of service occurrence. Since each host may (and probably will)
         # contain multiple services, we need to use the most important
-        # one as a sort key.
-        return min((serviceindex.index(svc['name']) for svc in services))
+        # one as a sort key. If no known services assigned to the host,
+        # let's return low priority.
+        return min([
+            priorities.get(services[service]['name'], len(priorities))
+            for service in host['services']
+        ] or [len(priorities)])
     return sorted(hosts, key=_sortkey)
 
 
-def iterservices(host):
-    serviceindex = [
-        service.name for project in SCENARIO for service in project.services
-    ]
+def iterservices(host, services):
+    """Iterate over host's services in the order they should be upgraded.
+
+    :param host: a host with a list of its service IDs
+    :param services: a mapping of service IDs to services
+    """
+    ranks = COMPILED_SCENARIO.ranks
     servicemap = {
-        service['name']: service
-        for service in dbapi.get_services_by_host(host['id'])
+        services[service]['name']: services[service]
+        for service in host['services']
+        if services[service]['name'] in ranks
     }
 
-    # In order to ensure proper order we need to iterate over the service
-    # index in the order specified in SCENARIO.
-    for service in serviceindex:
-        if service in servicemap:
-            yield servicemap[service]
+    # In order to ensure proper order we need to iterate over services
+    # in the order specified in SCENARIO.
+    for name in sorted(servicemap, key=ranks.get):
+        yield servicemap[name]
+
+
+def gethostrole(host, services):
+    """Get a role of a host that can be upgraded along with its peers.
+
+    Only hosts whose services may run on computes (or storages) only are
+    considered peers. Controllers as well as hosts with mixed roles (e.g.
+    all-in-one) have no peers and must be upgraded one-by-one.
+
+    :param host: a host with a list of its service IDs
+    :param services: a mapping of service IDs to services
+    :returns: either 'compute', 'storage' or None
+    """
+    tags = COMPILED_SCENARIO.tags
+    roles = None
+
+    for service in host['services']:
+        servicetags = tags.get(services[service]['name'], frozenset())
+        roles = servicetags if roles is None else roles & servicetags
 
+    if roles and len(roles) == 1 and roles & {'compute', 'storage'}:
+        return next(iter(roles))
+    return None
 
-class NodeByNode(object):
+
+def getbatchsize(value, total):
+    """Get a number of hosts to be upgraded at once.
+
+    :param value: either a number of hosts or a percentage of hosts
+                  (e.g. '10%') to be upgraded at once
+    :param total: a total number of hosts the percentage is taken from
+    :returns: a positive number of hosts
+    :raises InvalidUpgradeParameter: if a value cannot be interpreted
+    """
+    try:
+        if isinstance(value, six.string_types) and value.endswith('%'):
+            percentage = float(value[:-1])
+            if not 0 < percentage <= 100:
+                raise ValueError(value)
+            return max(1, int(math.ceil(total * percentage / 100)))
+
+        if isinstance(value, bool) or int(value) != value or value < 1:
+            raise ValueError(value)
+        return int(value)
+
+    except (TypeError, ValueError):
+        raise exceptions.InvalidUpgradeParameter(
+            'Batch size must be either a positive integer or a percentage, '
+            'got "%s".' % value)
+
+
+class NodeByNode(UpgradeEngine):
     """Manage a node-by-node rolling upgrade of OpenStack environment.
 
     This includes but not limited to the following steps:
@@ -185,31 +111,71 @@ class NodeByNode(object):
 
         http://docs.openstack.org/ops-guide/ops-upgrades.html
 
+    Controllers are always upgraded one-by-one, while computes and storages
+    may be upgraded in waves of parallel hosts if 'batch_size' is passed in
+    upgrade parameters. The batch size is either a number of hosts or a
+    percentage of hosts of the same role (e.g. '10%') to be upgraded at
+    once.
+
     :param upgrade: an upgrade task to proceed with
     """
 
-    def __init__(self, upgrade, driver):
-        self._upgrade = upgrade
-        self.driver = driver
+    def plan(self):
+        stages = []
+        batch_size = self.driver.parameters.get('batch_size')
+
+        # Batch size is validated even if there are no hosts to upgrade in
+        # waves, so an invalid one is never silently ignored.
+        if batch_size is not None:
+            getbatchsize(batch_size, 1)
+
+        # Planning is done against in-memory snapshot of cluster topology
+        # that's fetched in a fixed number of queries. Going to database
+        # for services of each host makes planning of large clusters slow.
+        hosts, services = dbapi.get_cluster_topology(
+            self._upgrade['cluster_id'])
+        services = {service['id']: service for service in services}
+
+        def _getrole(host):
+            if batch_size is None:
+                return None
+            return gethostrole(host, services)
+
+        def _gethoststeps(host):
+            return [
+                (service, [host]) for service in iterservices(host, services)
+            ]
 
-    def start(self):
-        subtasks = [self.driver.pre_upgrade()]
-        hosts = dbapi.get_hosts_by_cluster(self._upgrade['cluster_id'])
+        # Batch size in percents is relative to a number of hosts of the
+        # same role, so we need to know how many of them we have.
+        roles = collections.Counter(_getrole(host) for host in hosts)
 
         # We may have plenty controllers each with various set of services.
         # In order to orchestrate upgrades properly, we need to iterate
         # by them in right order. For example, first goes controllers with
         # keystone, then with nova, and so on. See iteration details in
-        # get_controllers() docstring.
-        for host in iterhosts(hosts):
-            for service in iterservices(host):
-                subtasks.append(self.driver.start(service, [host]))
-
-        # Execute gathered tasks one-by-one preserving order. Please note,
-        # that it doesn't mean there can't be parallel execution since driver
-        # may return a Celery group of tasks instead, and in that case the
-        # group will be executed instead. The idea is to run one-by-one what
-        # was returned by driver regardless whether it's a task, a group or
-        # a chain.
-        supertask = celery.chain(*subtasks)
-        supertask.apply_async()
+        # iterhosts() docstring.
+        for role, rolehosts in itertools.groupby(
+                iterhosts(hosts, services), key=_getrole):
+            # Controllers and hosts of mixed roles are upgraded one-by-one
+            # since they may share the same services, and it's not safe to
+            # take them down at once.
+            if role is None:
+                stages.append([[
+                    step for host in rolehosts for step in _gethoststeps(host)
+                ]])
+                continue
+
+            # Computes and storages are upgraded in waves. Each wave is a
+            # stage of hosts being upgraded in parallel, while services of
+            # each host are still upgraded one-by-one.
+            rolehosts = list(rolehosts)
+            size = getbatchsize(batch_size, roles[role])
+
+            for index in range(0, len(rolehosts), size):
+                stages.append([
+                    _gethoststeps(host)
+                    for host in rolehosts[index:index + size]
+                ])
+
+        return stages
@@ -0,0 +1,293 @@
+import collections
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+from kostyor.common import exceptions
+
+
+Project = collections.namedtuple('Project', ['name', 'services'])
+Service = collections.namedtuple('Service', ['name', 'tags'])
+
+
+# Roles of hosts services may run on, in order of upgrade.
+TAGS = ('controller', 'compute', 'storage')
+
+
+# OpenStack Rolling Upgrade Scenario
+#
+# Overall this is a huge scenario for OpenStack rolling upgrades. The OpenStack
+# services will be upgraded project-by-project in the order specified here.
+SCENARIO = [
+    Project('Keystone', [
+        Service('keystone-wsgi-admin',  ['controller']),
+        Service('keystone-wsgi-public', ['controller']),
+    ]),
+
+    Project('Glance', [
+        Service('glance-api',      ['controller']),
+        Service('glance-registry', ['controller']),
+    ]),
+
+    Project('Nova', [
+        Service('nova-conductor',       ['controller']),
+        Service('nova-scheduler',       ['controller']),
+        Service('nova-cells',           ['controller']),
+        Service('nova-cert',            ['controller']),
+        Service('nova-console',         ['controller']),
+        Service('nova-consoleauth',     ['controller']),
+        Service('nova-network',         ['controller']),
+        Service('nova-novncproxy',      ['controller']),
+        Service('nova-serialproxy',     ['controller']),
+        Service('nova-spicehtml5proxy', ['controller']),
+        Service('nova-xvpvncproxy',     ['controller']),
+        Service('nova-api',             ['controller']),
+        Service('nova-api-metadata',    ['controller']),
+        Service('nova-api-os-compute',  ['controller']),
+        Service('nova-compute',         ['compute']),
+    ]),
+
+    Project('Neutron', [
+        Service('neutron-server',            ['controller']),
+        Service('neutron-openvswitch-agent', ['controller', 'compute']),
+        Service('neutron-linuxbridge-agent', ['controller', 'compute']),
+        Service('neutron-sriov-nic-agent',   ['controller', 'compute']),
+        Service('neutron-l3-agent',          ['controller']),
+        Service('neutron-dhcp-agent',        ['controller']),
+        Service('neutron-metering-agent',    ['controller']),
+        Service('neutron-metadata-agent',    ['controller']),
+        Service('neutron-ns-metadata-proxy', ['controller']),
+    ]),
+
+    Project('Cinder', [
+        Service('cinder-api',       ['controller']),
+        Service('cinder-scheduler', ['controller']),
+        Service('cinder-volume',    ['storage']),
+    ]),
+
+    Project('Horizon', [
+        Service('horizon-wsgi',        ['controller']),
+    ]),
+
+    Project('Heat', [
+        Service('heat-api',            ['controller']),
+        Service('heat-engine',         ['controller']),
+        Service('heat-api-cfn',        ['controller']),
+        Service('heat-api-cloudwatch', ['controller']),
+    ]),
+
+    Project('Ceilometer', [
+        Service('ceilometer-collector',             ['controller']),
+        Service('ceilometer-agent-notification',    ['controller']),
+        Service('ceilometer-polling',               ['controller']),
+
+        # DEPRECATED in favor of Aodh, Gnochi and/or Panko.
+        Service('ceilometer-api',                   ['controller']),
+    ]),
+
+    Project('Aodh', [
+        Service('aodh-evaluator',   ['controller']),
+        Service('aodh-notifier',    ['controller']),
+        Service('aodh-listener',    ['controller']),
+        Service('aodh-api',         ['controller']),
+    ]),
+
+    Project('Gnocchi', [
+        Service('gnocchi-statsd',   ['controller']),
+        Service('gnocchi-metricd',  ['controller']),
+        Service('gnocchi-api',      ['controller']),
+    ]),
+
+    Project('Swift', [
+        Service('swift-proxy-server',           ['controller']),
+        Service('swift-account-auditor',        ['storage']),
+        Service('swift-account-reaper',         ['storage']),
+        Service('swift-account-replicator',     ['storage']),
+        Service('swift-account-server',         ['storage']),
+        Service('swift-container-auditor',      ['storage']),
+        Service('swift-container-reconciler',   ['storage']),
+        Service('swift-container-replicator',   ['storage']),
+        Service('swift-container-server',       ['storage']),
+        Service('swift-container-sync',         ['storage']),
+        Service('swift-container-updater',      ['storage']),
+        Service('swift-object-auditor',         ['storage']),
+        Service('swift-object-expirer',         ['storage']),
+        Service('swift-object-reconstructor',   ['storage']),
+        Service('swift-object-replicator',      ['storage']),
+        Service('swift-object-server',          ['storage']),
+        Service('swift-object-updater',         ['storage']),
+    ]),
+
+    # Does not support rolling upgrades in Newton; to be implemented in Ocata.
+    Project('Ironic', [
+        Service('ironic-inspector', ['controller']),
+        Service('ironic-conductor', ['controller']),
+        Service('ironic-api',       ['controller']),
+    ]),
+]
+
+
+# Projects that have to be upgraded before a given one. Projects that
+# don't depend on each other (e.g. Heat and Aodh) may be upgraded at the
+# same time, which cuts overall upgrade time.
+REQUIREMENTS = {
+    'Keystone': [],
+    'Glance': ['Keystone'],
+    'Nova': ['Keystone', 'Glance'],
+    'Neutron': ['Keystone', 'Nova'],
+    'Cinder': ['Keystone', 'Nova'],
+    'Horizon': ['Keystone', 'Glance', 'Nova', 'Neutron', 'Cinder'],
+    'Heat': ['Keystone', 'Glance', 'Nova', 'Neutron', 'Cinder'],
+    'Ceilometer': ['Keystone', 'Nova'],
+    'Aodh': ['Keystone'],
+    'Gnocchi': ['Keystone'],
+    'Swift': ['Keystone'],
+    'Ironic': ['Keystone', 'Glance', 'Nova', 'Neutron'],
+}
+
+
+class FrozenDict(Mapping):
+    """A read-only mapping, so compiled scenario can't be changed."""
+
+    def __init__(self, *args, **kwargs):
+        self._data = dict(*args, **kwargs)
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return 'FrozenDict(%r)' % self._data
+
+
+CompiledScenario = collections.namedtuple('CompiledScenario', [
+    'names', 'ranks', 'priorities', 'tags', 'projects', 'members',
+    'requirements',
+])
+
+
+def _checkcycles(requirements):
+    visited, path = set(), []
+
+    def _visit(project):
+        if project in path:
+            raise exceptions.CyclicDependency(
+                'Projects depend on each other: %s' % ' -> '.join(
+                    path[path.index(project):] + [project]))
+        if project in visited:
+            return
+
+        path.append(project)
+        for requirement in sorted(requirements[project]):
+            _visit(requirement)
+        path.pop()
+        visited.add(project)
+
+    for project in sorted(requirements):
+        _visit(project)
+
+
+def compile_scenario(scenario, requirements):
+    """Compile a scenario into immutable tables for constant time lookups.
+
+    The scenario is validated, so mistakes are found once it's compiled
+    rather than once some upgrade is planned. A service listed more than
+    once is kept once, unless its entries conflict with each other.
+
+    The compiled scenario consists of a tuple of service names in scenario
+    order, and the following mappings keyed by service name:
+
+      - ranks: a position of the service in the scenario
+      - priorities: same as ranks, but services of controllers go first,
+        then services of computes and only then - ones of storages
+      - tags: a set of service tags
+      - projects: a name of the project the service belongs to
+
+    as well as ones keyed by project name:
+
+      - members: a tuple of service names of the project in scenario order
+      - requirements: a set of projects to be upgraded before the project
+
+    :param scenario: a list of :class:`Project`
+    :param requirements: a mapping of project names to lists of projects
+                         they require; missing projects require nothing
+    :returns: a :class:`CompiledScenario` instance
+    :raises InvalidScenario: if the scenario is inconsistent
+    :raises CyclicDependency: if projects require each other
+    """
+    names, tags, projects = [], {}, {}
+    members = collections.OrderedDict()
+
+    for project in scenario:
+        if project.name in members:
+            raise exceptions.InvalidScenario(
+                'Project "%s" is listed more than once.' % project.name)
+        members[project.name] = []
+
+        for service in project.services:
+            servicetags = frozenset(service.tags)
+
+            unknown = servicetags - set(TAGS)
+            if unknown or not servicetags:
+                raise exceptions.InvalidScenario(
+                    'Service "%s" has invalid tags: %s' % (
+                        service.name, ', '.join(sorted(unknown)) or 'none'))
+
+            if service.name in tags:
+                if (tags[service.name], projects[service.name]) != \
+                        (servicetags, project.name):
+                    raise exceptions.InvalidScenario(
+                        'Service "%s" is listed more than once with '
+                        'different tags or projects.' % service.name)
+                continue
+
+            names.append(service.name)
+            tags[service.name] = servicetags
+            projects[service.name] = project.name
+            members[project.name].append(service.name)
+
+    unknown = set(requirements) - set(members)
+    for project, required in requirements.items():
+        unknown.update(set(required) - set(members))
+    if unknown:
+        raise exceptions.InvalidScenario(
+            'Unknown projects are required: %s' % ', '.join(sorted(unknown)))
+
+    adjacency = {
+        project: frozenset(requirements.get(project, []))
+        for project in members
+    }
+    _checkcycles(adjacency)
+
+    def _sortkey(name):
+        return min(TAGS.index(tag) for tag in tags[name])
+
+    # Generate priorities where first goes services of controllers, then -
+    # services of computes, and only then - ones from storages. This is an
+    # essential part for getting proper an upgrade order of hosts as it's
+    # used to determine most important ones.
+    return CompiledScenario(
+        names=tuple(names),
+        ranks=FrozenDict((name, rank) for rank, name in enumerate(names)),
+        priorities=FrozenDict(
+            (name, priority)
+            for priority, name in enumerate(sorted(names, key=_sortkey))),
+        tags=FrozenDict(tags),
+        projects=FrozenDict(projects),
+        members=FrozenDict(
+            (project, tuple(services))
+            for project, services in members.items()),
+        requirements=FrozenDict(adjacency),
+    )
+
+
+# The scenario is compiled once at import, so engines never walk or sort
+# raw SCENARIO at plan time.
+COMPILED_SCENARIO = compile_scenario(SCENARIO, REQUIREMENTS)
@@ -0,0 +1,85 @@
+import celery
+
+from kostyor.rpc import tasks
+
+
+# Canvas primitives are tasks too, so they are told apart by task names
+# rather than by classes, which differ between Celery versions.
+def _isnoop(signature):
+    return signature['task'] == tasks.noop.name
+
+
+def _ischain(signature):
+    return signature['task'] == 'celery.chain'
+
+
+def _isgroup(signature):
+    return signature['task'] == 'celery.group'
+
+
+def _ischord(signature):
+    return signature['task'] == 'celery.chord'
+
+
+def _count(signature):
+    # A number of messages sent to broker in order to execute a signature,
+    # each one followed by a write to result backend.
+    if _ischain(signature) or _isgroup(signature):
+        return sum(_count(task) for task in signature.tasks)
+    if _ischord(signature):
+        return sum(_count(task) for task in signature.tasks) + \
+            _count(signature.body)
+    return 1
+
+
+def _optimize(signature):
+    if _isnoop(signature):
+        return None
+
+    if _ischain(signature) or _isgroup(signature):
+        flatten = _ischain if _ischain(signature) else _isgroup
+
+        subtasks = []
+        for task in signature.tasks:
+            task = _optimize(task)
+            if task is None:
+                continue
+
+            # A chain within a chain is executed just like its tasks were
+            # part of the outer chain, and so is a group within a group.
+            if flatten(task):
+                subtasks.extend(task.tasks)
+            else:
+                subtasks.append(task)
+
+        if not subtasks:
+            return None
+        if len(subtasks) == 1:
+            return subtasks[0]
+        primitive = celery.chain if _ischain(signature) else celery.group
+        return primitive(*subtasks, **signature.options)
+
+    # Chords are left as is, since their bodies are executed once all
+    # tasks of the header complete, even if there are none.
+    return signature
+
+
+def optimize(signature):
+    """Optimize a signature of upgrade step before it's sent to execution.
+
+    Each task is a message to broker and a write to result backend, so
+    noop tasks (e.g. ones the default :meth:`pre_upgrade` of drivers
+    returns) are dropped. Chains within chains and groups within groups
+    are flattened, and chains and groups of a single task are replaced by
+    the task.
+
+    :param signature: a signature to optimize
+    :returns: a tuple of optimized signature, or None if there's nothing
+              to be executed, and a number of broker round trips saved
+    """
+    optimized = _optimize(signature)
+
+    saved = _count(signature)
+    if optimized is not None:
+        saved -= _count(optimized)
+    return optimized, saved
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""Measure how fast discovered deployments are stored to the database.
+
+Synthetic inventories of the given sizes are stored one by one, each host
+running a few services, and the throughput is reported in rows per second.
+A fresh in-memory SQLite database is used unless --connection is passed.
+An inventory file (e.g. CMDB export) may be stored instead of synthetic
+ones, see :class:`kostyor.inventory.static.StaticInventoryDiscovery`.
+
+    $ python tools/benchmark_discover_cluster.py 1000 5000 10000
+    $ python tools/benchmark_discover_cluster.py --inventory hosts.jsonl
+"""
+
+from __future__ import print_function
+
+import argparse
+import time
+
+from kostyor.common import constants
+from kostyor.db import api
+from kostyor.db import models
+from kostyor.inventory import static
+
+
+SERVICES = [
+    'nova-compute',
+    'neutron-openvswitch-agent',
+    'ceilometer-agent-compute',
+]
+
+
+class SyntheticInventory(object):
+
+    def __init__(self, hosts_number):
+        self.hosts_number = hosts_number
+
+    def discover(self):
+        return {
+            'version': constants.NEWTON,
+            'hosts': {
+                'compute-%d' % i: [{'name': name} for name in SERVICES]
+                for i in range(self.hosts_number)
+            },
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('sizes', metavar='HOSTS', type=int, nargs='*',
+                        default=[1000, 5000, 10000],
+                        help='numbers of hosts in inventories to store')
+    parser.add_argument('--connection', default='sqlite://',
+                        help='database to store inventories to')
+    parser.add_argument('--inventory',
+                        help='an inventory file to be stored instead')
+    args = parser.parse_args()
+
+    api.configure_session(args.connection)
+    models.Base.metadata.create_all(api.db_session.get_bind())
+
+    if args.inventory:
+        inventories = [static.StaticInventoryDiscovery(args.inventory)]
+    else:
+        inventories = [SyntheticInventory(size) for size in args.sizes]
+
+    print('%8s %8s %10s %12s' % ('hosts', 'rows', 'seconds', 'rows/sec'))
+    for i, inventory in enumerate(inventories):
+        info = inventory.discover()
+
+        # A cluster, its hosts, services shared by hosts and links between.
+        links = sum(len(services) for services in info['hosts'].values())
+        services = set(service['name']
+                       for services in info['hosts'].values()
+                       for service in services)
+        rows = 1 + len(info['hosts']) + len(services) + links
+
+        started = time.time()
+        api.discover_cluster('benchmark-%d' % i, info)
+        elapsed = time.time() - started
+
+        print('%8d %8d %10.3f %12.0f' % (
+            len(info['hosts']), rows, elapsed, rows / elapsed))
+
+
+if __name__ == '__main__':
+    main()
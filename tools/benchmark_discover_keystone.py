@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+"""Measure how fast endpoints of service catalog are mapped to hosts.
+
+A synthetic catalog is served by a stub Keystone client, so only mapping
+endpoints to services is measured, with no HTTP round trips involved.
+
+    $ python tools/benchmark_discover_keystone.py --endpoints 10000
+"""
+
+from __future__ import print_function
+
+import argparse
+import collections
+import time
+
+from kostyor.inventory import discover
+
+
+Endpoint = collections.namedtuple(
+    'Endpoint', ['service_id', 'region', 'internalurl', 'publicurl'])
+
+Service = collections.namedtuple('Service', ['id', 'name'])
+
+
+class StubClient(object):
+
+    def __init__(self, endpoints, services):
+        self.endpoints = collections.namedtuple('Manager', ['list'])(
+            lambda: endpoints)
+        self.services = collections.namedtuple('Manager', ['list'])(
+            lambda: services)
+
+
+def make_catalog(endpoints_number, services_number, regions_number):
+    services = [Service('service-%d' % i, 'service%d' % i)
+                for i in range(services_number)]
+    endpoints = [
+        Endpoint(services[i % services_number].id,
+                 'Region%d' % (i % regions_number),
+                 'http://[fd00::%x]:8080/v2' % i,
+                 'https://api-%d.example.com/v2' % i)
+        for i in range(endpoints_number)
+    ]
+    return endpoints, services
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--endpoints', type=int, default=10000,
+                        help='a number of endpoints in the catalog')
+    parser.add_argument('--services', type=int, default=1000,
+                        help='a number of services in the catalog')
+    parser.add_argument('--regions', type=int, default=10,
+                        help='a number of regions endpoints are spread over')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='a number of times to repeat the measurement')
+    args = parser.parse_args()
+
+    client = StubClient(
+        *make_catalog(args.endpoints, args.services, args.regions))
+    discover.k_client.Client = lambda session: client
+    driver = discover.OpenStackServiceDiscovery()
+
+    timings = []
+    for _ in range(args.repeat):
+        started = time.time()
+        driver.discover_keystone()
+        timings.append(time.time() - started)
+
+    best = min(timings)
+    print('%d endpoints, %d services: best of %d is %.3f sec '
+          '(%.0f endpoints/sec)' % (args.endpoints, args.services,
+                                    args.repeat, best, args.endpoints / best))
+
+
+if __name__ == '__main__':
+    main()